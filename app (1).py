@@ -1,58 +1,2329 @@
 import json
 import os
 import datetime
-from flask import Flask, request, redirect, url_for, render_template_string, session
+import threading
+import atexit
+import hashlib
+import io
+import collections
+import contextlib
+import copy
+import bisect
+import gzip
+import heapq
+import argparse
+import asyncio
+import concurrent.futures
+import csv
+import functools
+import itertools
+import math
+import mmap
+import multiprocessing
+import random
+import re
+import sys
+import secrets
+import time
+import sqlite3
+import struct
+from flask import Flask, request, redirect, url_for, render_template, session, g, stream_with_context
+from werkzeug.utils import secure_filename
+from jinja2 import DictLoader
+
+try:
+    import brotli  # İsteğe bağlı; yoksa stil dosyası yalnızca gzip ile sıkıştırılır
+except ImportError:
+    brotli = None
+
+try:
+    import numpy  # İsteğe bağlı; yoksa gün sonu hesapları düz Python ile yapılır
+except ImportError:
+    numpy = None
+
+try:
+    import uvicorn  # İsteğe bağlı; yalnızca serve --asgi için gerekir
+except ImportError:
+    uvicorn = None
+
+# Parola havuzunun süreçleri (forkserver/spawn) çalıştırılan betiği '__mp_main__'
+# adıyla yeniden yükler. multiprocessing.parent_process() bu yükleme sırasında henüz
+# None döndürdüğü için süreçler bu adla ayırt edilir; depo, veriler ve yazıcı
+# yalnızca ana süreçte açılır.
+PASSWORD_POOL_PROCESS = __name__ == '__mp_main__'
 
 app = Flask(__name__)
 app.secret_key = 'super_secret_key' # Daha güçlü bir anahtarla değiştirin
+# Sayfa şablonları adlarıyla bu sözlüğe eklenir ve açılışta bir kez derlenir
+TEMPLATES = {}
+app.jinja_loader = DictLoader(TEMPLATES)
 
-# Global dictionary to store user data
-users = {}
+# Kalıcı depolama: 'json' (kullanıcı başına dosya + günlük) veya 'sqlite'
+STORAGE_BACKEND = os.environ.get('ATM_STORAGE_BACKEND', 'json')
+# Birden çok işçi süreci (wsgi.py) aynı sqlite deposunu paylaşırken açılır: her değişiklik
+# hemen veritabanına yazılır ve para işlemleri veritabanının yazma kilidi altında yapılır
+SHARED_STORAGE = os.environ.get('ATM_SHARED_STORAGE') == '1'
+# Eski tek dosyalı kayıt; varsa ilk açılışta seçilen depoya taşınır
 USERS_FILE = 'users.json'
+# Her kullanıcı bu klasörde kendi dosyasında tutulur
+USER_SHARD_DIR = 'user_shards'
+# Her değişiklik bu dosyaya tek satırlık bir kayıt olarak eklenir (append-only günlük)
+JOURNAL_FILE = 'users.journal'
+# json deposunun ikili anlık görüntüsü: açılışta belleğe eşlenir, kullanıcılar ilk erişimde
+# çözülür; user_shards/ altındaki dosyalar bunun üzerine yazılmış daha yeni kopyalardır
+SNAPSHOT_FILE = 'users.snap'
+# json deposunda tüm kullanıcıların defter kayıtları arama için bu SQLite dosyasına da yazılır
+LEDGER_SEARCH_FILE = 'ledger_search.db'
+# json deposunda kilitli kullanıcılar (kullanıcı adı -> lockout_until); açılışta her
+# kullanıcı dosyasını okumamak için write_user ile güncel tutulur
+LOCKOUTS_FILE = 'user_lockouts.json'
+# Yönetici işlem aramasında bir sayfadaki en fazla kayıt
+LEDGER_SEARCH_PAGE_MAX = 1000
+SQLITE_FILE = 'users.db'
+# Hafızada tutulan kullanıcıların yaklaşık üst sınırı (JSON boyutu üzerinden, bayt)
+USER_CACHE_MAX_BYTES = int(os.environ.get('ATM_USER_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Günlük bu kadar kayda ulaşınca değişen kullanıcılar dosyalarına yazılır (checkpoint)
+JOURNAL_CHECKPOINT_RECORDS = int(os.environ.get('ATM_JOURNAL_CHECKPOINT_RECORDS', 1000))
+journal_record_count = 0
+journal_seq = 0  # Son günlük kaydının sıra numarası
+synced_seq = 0  # fsync ile diske indiği bilinen son kayıt
+sync_pending_seq = 0  # Diske inmesi bir ASGI yanıtınca beklenen son kayıt
+# ASGI köprüsünün iş parçacıklarında işaretlenir: sync=True commit'ler yazmayı beklemez,
+# yanıt kayıt diske inene kadar köprüde bekletilir
+deferred_sync = threading.local()
 
-def load_user_data():
-    """Loads user data from users.json file."""
-    global users
-    if os.path.exists(USERS_FILE) and os.path.getsize(USERS_FILE) > 0:
+# Günlük kayıtları arka plandaki yazıcı tarafından gruplar halinde diske yazılır
+FLUSH_INTERVAL_SECONDS = float(os.environ.get('ATM_FLUSH_INTERVAL_SECONDS', 0.5))
+FLUSH_BATCH_SIZE = int(os.environ.get('ATM_FLUSH_BATCH_SIZE', 100))
+pending_records = []  # (kayıt, JSON satırı) çiftleri
+# Commit'ler, yazıcı ve hafızadan çıkarma işlemleri bu kilidi sırayla alır
+persistence_lock = threading.Lock()
+flush_condition = threading.Condition(persistence_lock)
+flush_stats = {
+    "commits": 0,
+    "sync_commits": 0,
+    "flushes": 0,
+    "records_written": 0,
+    "coalesced_writes": 0,
+    "checkpoints": 0
+}
+flusher_thread = None
+
+# Geçmiş sayfalarında varsayılan ve en fazla kayıt sayısı
+HISTORY_PAGE_SIZE = 10
+HISTORY_PAGE_MAX = 100
+# Hesap özeti dökümü defterden bu büyüklükte sayfalarla okunup parça parça gönderilir
+STATEMENT_CHUNK_SIZE = int(os.environ.get('ATM_STATEMENT_CHUNK_SIZE', 500))
+# Defter dizini bu kadar kullanıcı için hafızada tutulur
+LEDGER_INDEX_USERS = int(os.environ.get('ATM_LEDGER_INDEX_USERS', 1024))
+ledger_indexes = collections.OrderedDict()
+ledger_index_lock = threading.Lock()
+
+# Ortak stil dosyası (static/ altında); içeriğinin özetini taşıyan adresten sunulur
+STYLESHEET_FILE = 'style.css'
+STATIC_MAX_AGE_SECONDS = 365 * 24 * 60 * 60
+static_assets = {}  # Sunulan ad (özetli) -> StaticAsset
+stylesheet_asset = None
+
+# JSON API (/api/v1) oturum anahtarları hafızada (ortak modda veritabanında) tutulur
+# ve bu süre sonunda geçersizleşir
+API_TOKEN_TTL_SECONDS = int(os.environ.get('ATM_API_TOKEN_TTL_SECONDS', 15 * 60))
+api_tokens = collections.OrderedDict()  # anahtar -> (kullanıcı adı, bitiş zamanı), veriliş sırasıyla
+api_tokens_lock = threading.Lock()
+
+# Toplu havalede tek istekte kabul edilen en fazla kalem sayısı
+BATCH_TRANSFER_MAX_ITEMS = int(os.environ.get('ATM_BATCH_TRANSFER_MAX_ITEMS', 10000))
+
+# Toplu aktarımda (import komutu) tek günlük kaydına yazılan satır sayısı
+IMPORT_BATCH_SIZE = int(os.environ.get('ATM_IMPORT_BATCH_SIZE', 1000))
+
+# Gün sonu işlemi (end-of-day komutu): Birikim hesaplarına yıllık faiz günlük
+# olarak işlenir, Vadesiz hesaplardan günlük hesap işletim ücreti alınır
+BIRIKIM_YILLIK_FAIZ = float(os.environ.get('ATM_SAVINGS_INTEREST_RATE', 0.40))
+HESAP_ISLETIM_UCRETI = float(os.environ.get('ATM_DAILY_ACCOUNT_FEE', 0.0))
+END_OF_DAY_CHUNK_SIZE = int(os.environ.get('ATM_END_OF_DAY_CHUNK_SIZE', 10000))
+
+# Parolalar PBKDF2-HMAC-SHA256 ile özetlenir; hesaplama ayrı süreçlerde yapılır ve
+# kuyrukta en fazla PASSWORD_QUEUE_DEPTH iş bekleyebilir
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('ATM_PASSWORD_HASH_ITERATIONS', 200000))
+PASSWORD_POOL_WORKERS = int(os.environ.get('ATM_PASSWORD_POOL_WORKERS', os.cpu_count() or 1))
+PASSWORD_QUEUE_DEPTH = int(os.environ.get('ATM_PASSWORD_QUEUE_DEPTH', PASSWORD_POOL_WORKERS * 4))
+PASSWORD_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('ATM_PASSWORD_QUEUE_TIMEOUT_SECONDS', 2.0))
+PASSWORD_HASH_PREFIX = 'pbkdf2_sha256'
+password_pool = None
+password_pool_lock = threading.Lock()
+password_slots = threading.BoundedSemaphore(PASSWORD_QUEUE_DEPTH)
+
+# Giriş ve parola değiştirme denemeleri IP adresi ve kullanıcı adı başına jeton
+# kovalarıyla sınırlanır: BURST deneme art arda yapılabilir, sonra dakikada
+# PER_MINUTE deneme hakkı geri gelir
+LOGIN_RATE_IP_BURST = int(os.environ.get('ATM_LOGIN_RATE_IP_BURST', 20))
+LOGIN_RATE_IP_PER_MINUTE = float(os.environ.get('ATM_LOGIN_RATE_IP_PER_MINUTE', 10))
+LOGIN_RATE_USER_BURST = int(os.environ.get('ATM_LOGIN_RATE_USER_BURST', 5))
+LOGIN_RATE_USER_PER_MINUTE = float(os.environ.get('ATM_LOGIN_RATE_USER_PER_MINUTE', 2))
+# Her sınırlayıcı en fazla bu kadar kovayı hafızada tutar
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('ATM_RATE_LIMIT_MAX_KEYS', 100000))
+
+# Süresi dolan hesap kilitleri arka planda bu aralıkla dizinden silinir
+LOCKOUT_SWEEP_INTERVAL_SECONDS = float(os.environ.get('ATM_LOCKOUT_SWEEP_INTERVAL_SECONDS', 60))
+lockout_sweeper_thread = None
+
+# Yönetici uçları (/api/v1/admin) bu anahtarla açılır; tanımlı değilse kapalıdır
+ADMIN_TOKEN = os.environ.get('ATM_ADMIN_TOKEN')
+
+# Para çekme ve havale limitleri: her kural bir işlem türünü (ve isteğe bağlı bir
+# kanalı: "web" ya da "api") kayan bir zaman penceresinde tutar ve/veya işlem
+# sayısıyla sınırlar. max_amount bir kullanıcı alanının adı da olabilir.
+# ATM_LIMIT_RULES aynı biçimde bir JSON listesiyle varsayılanların yerine geçer.
+DEFAULT_LIMIT_RULES = [
+    {"label": "Günlük çekim", "operation": "withdraw", "window": 24 * 60 * 60, "bucket": 15 * 60, "max_amount": "daily_withdrawal_limit"},
+    {"label": "Günlük hesaplar arası havale", "operation": "internal_transfer", "window": 24 * 60 * 60, "bucket": 15 * 60, "max_amount": 1000000},
+    {"label": "Günlük havale", "operation": "external_transfer", "window": 24 * 60 * 60, "bucket": 15 * 60, "max_amount": 250000},
+    {"label": "Saatlik havale", "operation": "external_transfer", "window": 60 * 60, "bucket": 60, "max_count": 30, "channel": "web"}
+]
+LIMIT_RULES = json.loads(os.environ['ATM_LIMIT_RULES']) if 'ATM_LIMIT_RULES' in os.environ else DEFAULT_LIMIT_RULES
+# Limit sayaçları bu kadar kullanıcı için hafızada tutulur; çıkarılanlar defterden yeniden kurulur
+LIMIT_COUNTER_USERS = int(os.environ.get('ATM_LIMIT_COUNTER_USERS', 10000))
+
+# Hesap kilitleri bu kadar şeride dağıtılır
+LOCK_STRIPES = int(os.environ.get('ATM_LOCK_STRIPES', 256))
+HAVALE_UCRETI = 6.39
+
+# Örneklemeli profil çıkarma (varsayılan kapalı): isteklerin PROFILE_SAMPLE_RATE
+# oranındakilerin yığınları PROFILE_INTERVAL_MS aralıkla örneklenir ve her route
+# için PROFILE_DIR altına flame graph araçlarının okuduğu "collapsed" biçimde
+# yazılır. PROFILE_SLOW_MS verilirse bütün istekler örneklenir ve bu süreyi aşan
+# her isteğin yığınları ayrı bir dosyaya yazılır.
+PROFILE_SAMPLE_RATE = float(os.environ.get('ATM_PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_MS = float(os.environ.get('ATM_PROFILE_SLOW_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('ATM_PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('ATM_PROFILE_DIR', 'profiles')
+PROFILE_WRITE_INTERVAL_SECONDS = float(os.environ.get('ATM_PROFILE_WRITE_INTERVAL_SECONDS', 10))
+
+# /metrics süre histogramlarının üst sınırları (saniye)
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+    """Counters and histograms exported on /metrics in the Prometheus text format.
+
+    Every thread updates its own shard, so inc() and observe() take no lock;
+    a scrape adds the shards up and may miss an update that is in progress.
+    Shards of finished threads are folded into one, since the development
+    server starts a thread per request. Gauges are read at scrape time.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.local = threading.local()
+        self.shards = []  # (iş parçacığı, parça)
+        self.retired = {}
+        self.shards_lock = threading.Lock()
+        self.descriptions = {}  # ad -> (tür, açıklama)
+        self.collectors = []  # (ad, (etiketler, değer) listesi döndüren fonksiyon)
+
+    def describe(self, name, kind, text):
+        self.descriptions[name] = (kind, text)
+
+    def collect(self, name, kind, text, read):
+        """Registers a metric whose samples read() returns at scrape time."""
+        self.describe(name, kind, text)
+        self.collectors.append((name, read))
+
+    def shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = {}
+            with self.shards_lock:
+                if len(self.shards) > 2 * threading.active_count():
+                    self.retire_finished()
+                self.shards.append((threading.current_thread(), shard))
+        return shard
+
+    def retire_finished(self):
+        """Folds shards of finished threads into self.retired; shards_lock must be held."""
+        alive = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self.merge(self.retired, shard)
+        self.shards = alive
+
+    @staticmethod
+    def merge(total, shard):
+        for key, value in list(shard.items()):
+            if isinstance(value, list):
+                current = total.setdefault(key, [0] * len(value))
+                for index, item in enumerate(value):
+                    current[index] += item
+            else:
+                total[key] = total.get(key, 0) + value
+
+    def inc(self, name, labels=(), amount=1):
+        shard = self.shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        # Histogram: kova başına sayılar, +Inf kovası ve toplam süre
+        shard = self.shard()
+        key = (name, labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            histogram = shard[key] = [0] * (len(self.buckets) + 2)
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    @staticmethod
+    def label_value(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def label_text(self, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{self.label_value(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        with self.shards_lock:
+            self.retire_finished()
+            total = {}
+            self.merge(total, self.retired)
+            for thread, shard in self.shards:
+                self.merge(total, shard)
+        samples = collections.defaultdict(list)
+        for (name, labels), value in total.items():
+            samples[name].append((labels, value))
+        for name, read in self.collectors:
+            samples[name].extend(read())
+        lines = []
+        for name in sorted(samples):
+            kind, text = self.descriptions.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(samples[name], key=lambda sample: sample[0]):
+                if kind != 'histogram':
+                    lines.append(f"{name}{self.label_text(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self.label_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{self.label_text(labels)} {value[-1]}")
+                lines.append(f"{name}_count{self.label_text(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics(METRICS_LATENCY_BUCKETS)
+metrics.describe('atm_http_requests_total', 'counter', 'HTTP requests by route, method and status.')
+metrics.describe('atm_http_request_duration_seconds', 'histogram', 'HTTP request duration by route.')
+metrics.describe('atm_lock_wait_seconds', 'histogram', 'Time spent waiting for account locks, the persistence lock and (shared mode) the database write lock.')
+metrics.describe('atm_journal_flush_seconds', 'histogram', 'Duration of journal flushes.')
+metrics.describe('atm_journal_bytes_written_total', 'counter', 'Bytes of journal records handed to storage.')
+metrics.describe('atm_journal_write_errors_total', 'counter', 'Journal flushes that storage failed to write (the records stay pending).')
+metrics.describe('atm_save_user_data_seconds', 'histogram', 'Duration of save_user_data (checkpoint write-back).')
+metrics.describe('atm_user_bytes_written_total', 'counter', 'Bytes of user records written back to storage.')
+metrics.describe('atm_ledger_entries_committed_total', 'counter', 'Ledger entries committed since start.')
+
+class SamplingProfiler:
+    """Samples the stacks of profiled requests from a background thread.
+
+    begin() registers the request's thread; every interval the sampler reads
+    sys._current_frames() and counts the collapsed stack of each registered
+    thread, so an unprofiled request costs one random() call. Stacks of the
+    sampled fraction are added to their route's totals, which are rewritten
+    as <endpoint>.collapsed every write_interval; a request slower than
+    slow_seconds gets its own slow-<endpoint>-<time>.collapsed file.
+    """
+
+    def __init__(self, sample_rate, slow_seconds, interval, directory, write_interval):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self.directory = directory
+        self.write_interval = write_interval
+        self.active = {}  # iş parçacığı kimliği -> [endpoint, yığın sayaçları, örneklem içinde mi]
+        self.routes = collections.defaultdict(collections.Counter)
+        self.changed_routes = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def begin(self, endpoint):
+        sampled = random.random() < self.sample_rate
+        if not sampled and not self.slow_seconds:
+            return None
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self.thread = threading.Thread(target=self.sample_loop, name="profiler", daemon=True)
+                    self.thread.start()
+        profile = [endpoint, collections.Counter(), sampled]
+        self.active[threading.get_ident()] = profile
+        return profile
+
+    def end(self, profile, elapsed):
+        self.active.pop(threading.get_ident(), None)
+        endpoint, stacks, sampled = profile
+        if sampled:
+            with self.lock:
+                self.routes[endpoint].update(stacks)
+                self.changed_routes.add(endpoint)
+        if self.slow_seconds and elapsed >= self.slow_seconds and stacks:
+            name = f"slow-{endpoint}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{int(elapsed * 1000)}ms.collapsed"
+            self.write(name, stacks)
+
+    @staticmethod
+    def collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def sample_loop(self):
+        next_write = time.monotonic() + self.write_interval
+        while True:
+            time.sleep(self.interval)
+            if self.active:
+                frames = sys._current_frames()
+                for ident, profile in list(self.active.items()):
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile[1][self.collapse(frame)] += 1
+                del frames
+            if time.monotonic() >= next_write:
+                self.write_routes()
+                next_write = time.monotonic() + self.write_interval
+
+    def write_routes(self):
+        with self.lock:
+            changed = {endpoint: collections.Counter(self.routes[endpoint]) for endpoint in self.changed_routes}
+            self.changed_routes.clear()
+        for endpoint, stacks in changed.items():
+            self.write(f"{endpoint}.collapsed", stacks)
+
+    def write(self, name, stacks):
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        os.replace(path + '.tmp', path)
+
+profiler = None
+if PROFILE_SAMPLE_RATE > 0 or PROFILE_SLOW_MS > 0:
+    profiler = SamplingProfiler(PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS / 1000, PROFILE_INTERVAL_MS / 1000, PROFILE_DIR, PROFILE_WRITE_INTERVAL_SECONDS)
+    atexit.register(profiler.write_routes)
+
+class UserStorage:
+    """Interface between the users cache and the place user data is persisted.
+
+    read_user returns [user_data, size, seq, dirty] or None. append_records
+    persists (record, line) pairs from commit_changes; read_records yields the
+    records replay_journal still has to apply, and reset_records drops them
+    after a checkpoint has written every dirty user with write_user.
+    """
+
+    # False ise geçmiş kayıtları hafızadaki kullanıcıda tutulmaz, depodan sorgulanır
+    keeps_history = True
+
+    def read_user(self, username):
+        raise NotImplementedError
+
+    def user_exists(self, username):
+        raise NotImplementedError
+
+    def write_user(self, username, user_data, seq):
+        raise NotImplementedError
+
+    def import_user(self, username, user_data):
+        """Stores a complete user record coming from the old users.json."""
+        self.write_user(username, user_data, 0)
+
+    def import_users(self, users):
+        """Stores the (username, user_data) pairs of an old users.json."""
+        for username, user_data in users:
+            self.import_user(username, user_data)
+
+    def is_empty(self):
+        raise NotImplementedError
+
+    def append_records(self, records, fsync=False):
+        raise NotImplementedError
+
+    def read_records(self):
+        return iter(())
+
+    def reset_records(self, seq):
+        pass
+
+    def iter_usernames(self):
+        """Yields the name of every stored user; a checkpoint must have run first."""
+        raise NotImplementedError
+
+    def iter_lockouts(self):
+        """Yields (username, lockout_until) for stored users with a lockout set."""
+        for username in self.iter_usernames():
+            lockout_until = self.read_user(username)[0]["lockout_until"]
+            if lockout_until:
+                yield username, lockout_until
+
+    def ledger_page(self, username, user_data, account_name=None, limit=HISTORY_PAGE_SIZE, before=None, since=None, until=None, entry_type=None):
+        """Returns (entries, next_cursor) for one page of history, newest first.
+
+        account_name None means every entry of the user. before is the cursor
+        of the previous page, since/until are 'YYYY-MM-DD HH:MM:SS' bounds on
+        the original time of an entry ("vt" for imported entries, otherwise
+        "t") and next_cursor is None on the last page. Cursors here are ledger
+        positions.
+        """
+        return ledger_index(username, user_data["ledger"]).page(account_name, entry_type, limit, before, since, until)
+
+    def search_ledger(self, filters, limit, before=None):
+        """Returns (entries, next_cursor) for one page of entries of every user, newest first.
+
+        filters may hold username, account, type, counterparty, direction
+        ("in" or "out"), min_amount/max_amount (compared with the absolute
+        amount) and since/until bounds. Each entry also carries its username.
+        """
+        raise NotImplementedError
+
+    def prepare_search(self, seq):
+        """Brings the search index up to date; called once the journal is replayed and checkpointed."""
+
+    def close(self):
+        pass
+
+class UserSnapshot:
+    """Read-only binary snapshot of users, memory-mapped when it is opened.
+
+    Layout (little endian, version 1):
+
+        header   magic, version, user count, snapshot seq and the offsets of
+                 the index, names and lockouts sections (HEADER)
+        records  per user: seq, account count, failed_password_attempts and
+                 daily_withdrawal_limit (RECORD), one fixed-size ACCOUNT per
+                 account (name padded to 32 bytes, balance in kuruş), then
+                 the remaining fields, ledger included, as compact JSON
+        index    one INDEX_ENTRY per user, sorted by username (UTF-8 bytes)
+        names    the usernames the index entries point into
+        lockouts JSON list of [username, lockout_until] for locked users
+
+    Opening it reads only the header; read_user binary-searches the index and
+    decodes just that user's record.
+    """
+
+    MAGIC = b'ATMSNAP\x00'
+    VERSION = 1
+    HEADER = struct.Struct('<8sHHIQQQQ')
+    INDEX_ENTRY = struct.Struct('<QIQI')
+    RECORD = struct.Struct('<QIId')
+    ACCOUNT = struct.Struct('<32sq')
+    FIXED_FIELDS = ("failed_password_attempts", "daily_withdrawal_limit", "accounts")
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < self.HEADER.size:
+            raise ValueError(f"'{path}' geçerli bir kullanıcı anlık görüntüsü değil.")
+        magic, version, reserved, self.count, self.seq, self.index_offset, self.names_offset, self.lockouts_offset = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC:
+            raise ValueError(f"'{path}' geçerli bir kullanıcı anlık görüntüsü değil.")
+        if version != self.VERSION:
+            raise ValueError(f"'{path}' anlık görüntü sürümü ({version}) desteklenmiyor.")
+
+    def name(self, position):
+        name_offset, name_length, record_offset, record_length = self.INDEX_ENTRY.unpack_from(self.map, self.index_offset + position * self.INDEX_ENTRY.size)
+        start = self.names_offset + name_offset
+        return self.map[start:start + name_length]
+
+    def find(self, username):
+        """Returns the index position of username, or None."""
+        key = username.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.count and self.name(lo) == key else None
+
+    def __contains__(self, username):
+        return self.find(username) is not None
+
+    def read_user(self, username):
+        position = self.find(username)
+        if position is None:
+            return None
+        name_offset, name_length, offset, length = self.INDEX_ENTRY.unpack_from(self.map, self.index_offset + position * self.INDEX_ENTRY.size)
+        seq, account_count, failed_attempts, daily_limit = self.RECORD.unpack_from(self.map, offset)
+        accounts = {}
+        position = offset + self.RECORD.size
+        for _ in range(account_count):
+            name, kuruş = self.ACCOUNT.unpack_from(self.map, position)
+            accounts[name.rstrip(b'\x00').decode('utf-8')] = {"bakiye": kuruş / 100}
+            position += self.ACCOUNT.size
+        user_data = json.loads(self.map[position:offset + length])
+        user_data.update(failed_password_attempts=failed_attempts, daily_withdrawal_limit=daily_limit, accounts=accounts)
+        upgrade_user_record(user_data)
+        return [user_data, length, seq, False]
+
+    def usernames(self):
+        for position in range(self.count):
+            yield self.name(position).decode('utf-8')
+
+    def lockouts(self):
+        return json.loads(self.map[self.lockouts_offset:])
+
+    def close(self):
+        self.map.close()
+
+    @classmethod
+    def write(cls, path, users, seq):
+        """Writes (username, user_data, seq) triples to path as a new snapshot; returns the user count."""
+        index, lockouts = [], []
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(b'\x00' * cls.HEADER.size)
+            for username, user_data, user_seq in users:
+                accounts = []
+                for name, account in user_data["accounts"].items():
+                    encoded = name.encode('utf-8')
+                    if len(encoded) > 32:
+                        raise ValueError(f"'{username}' kullanıcısının '{name}' hesap adı anlık görüntü için çok uzun.")
+                    accounts.append(cls.ACCOUNT.pack(encoded, round(account["bakiye"] * 100)))
+                rest = {key: value for key, value in user_data.items() if key not in cls.FIXED_FIELDS}
+                record = b''.join([
+                    cls.RECORD.pack(user_seq, len(accounts), user_data["failed_password_attempts"], user_data["daily_withdrawal_limit"]),
+                    *accounts,
+                    json.dumps(rest, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                ])
+                index.append((username.encode('utf-8'), f.tell(), len(record)))
+                f.write(record)
+                if user_data["lockout_until"]:
+                    lockouts.append([username, user_data["lockout_until"]])
+            index.sort()
+            index_offset = f.tell()
+            name_offset = 0
+            for name, record_offset, record_length in index:
+                f.write(cls.INDEX_ENTRY.pack(name_offset, len(name), record_offset, record_length))
+                name_offset += len(name)
+            names_offset = f.tell()
+            for name, record_offset, record_length in index:
+                f.write(name)
+            lockouts_offset = f.tell()
+            f.write(json.dumps(lockouts, ensure_ascii=False).encode('utf-8'))
+            f.seek(0)
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, 0, len(index), seq, index_offset, names_offset, lockouts_offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return len(index)
+
+def fsync_directory(path):
+    """Makes the renames and new files in directory path durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class JsonShardStorage(UserStorage):
+    """One JSON file per user plus an append-only journal of changes.
+
+    If snapshot_path exists, the users in that UserSnapshot are the base layer:
+    a user file, once a user has been written back, takes precedence over the
+    snapshot's copy. Every journal record is also added to a LedgerSearchIndex
+    at search_path, which answers search_ledger. lockouts_path holds the
+    lockout_until of every stored user that has one, kept in step by
+    write_user and replace_snapshot, so iter_lockouts reads one small file.
+    """
+
+    def __init__(self, shard_dir, journal_path, snapshot_path, search_path, lockouts_path):
+        self.shard_dir = shard_dir
+        self.journal_path = journal_path
+        self.journal_file = None
+        self.journal_torn = False
+        # write_user ile değişen klasörler; günlük sıfırlanmadan önce diske yazılır
+        self.unsynced_dirs = set()
+        self.snapshot_path = snapshot_path
+        self.snapshot = UserSnapshot(snapshot_path) if os.path.exists(snapshot_path) else None
+        self.search_index = LedgerSearchIndex(search_path)
+        self.lockouts_path = lockouts_path
+        self.lockouts = None
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def shard_path(self, username):
+        digest = hashlib.sha1(username.encode('utf-8')).hexdigest()
+        return os.path.join(self.shard_dir, digest[:2], digest + '.json')
+
+    def read_user(self, username):
         try:
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                users = json.load(f)
-            print("Kullanıcı verileri 'users.json' dosyasından başarıyla yüklendi.")
-        except json.JSONDecodeError:
-            print("Hata: 'users.json' dosyası bozuk veya geçersiz JSON formatında. Yeni bir sözlük oluşturuluyor.")
-            users = {}
+            with open(self.shard_path(username), 'rb') as f:
+                raw = f.read()
         except FileNotFoundError:
-            print("Hata: 'users.json' dosyası bulunamadı. Yeni bir sözlük oluşturuluyor.")
-            users = {}
+            return self.snapshot.read_user(username) if self.snapshot is not None else None
+        shard = json.loads(raw)
+        upgrade_user_record(shard["user"])
+        return [shard["user"], len(raw), shard.get("seq", 0), False]
+
+    def user_exists(self, username):
+        return os.path.exists(self.shard_path(username)) or (self.snapshot is not None and username in self.snapshot)
+
+    def write_user(self, username, user_data, seq):
+        path = self.shard_path(username)
+        bucket = os.path.dirname(path)
+        if not os.path.isdir(bucket):
+            os.makedirs(bucket, exist_ok=True)
+            self.unsynced_dirs.add(self.shard_dir)
+        raw = json.dumps({"username": username, "seq": seq, "user": user_data}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        lockouts = self.load_lockouts()
+        lockout_until = user_data["lockout_until"]
+        changed = lockouts.get(username) != lockout_until
+        # Kaldırılan kilit dosyadan önce, yeni kilit dosyadan sonra kaydedilir; arada
+        # çökerse kayıt en fazla bir kilidi eksik gösterir, o da kullanıcı okununca kurulur
+        if changed and not lockout_until:
+            del lockouts[username]
+            self.save_lockouts()
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self.unsynced_dirs.add(bucket)
+        if changed and lockout_until:
+            lockouts[username] = lockout_until
+            self.save_lockouts()
+        return len(raw)
+
+    def is_empty(self):
+        return not any(os.scandir(self.shard_dir)) and (self.snapshot is None or self.snapshot.count == 0)
+
+    # Kullanıcı adı her dosyanın ilk alanıdır; dosyanın tamamını okumaya gerek yok
+    USERNAME_PREFIX = re.compile(rb'^\{"username":("(?:[^"\\]|\\.)*")')
+    # lockout_until, User.to_dict'te parola ve hatalı deneme sayısından sonraki üçüncü alandır
+    LOCKOUT_FIELD = re.compile(rb'"lockout_until":(null|"[^"]*")')
+
+    def iter_shard_heads(self, head_size):
+        """Yields (path, username, first head_size bytes) of every user file."""
+        for bucket in sorted(os.scandir(self.shard_dir), key=lambda item: item.name):
+            if not bucket.is_dir():
+                continue
+            for item in sorted(os.scandir(bucket.path), key=lambda item: item.name):
+                if not item.name.endswith('.json'):
+                    continue
+                with open(item.path, 'rb') as f:
+                    head = f.read(head_size)
+                match = self.USERNAME_PREFIX.match(head)
+                if match:
+                    yield item.path, json.loads(match.group(1)), head
+
+    def iter_usernames(self):
+        shard_users = set()
+        for path, username, head in self.iter_shard_heads(1024):
+            shard_users.add(username)
+            yield username
+        if self.snapshot is not None:
+            yield from (username for username in self.snapshot.usernames() if username not in shard_users)
+
+    def iter_lockouts(self):
+        return list(self.load_lockouts().items())
+
+    def load_lockouts(self):
+        if self.lockouts is None:
+            try:
+                with open(self.lockouts_path, 'r', encoding='utf-8') as f:
+                    self.lockouts = json.load(f)
+            except FileNotFoundError:
+                # Kilit kaydından önceki depo: bir kez bütün kullanıcılar taranır
+                self.lockouts = dict(self.scan_lockouts())
+                self.save_lockouts()
+        return self.lockouts
+
+    def save_lockouts(self):
+        # Süresi dolmuş kilitler kayıttan düşülür; kullanıcı dosyasında kalmaları bir şey değiştirmez
+        now = datetime.datetime.now()
+        for username, lockout_until in list(self.lockouts.items()):
+            if datetime.datetime.fromisoformat(lockout_until) <= now:
+                del self.lockouts[username]
+        temp_path = self.lockouts_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.lockouts, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.lockouts_path)
+        fsync_directory(os.path.dirname(os.path.abspath(self.lockouts_path)))
+
+    def scan_lockouts(self):
+        """Yields (username, lockout_until) by reading every user file and the snapshot."""
+        shard_users = set()
+        if self.snapshot is not None:
+            # Anlık görüntünün kilitli kullanıcıları kendi bölümünde durur; kayıtlarını çözmeye gerek yok
+            snapshot_lockouts = self.snapshot.lockouts()
+        for path, username, head in self.iter_shard_heads(4096):
+            shard_users.add(username)
+            match = self.LOCKOUT_FIELD.search(head)
+            if match:
+                lockout_until = json.loads(match.group(1))
+            else:
+                # Çok sayıda hesabı olan kullanıcıda alan baştaki parçaya sığmamış olabilir
+                with open(path, 'rb') as f:
+                    lockout_until = json.loads(f.read())["user"]["lockout_until"]
+            if lockout_until:
+                yield username, lockout_until
+        if self.snapshot is not None:
+            yield from ((username, lockout_until) for username, lockout_until in snapshot_lockouts if username not in shard_users)
+
+    def import_users(self, users):
+        if not self.is_empty():
+            return super().import_users(users)
+        # Boş depoda kullanıcılar tek tek dosyalara değil, tek geçişte anlık görüntüye yazılır
+        self.replace_snapshot(((username, user_data, 0) for username, user_data in users), 0)
+
+    def replace_snapshot(self, users, seq):
+        """Writes (username, user_data, seq) triples as the new snapshot and maps it; returns the user count."""
+        new_path = self.snapshot_path + '.new'
+        count = UserSnapshot.write(new_path, users, seq)
+        # Yeni dosya eski eşlemeden okunarak yazılır; eski eşleme ancak yerine konmadan önce kapatılır
+        if self.snapshot is not None:
+            self.snapshot.close()
+        os.replace(new_path, self.snapshot_path)
+        # Kullanıcı dosyaları ancak yeni anlık görüntü kalıcı olduktan sonra silinebilir
+        fsync_directory(os.path.dirname(os.path.abspath(self.snapshot_path)))
+        self.snapshot = UserSnapshot(self.snapshot_path)
+        # Anlık görüntü yazılan kullanıcıların en güncel kopyalarını içerir
+        self.lockouts = dict(self.snapshot.lockouts())
+        self.save_lockouts()
+        return count
+
+    def stored_users(self):
+        for username in self.iter_usernames():
+            user_data, size, seq, dirty = self.read_user(username)
+            yield username, user_data, seq
+
+    def search_ledger(self, filters, limit, before=None):
+        return self.search_index.search(filters, limit, before)
+
+    def prepare_search(self, seq):
+        if not self.search_index.ready:
+            if not self.is_empty():
+                print(f"'{self.search_index.path}' arama dizini kuruluyor...")
+            self.search_index.rebuild(self.stored_users(), seq)
+
+    def write_snapshot(self, seq):
+        """Folds every user file into a new snapshot and removes the files; a checkpoint must have run first."""
+        count = self.replace_snapshot(self.stored_users(), seq)
+        # Dosyalar anlık görüntüden sonra silinir; arada çökerse aynı kopyalar yine önce okunur
+        for bucket in os.scandir(self.shard_dir):
+            if bucket.is_dir():
+                for item in os.scandir(bucket.path):
+                    os.remove(item.path)
+                os.rmdir(bucket.path)
+        return count
+
+    def append_records(self, records, fsync=False):
+        if self.journal_file is None:
+            self.journal_file = open(self.journal_path, 'ab', buffering=0)
+        data = ''.join(line for record, line in records).encode('utf-8')
+        if self.journal_torn:
+            # Kesilemeyen yarım satır kendi satırında kalsın; okurken atlanır
+            data = b'\n' + data
+        offset = self.journal_file.seek(0, os.SEEK_END)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[self.journal_file.write(view):]
+            if fsync:
+                os.fsync(self.journal_file.fileno())
+        except OSError:
+            # Yarım yazılan grup silinir; aynı kayıtlar bir sonraki denemede baştan yazılır
+            try:
+                self.journal_file.truncate(offset)
+                self.journal_torn = False
+            except OSError:
+                self.journal_torn = True
+            raise
+        self.journal_torn = False
+        self.search_index.add_records(record for record, line in records)
+
+    def read_records(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Çökme ya da yazma hatası sırasında yarım kalmış satır. Yazma hatasından
+                    # sonra aynı kayıtlar yeni satırlarda tekrar yazıldığı için okumaya devam edilir.
+                    print(f"Uyarı: '{self.journal_path}' günlüğünde yarım kalmış bir kayıt atlandı.")
+                    continue
+                # Günlüğe yazılıp dizine eklenemeden çökülmüş olabilir; dizin eksiklerini tamamlar
+                self.search_index.add_records([record])
+                yield record
+
+    def reset_records(self, seq):
+        # Kullanıcı dosyaları yazıldıktan sonra günlük yalnızca sıra numarasını tutan
+        # bir başlıkla yeniden başlar. Arada çökerse kayıtlar tekrar okunur ama her
+        # kullanıcı dosyası kendi sıra numarasını bildiği için iki kez uygulanmaz.
+        # Dosyaların içerikleri write_user'da diske yazıldı; yerlerine konmaları da
+        # (klasörler) günlük boşaltılmadan önce kalıcı olmalı.
+        for path in self.unsynced_dirs:
+            fsync_directory(path)
+        self.unsynced_dirs.clear()
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"seq": seq}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if self.journal_file is not None:
+            self.journal_file.close()
+        os.replace(temp_path, self.journal_path)
+        fsync_directory(os.path.dirname(os.path.abspath(self.journal_path)))
+        self.journal_file = open(self.journal_path, 'ab', buffering=0)
+        self.journal_torn = False
+
+    def close(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+        self.search_index.close()
+
+class SqliteStorage(UserStorage):
+    """SQLite database with users, accounts and ledger tables.
+
+    Every flushed batch of journal records becomes one small SQLite
+    transaction, so there is no separate journal and write_user has nothing
+    left to do. The ledger is not kept on the cached users; the history routes
+    read it through the (username, account, timestamp) index instead.
+
+    journal_state holds the last sequence number. With SHARED_STORAGE every
+    worker process draws its sequence numbers from it inside transaction(), so
+    ledger transaction ids stay unique across processes.
+    """
+
+    keeps_history = False
+    USER_COLUMNS = (
+        "parola", "failed_password_attempts", "lockout_until", "security_question", "security_answer",
+        "daily_withdrawal_limit", "last_end_of_day"
+    )
+    # Defter kaydı anahtarı -> ledger sütunu
+    LEDGER_COLUMNS = (
+        ("id", "txn_id"), ("t", "timestamp"), ("type", "type"), ("a", "account"), ("amt", "amount"),
+        ("cp", "counterparty"), ("cpa", "counterparty_account"), ("bal", "balance"), ("note", "note"),
+        ("vt", "value_time"), ("ch", "channel")
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.connections = {}  # iş parçacığı -> bağlantı
+        self.connections_lock = threading.Lock()
+        conn = self.connection()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                parola TEXT NOT NULL,
+                failed_password_attempts INTEGER NOT NULL DEFAULT 0,
+                lockout_until TEXT,
+                security_question TEXT NOT NULL DEFAULT '',
+                security_answer TEXT NOT NULL DEFAULT '',
+                daily_withdrawal_limit REAL NOT NULL DEFAULT 10000.0,
+                last_end_of_day TEXT,
+                seq INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS accounts (
+                username TEXT NOT NULL REFERENCES users(username),
+                name TEXT NOT NULL,
+                bakiye REAL NOT NULL,
+                PRIMARY KEY (username, name)
+            );
+            CREATE TABLE IF NOT EXISTS ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                txn_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                account TEXT,
+                timestamp TEXT NOT NULL,
+                type TEXT NOT NULL,
+                amount REAL,
+                counterparty TEXT,
+                counterparty_account TEXT,
+                balance REAL,
+                note TEXT,
+                value_time TEXT,
+                channel TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger (username, id);
+            CREATE INDEX IF NOT EXISTS idx_ledger_account_page ON ledger (username, account, id);
+            CREATE INDEX IF NOT EXISTS idx_users_lockout ON users (lockout_until) WHERE lockout_until IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS idx_ledger_type ON ledger (type, id);
+            CREATE INDEX IF NOT EXISTS idx_ledger_counterparty ON ledger (counterparty, id);
+            CREATE TABLE IF NOT EXISTS journal_state (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                seq INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS api_tokens (
+                token TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_api_tokens_expires ON api_tokens (expires);
+        ''')
+        # Taşımalar yazma kilidi altında yapılır; aynı anda açılan işçilerden yalnızca ilki uygular
+        with self.transaction():
+            self.migrate_transactions(conn)
+            # Sonradan eklenen sütunlar eski veritabanlarına da eklenir
+            self.add_missing_column(conn, "ledger", "value_time", "TEXT")
+            self.add_missing_column(conn, "users", "last_end_of_day", "TEXT")
+            self.add_missing_column(conn, "ledger", "channel", "TEXT")
+            # Tarih aralıkları kaydın asıl zamanına göre süzülür; bu dizinler value_time
+            # sütunu eklendikten sonra kurulur. Eski, yalnızca timestamp'li dizinler kaldırılır.
+            conn.execute("DROP INDEX IF EXISTS idx_ledger_account")
+            conn.execute("DROP INDEX IF EXISTS idx_ledger_user_time")
+            for statement in self.VALUE_TIME_INDEXES:
+                conn.execute(statement)
+            # journal_state'ten önceki veritabanlarında son sıra numarası kullanıcılardan bulunur
+            conn.execute("INSERT OR IGNORE INTO journal_state (id, seq) SELECT 0, COALESCE(MAX(seq), 0) FROM users")
+
+    VALUE_TIME_INDEXES = (
+        "CREATE INDEX IF NOT EXISTS idx_ledger_user_value_time ON ledger (username, COALESCE(value_time, timestamp))",
+        "CREATE INDEX IF NOT EXISTS idx_ledger_account_value_time ON ledger (username, account, COALESCE(value_time, timestamp))",
+        "CREATE INDEX IF NOT EXISTS idx_ledger_value_time ON ledger (COALESCE(value_time, timestamp))",
+        "CREATE INDEX IF NOT EXISTS idx_ledger_type_time ON ledger (type, COALESCE(value_time, timestamp))"
+    )
+
+    @staticmethod
+    def add_missing_column(conn, table, column, declaration):
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def migrate_transactions(self, conn):
+        """Moves the text history of the old transactions table into the ledger."""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions'").fetchone() is None:
+            return
+        conn.execute(
+            "INSERT INTO ledger (txn_id, username, account, timestamp, type, note) "
+            "SELECT 0, username, account, timestamp, 'legacy', entry FROM transactions ORDER BY timestamp, id"
+        )
+        opened = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        conn.execute(
+            "INSERT INTO ledger (txn_id, username, account, timestamp, type, amount, balance) "
+            "SELECT 0, username, name, ?, 'opening', bakiye, bakiye FROM accounts ORDER BY rowid",
+            (opened,)
+        )
+        conn.execute("DROP TABLE transactions")
+
+    def connection(self):
+        """Returns this thread's connection, opening it on first use.
+
+        Connections of threads that have finished are closed here, so servers
+        that start a thread per request do not pile up open connections.
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            if SHARED_STORAGE:
+                # Ortak modda her commit kendi işlemidir ve hemen diske iner
+                conn.execute('PRAGMA synchronous = FULL')
+            self.local.conn = conn
+            with self.connections_lock:
+                for thread in [thread for thread in self.connections if not thread.is_alive()]:
+                    self.connections.pop(thread).close()
+                self.connections[threading.current_thread()] = conn
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Runs the block in one write transaction on this thread's connection.
+
+        BEGIN IMMEDIATE takes SQLite's write lock up front, which is shared by
+        every process using the file. Nested calls join the open transaction.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def next_seq(self):
+        """Takes the next journal sequence number; must be called inside transaction()."""
+        conn = self.connection()
+        conn.execute("UPDATE journal_state SET seq = seq + 1")
+        seq, = conn.execute("SELECT seq FROM journal_state").fetchone()
+        return seq
+
+    def user_seq(self, username):
+        row = self.connection().execute("SELECT seq FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row is not None else None
+
+    def save_api_token(self, token, username, expires):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM api_tokens WHERE expires <= ?", (time.time(),))
+            conn.execute("INSERT INTO api_tokens (token, username, expires) VALUES (?, ?, ?)", (token, username, expires))
+
+    def api_token_user(self, token):
+        row = self.connection().execute("SELECT username FROM api_tokens WHERE token = ? AND expires > ?", (token, time.time())).fetchone()
+        return row[0] if row is not None else None
+
+    def delete_api_token(self, token):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM api_tokens WHERE token = ?", (token,))
+
+    def read_user(self, username):
+        conn = self.connection()
+        row = conn.execute(f"SELECT {', '.join(self.USER_COLUMNS)}, seq FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        user_data = dict(zip(self.USER_COLUMNS, row))
+        user_data["accounts"] = {
+            name: {"bakiye": bakiye}
+            for name, bakiye in conn.execute("SELECT name, bakiye FROM accounts WHERE username = ? ORDER BY rowid", (username,))
+        }
+        user_data["ledger"] = []
+        upgrade_user_record(user_data)
+        return [user_data, len(json.dumps(user_data, ensure_ascii=False)), row[-1], False]
+
+    def user_exists(self, username):
+        return self.connection().execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def write_user(self, username, user_data, seq):
+        # Değişiklikler append_records ile zaten veritabanına yazıldı
+        return len(json.dumps(user_data, ensure_ascii=False))
+
+    def import_user(self, username, user_data):
+        with self.transaction() as conn:
+            self.insert_user(conn, username, user_data, 0)
+            self.insert_ledger(conn, username, user_data["ledger"])
+
+    def insert_user(self, conn, username, user_data, seq):
+        conn.execute(
+            f"INSERT OR REPLACE INTO users ({', '.join(self.USER_COLUMNS)}, username, seq) VALUES ({', '.join('?' * (len(self.USER_COLUMNS) + 2))})",
+            [user_data.get(column) for column in self.USER_COLUMNS] + [username, seq]
+        )
+        conn.execute("DELETE FROM accounts WHERE username = ?", (username,))
+        conn.executemany(
+            "INSERT INTO accounts (username, name, bakiye) VALUES (?, ?, ?)",
+            [(username, name, account["bakiye"]) for name, account in user_data["accounts"].items()]
+        )
+
+    def insert_ledger(self, conn, username, entries):
+        columns = ', '.join(column for key, column in self.LEDGER_COLUMNS)
+        conn.executemany(
+            f"INSERT INTO ledger (username, {columns}) VALUES ({', '.join('?' * (len(self.LEDGER_COLUMNS) + 1))})",
+            [[username] + [entry.get(key) for key, column in self.LEDGER_COLUMNS] for entry in entries]
+        )
+
+    def ledger_entries(self, rows):
+        """Turns ledger rows back into the entry dicts posting() builds."""
+        return [
+            {key: value for (key, column), value in zip(self.LEDGER_COLUMNS, row) if value is not None}
+            for row in rows
+        ]
+
+    def is_empty(self):
+        return self.connection().execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def iter_usernames(self):
+        for username, in self.connection().execute("SELECT username FROM users ORDER BY username"):
+            yield username
+
+    def iter_lockouts(self):
+        yield from self.connection().execute("SELECT username, lockout_until FROM users WHERE lockout_until IS NOT NULL")
+
+    def read_records(self):
+        # Ayrı bir günlük yok; yalnızca sıra numarasının devam edeceği yer bildirilir
+        seq, = self.connection().execute("SELECT seq FROM journal_state").fetchone()
+        yield {"seq": seq}
+
+    def append_records(self, records, fsync=False):
+        conn = self.connection()
+        if not SHARED_STORAGE:
+            conn.execute(f"PRAGMA synchronous = {'FULL' if fsync else 'NORMAL'}")
+        with self.transaction():
+            for record, line in records:
+                for username, change in record["c"]:
+                    self.apply_record_change(conn, username, change, record["s"])
+            conn.execute("UPDATE journal_state SET seq = MAX(seq, ?)", (records[-1][0]["s"],))
+
+    def apply_record_change(self, conn, username, change, seq):
+        if "new" in change:
+            self.insert_user(conn, username, change["new"], seq)
+        fields = {column: value for column, value in change.get("f", {}).items() if column in self.USER_COLUMNS}
+        assignments = ''.join(f"{column} = ?, " for column in fields)
+        conn.execute(f"UPDATE users SET {assignments}seq = ? WHERE username = ?", list(fields.values()) + [seq, username])
+        postings = change.get("p", [])
+        conn.executemany(
+            "UPDATE accounts SET bakiye = ? WHERE username = ? AND name = ?",
+            [(entry["bal"], username, entry["a"]) for entry in postings if "amt" in entry]
+        )
+        self.insert_ledger(conn, username, postings)
+
+    def ledger_page(self, username, user_data, account_name=None, limit=HISTORY_PAGE_SIZE, before=None, since=None, until=None, entry_type=None):
+        # İmleç ledger satır numarasıdır. Tarih sınırları kaydın asıl zamanına
+        # (aktarılan kayıtlarda value_time) uygulanır; bu zaman satır sırasında
+        # artmadığı için satır numarasına çevrilemez, koşul olarak eklenir.
+        conn = self.connection()
+        conditions = ["username = ?"] if account_name is None else ["username = ?", "account = ?"]
+        values = [username] if account_name is None else [username, account_name]
+        if since is not None:
+            conditions.append("COALESCE(value_time, timestamp) >= ?")
+            values.append(since)
+        if until is not None:
+            conditions.append("COALESCE(value_time, timestamp) <= ?")
+            values.append(until)
+        if before is not None:
+            conditions.append("id < ?")
+            values.append(before)
+        if entry_type is not None:
+            conditions.append("type = ?")
+            values.append(entry_type)
+        columns = ', '.join(column for key, column in self.LEDGER_COLUMNS)
+        rows = conn.execute(
+            f"SELECT id, {columns} FROM ledger WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT ?",
+            values + [limit + 1]
+        ).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return self.ledger_entries(row[1:] for row in rows[:limit]), next_cursor
+
+    def search_ledger(self, filters, limit, before=None):
+        return search_ledger_table(self.connection(), filters, limit, before)
+
+    def close(self):
+        with self.connections_lock:
+            for conn in self.connections.values():
+                conn.close()
+            self.connections.clear()
+
+def search_ledger_table(conn, filters, limit, before=None):
+    """search_ledger over a table laid out like SqliteStorage's ledger.
+
+    Time bounds apply to the original time of an entry (value_time for
+    imported entries, otherwise timestamp) and are read from the index on that
+    expression; row ids are not in time order, since migrations, imports and
+    rebuilds insert user by user. Without them the page is read newest first
+    through the (type, id), (counterparty, id) or (username, id) index. The
+    cursor is the ledger row id.
+    """
+    conditions, values = [], []
+    for column in ("username", "account", "type", "counterparty"):
+        if filters.get(column) is not None:
+            conditions.append(f"{column} = ?")
+            values.append(filters[column])
+    if filters.get("since") is not None:
+        conditions.append("COALESCE(value_time, timestamp) >= ?")
+        values.append(filters["since"])
+    if filters.get("until") is not None:
+        conditions.append("COALESCE(value_time, timestamp) <= ?")
+        values.append(filters["until"])
+    if before is not None:
+        conditions.append("id < ?")
+        values.append(before)
+    if filters.get("direction") == "in":
+        conditions.append("amount > 0")
+    elif filters.get("direction") == "out":
+        conditions.append("amount < 0")
+    if filters.get("min_amount") is not None:
+        conditions.append("abs(amount) >= ?")
+        values.append(filters["min_amount"])
+    if filters.get("max_amount") is not None:
+        conditions.append("abs(amount) <= ?")
+        values.append(filters["max_amount"])
+    columns = ', '.join(column for key, column in SqliteStorage.LEDGER_COLUMNS)
+    rows = conn.execute(
+        f"SELECT id, username, {columns} FROM ledger {'WHERE ' + ' AND '.join(conditions) if conditions else ''} ORDER BY id DESC LIMIT ?",
+        values + [limit + 1]
+    ).fetchall()
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    entries = []
+    for row in rows[:limit]:
+        entry = {key: value for (key, column), value in zip(SqliteStorage.LEDGER_COLUMNS, row[2:]) if value is not None}
+        entry["username"] = row[1]
+        entries.append(entry)
+    return entries, next_cursor
+
+class LedgerSearchIndex:
+    """Side SQLite database with the ledger entries of every user, for the json backend.
+
+    Entries are added per flushed journal batch. state holds the last record
+    seq added, so records read again after a crash are not added twice; a
+    database without a state row (new, or a rebuild that did not finish) is
+    rebuilt from the stored users by prepare_search.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                txn_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                account TEXT,
+                timestamp TEXT NOT NULL,
+                type TEXT NOT NULL,
+                amount REAL,
+                counterparty TEXT,
+                counterparty_account TEXT,
+                balance REAL,
+                note TEXT,
+                value_time TEXT,
+                channel TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger (username, id);
+            CREATE INDEX IF NOT EXISTS idx_ledger_value_time ON ledger (COALESCE(value_time, timestamp));
+            CREATE INDEX IF NOT EXISTS idx_ledger_type ON ledger (type, id);
+            CREATE INDEX IF NOT EXISTS idx_ledger_type_time ON ledger (type, COALESCE(value_time, timestamp));
+            CREATE INDEX IF NOT EXISTS idx_ledger_counterparty ON ledger (counterparty, id);
+            CREATE TABLE IF NOT EXISTS state (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                seq INTEGER NOT NULL
+            );
+        ''')
+        row = self.conn.execute("SELECT seq FROM state").fetchone()
+        self.ready = row is not None
+        self.seq = row[0] if row is not None else 0
+
+    def insert(self, username, entries):
+        columns = ', '.join(column for key, column in SqliteStorage.LEDGER_COLUMNS)
+        self.conn.executemany(
+            f"INSERT INTO ledger (username, {columns}) VALUES ({', '.join('?' * (len(SqliteStorage.LEDGER_COLUMNS) + 1))})",
+            [[username] + [entry.get(key) for key, column in SqliteStorage.LEDGER_COLUMNS] for entry in entries]
+        )
+
+    def add_records(self, records):
+        """Adds the postings of journal records newer than seq; ignored until the index is built."""
+        if not self.ready:
+            return
+        with self.lock, self.conn:
+            for record in records:
+                if record.get("s", 0) <= self.seq:
+                    continue
+                for username, change in record["c"]:
+                    self.insert(username, change.get("p", []))
+                self.seq = record["s"]
+            self.conn.execute("UPDATE state SET seq = ?", (self.seq,))
+
+    def rebuild(self, users, seq):
+        """Indexes the ledgers of (username, user_data, seq) triples from scratch."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM ledger")
+            for username, user_data, user_seq in users:
+                self.insert(username, user_data["ledger"])
+            self.conn.execute("INSERT OR REPLACE INTO state (id, seq) VALUES (0, ?)", (seq,))
+        self.ready = True
+        self.seq = seq
+
+    def search(self, filters, limit, before=None):
+        with self.lock:
+            return search_ledger_table(self.conn, filters, limit, before)
+
+    def close(self):
+        self.conn.close()
+
+class LedgerIndex:
+    """Ledger positions of one user per (account, type), kept in ledger order.
+
+    Every entry is indexed under (None, None), (account, None), (None, type)
+    and (account, type), together with its original time ("vt" for imported
+    entries, otherwise "t"), which is what since/until are compared with.
+    Entries booked by the routes are appended in time order, so as long as a
+    scope has no imported entries out of that order a page is two bisects and
+    a slice however deep it is; otherwise pages with time bounds are found by
+    walking the scope back from the cursor. refresh() indexes only the entries
+    added since the last call.
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.indexed = 0
+        # (konumlar, zamanlar, zamanlar sıralı mı)
+        self.scopes = collections.defaultdict(lambda: [[], [], True])
+
+    def refresh(self):
+        count = len(self.ledger)
+        for position in range(self.indexed, count):
+            entry = self.ledger[position]
+            account_name, entry_type = entry.get("a"), entry["type"]
+            when = entry.get("vt", entry["t"])
+            for key in {(None, None), (account_name, None), (None, entry_type), (account_name, entry_type)}:
+                scope = self.scopes[key]
+                positions, times = scope[0], scope[1]
+                if times and when < times[-1]:
+                    scope[2] = False
+                positions.append(position)
+                times.append(when)
+        self.indexed = count
+
+    def page(self, account_name, entry_type, limit, before, since, until):
+        positions, times, ordered = self.scopes.get((account_name, entry_type), ([], [], True))
+        hi = len(positions) if before is None else bisect.bisect_left(positions, before)
+        if ordered or (since is None and until is None):
+            if until is not None:
+                hi = min(hi, bisect.bisect_right(times, until))
+            lo = 0 if since is None else bisect.bisect_left(times, since)
+            start = max(lo, hi - limit)
+            entries = [self.ledger[position] for position in reversed(positions[start:hi])]
+            return entries, positions[start] if start > lo else None
+        found = []
+        for index in range(hi - 1, -1, -1):
+            if (since is None or times[index] >= since) and (until is None or times[index] <= until):
+                if len(found) == limit:
+                    return [self.ledger[position] for position in found], found[-1]
+                found.append(positions[index])
+        return [self.ledger[position] for position in found], None
+
+def ledger_index(username, ledger):
+    """Returns the up-to-date LedgerIndex of a user, building it on first use."""
+    with ledger_index_lock:
+        index = ledger_indexes.get(username)
+        if index is None or index.ledger is not ledger:
+            # Kullanıcı hafızadan çıkarılıp yeniden okunduysa dizin baştan kurulur
+            index = LedgerIndex(ledger)
+            ledger_indexes[username] = index
+        ledger_indexes.move_to_end(username)
+        while len(ledger_indexes) > LEDGER_INDEX_USERS:
+            ledger_indexes.popitem(last=False)
+        index.refresh()
+        return index
+
+def create_storage(backend):
+    if SHARED_STORAGE and backend != 'sqlite':
+        raise ValueError("Ortak depolama (ATM_SHARED_STORAGE=1) yalnızca 'sqlite' deposuyla kullanılabilir.")
+    if backend == 'sqlite':
+        return SqliteStorage(SQLITE_FILE)
+    if backend == 'json':
+        return JsonShardStorage(USER_SHARD_DIR, JOURNAL_FILE, SNAPSHOT_FILE, LEDGER_SEARCH_FILE, LOCKOUTS_FILE)
+    raise ValueError(f"Bilinmeyen depolama türü: {backend}")
+
+class Account:
+    """One account of a user, with the balance kept in whole kuruş.
+
+    account["bakiye"] and account.bakiye read and set the balance in TL, as
+    the {"bakiye": ...} dicts of the stored records did; amounts are rounded
+    to the kuruş when they are set.
+    """
+
+    __slots__ = ("kuruş",)
+
+    def __init__(self, bakiye=0.0):
+        self.kuruş = round(bakiye * 100)
+
+    @property
+    def bakiye(self):
+        return self.kuruş / 100
+
+    @bakiye.setter
+    def bakiye(self, value):
+        self.kuruş = round(value * 100)
+
+    def __getitem__(self, key):
+        if key != "bakiye":
+            raise KeyError(key)
+        return self.kuruş / 100
+
+    def __setitem__(self, key, value):
+        if key != "bakiye":
+            raise KeyError(key)
+        self.kuruş = round(value * 100)
+
+    def to_dict(self):
+        return {"bakiye": self.kuruş / 100}
+
+    def __repr__(self):
+        return f"Account(bakiye={self.kuruş / 100})"
+
+class User:
+    """A cached user: one slot per record field instead of a dict per user.
+
+    Supports the user_data[...] / get / update / setdefault / in access the
+    code used on the record dicts; accounts maps names to Account. Fields a
+    record has beyond FIELDS are kept in a small dict of their own.
+    """
+
+    FIELDS = (
+        "parola", "failed_password_attempts", "lockout_until", "security_question", "security_answer",
+        "daily_withdrawal_limit", "last_end_of_day", "accounts", "ledger"
+    )
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, None)
+        self.accounts = {}
+        self.ledger = []
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, user_data):
+        user = cls()
+        for key, value in user_data.items():
+            user[key] = value
+        return user
+
+    def to_dict(self):
+        """Returns the record dict stored and journaled for this user."""
+        user_data = {field: getattr(self, field) for field in self.FIELDS}
+        user_data["accounts"] = {name: account.to_dict() for name, account in self.accounts.items()}
+        user_data.update(self.extra or {})
+        return user_data
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra is None or key not in self.extra:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key == "accounts":
+            # Hesap adları depodan her kullanıcı için ayrı okunur; tek kopyada tutulur
+            value = {sys.intern(name): Account(account["bakiye"]) for name, account in value.items()}
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.FIELDS or (self.extra is not None and key in self.extra)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, fields):
+        for key, value in fields.items():
+            self[key] = value
+
+class UserCache:
+    """Loads users lazily from the storage backend and keeps recently used ones in memory.
+
+    Supports the get/in/[] access the routes used on the old users dict. Each
+    entry is [user, size, seq, dirty]: user is a User built from the stored
+    record, size the approximate JSON size of that record,
+    seq the last journal record applied to it and dirty the per-user flag set
+    by commit_changes. Entries are only evicted by the flusher, which holds
+    persistence_lock and writes dirty entries back before dropping them.
+    """
+
+    def __init__(self, storage, max_bytes):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "writebacks": 0}
+
+    def entry(self, username):
+        """Returns the cache entry of username, reading it from storage on a miss."""
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is not None:
+                self.entries.move_to_end(username)
+                self.stats["hits"] += 1
+                return entry
+        entry = self.read(username)
+        if entry is None:
+            return None
+        with self.lock:
+            # Aynı kullanıcı bu arada başka bir istek tarafından yüklenmiş olabilir
+            existing = self.entries.get(username)
+            if existing is not None:
+                return existing
+            self.stats["misses"] += 1
+            self.entries[username] = entry
+            self.total_bytes += entry[1]
+        # Kilit başka bir işçide (veya bu kullanıcı hafızada değilken) konmuş olabilir
+        lockout_index.set(username, entry[0]["lockout_until"])
+        return entry
+
+    def read(self, username):
+        """Reads username from storage as a new cache entry."""
+        entry = self.storage.read_user(username)
+        if entry is not None:
+            entry[0] = User.from_dict(entry[0])
+        return entry
+
+    def get(self, username, default=None):
+        entry = self.entry(username)
+        return entry[0] if entry is not None else default
+
+    def __getitem__(self, username):
+        entry = self.entry(username)
+        if entry is None:
+            raise KeyError(username)
+        return entry[0]
+
+    def __contains__(self, username):
+        with self.lock:
+            if username in self.entries:
+                return True
+        return self.storage.user_exists(username)
+
+    def add(self, username, user_data, seq=0):
+        """Adds a user record that is not in storage yet; it starts out dirty."""
+        size = len(json.dumps(user_data, ensure_ascii=False))
+        with self.lock:
+            old = self.entries.pop(username, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[username] = [User.from_dict(user_data), size, seq, True]
+            self.total_bytes += size
+
+    def refresh(self, username):
+        """Re-reads a cached user whose stored seq has moved on (another worker changed it)."""
+        with self.lock:
+            entry = self.entries.get(username)
+        if entry is None or self.storage.user_seq(username) == entry[2]:
+            return
+        loaded = self.read(username)
+        with self.lock:
+            if self.entries.get(username) is entry:
+                del self.entries[username]
+                self.total_bytes -= entry[1]
+            if loaded is not None:
+                self.entries[username] = loaded
+                self.total_bytes += loaded[1]
+        if loaded is not None:
+            lockout_index.set(username, loaded[0]["lockout_until"])
+
+    def restore(self, username, size, seq, dirty):
+        """Puts back the size, seq and dirty flag an entry had before mark_dirty; persistence_lock must be held."""
+        with self.lock:
+            entry = self.entries[username]
+            self.total_bytes += size - entry[1]
+            entry[1], entry[2], entry[3] = size, seq, dirty
+
+    def discard(self, username):
+        """Drops a user from the cache so the next access reads it from storage again."""
+        with self.lock:
+            entry = self.entries.pop(username, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def mark_dirty(self, username, seq, grown=0):
+        """Flags a user as changed by journal record seq; persistence_lock must be held."""
+        with self.lock:
+            entry = self.entries[username]
+            entry[2] = seq
+            entry[3] = True
+            entry[1] += grown
+            self.total_bytes += grown
+
+    def dirty_count(self):
+        with self.lock:
+            return sum(1 for entry in self.entries.values() if entry[3])
+
+    def write_back(self, only_over_budget=False):
+        """Writes dirty entries to storage; persistence_lock must be held.
+
+        With only_over_budget=True, least recently used entries are evicted
+        until the cache fits in max_bytes again, writing dirty ones first.
+        """
+        with self.lock:
+            if only_over_budget:
+                victims = []
+                excess = self.total_bytes - self.max_bytes
+                for username, entry in self.entries.items():
+                    if excess <= 0 or len(victims) >= len(self.entries) - 1:
+                        break
+                    victims.append((username, entry))
+                    excess -= entry[1]
+            else:
+                victims = [(username, entry) for username, entry in self.entries.items() if entry[3]]
+        for username, entry in victims:
+            if entry[3]:
+                size = self.storage.write_user(username, entry[0].to_dict(), entry[2])
+                self.stats["writebacks"] += 1
+                metrics.inc('atm_user_bytes_written_total', amount=size)
+                with self.lock:
+                    entry[3] = False
+                    if self.entries.get(username) is entry:
+                        self.total_bytes += size - entry[1]
+                    entry[1] = size
+        if only_over_budget:
+            with self.lock:
+                for username, entry in victims:
+                    if self.entries.get(username) is entry:
+                        del self.entries[username]
+                        self.total_bytes -= entry[1]
+                        self.stats["evictions"] += 1
+
+# Parola havuzu süreçlerinde depo (sqlite bağlantıları, taşımalar, arama dizini) açılmaz
+storage = None if PASSWORD_POOL_PROCESS else create_storage(STORAGE_BACKEND)
+# Kullanıcılar ilk erişimde depodan yüklenir
+users = UserCache(storage, USER_CACHE_MAX_BYTES)
+
+class LockManager:
+    """Striped locks that guard read-modify-write on accounts.
+
+    A key is (username, account_name); (username, None) guards user-level
+    fields such as failed_password_attempts. Keys hash onto a fixed number of
+    stripes, and locked() always takes stripes in ascending order, so two
+    transfers between the same users in opposite directions cannot deadlock.
+
+    With SHARED_STORAGE the block also runs inside a database write
+    transaction, which other worker processes wait on, and the users of the
+    keys are re-read first if another worker has changed them.
+    """
+
+    def __init__(self, stripes):
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripe(self, key):
+        return hash(key) % len(self.locks)
+
+    @contextlib.contextmanager
+    def locked(self, *keys):
+        stripes = sorted({self.stripe(key) for key in keys})
+        started = time.perf_counter()
+        for index in stripes:
+            self.locks[index].acquire()
+        metrics.observe('atm_lock_wait_seconds', (('lock', 'account'),), time.perf_counter() - started)
+        try:
+            if not SHARED_STORAGE:
+                yield
+                return
+            usernames = {key[0] for key in keys}
+            started = time.perf_counter()
+            try:
+                with storage.transaction():
+                    metrics.observe('atm_lock_wait_seconds', (('lock', 'database'),), time.perf_counter() - started)
+                    for username in usernames:
+                        users.refresh(username)
+                    yield
+            except BaseException:
+                # Geri alınan değişiklikler önbellekte kalmasın; kullanıcılar depodan yeniden okunur
+                for username in usernames:
+                    users.discard(username)
+                raise
+        finally:
+            for index in reversed(stripes):
+                self.locks[index].release()
+
+lock_manager = LockManager(LOCK_STRIPES)
+
+class LockoutIndex:
+    """Locked-out users keyed by a time.monotonic() expiry.
+
+    lockout_until stays in the user record as ISO text so lockouts survive a
+    restart, but it is parsed only once, when it is set or loaded; remaining()
+    is then a dict lookup. A min-heap orders the expiries for sweep(). Heap
+    items replaced by a later set() stay until their time comes and are
+    skipped because they no longer match the dict.
+    """
+
+    def __init__(self):
+        self.expiry = {}  # kullanıcı adı -> (monotonic bitiş zamanı, lockout_until)
+        self.heap = []  # (monotonic bitiş zamanı, kullanıcı adı)
+        self.lock = threading.Lock()
+
+    def set(self, username, lockout_until):
+        now = time.monotonic()
+        deadline = None
+        if lockout_until:
+            deadline = now + (datetime.datetime.fromisoformat(lockout_until) - datetime.datetime.now()).total_seconds()
+        with self.lock:
+            if deadline is None or deadline <= now:
+                self.expiry.pop(username, None)
+                return
+            self.expiry[username] = (deadline, lockout_until)
+            heapq.heappush(self.heap, (deadline, username))
+            if len(self.heap) > 2 * len(self.expiry) + 64:
+                self.heap = [(deadline, username) for username, (deadline, text) in self.expiry.items()]
+                heapq.heapify(self.heap)
+
+    def remaining(self, username):
+        """Returns the seconds left on username's lockout, 0 if not locked."""
+        entry = self.expiry.get(username)
+        if entry is None:
+            return 0
+        return max(0, entry[0] - time.monotonic())
+
+    def sweep(self):
+        """Drops every expired lockout; returns how many were dropped."""
+        now = time.monotonic()
+        dropped = 0
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, username = heapq.heappop(self.heap)
+                entry = self.expiry.get(username)
+                if entry is not None and entry[0] == deadline:
+                    del self.expiry[username]
+                    dropped += 1
+        return dropped
+
+    def locked(self):
+        """Returns (username, lockout_until, seconds left) for current lockouts, soonest first."""
+        now = time.monotonic()
+        with self.lock:
+            entries = sorted((deadline, username, text) for username, (deadline, text) in self.expiry.items() if deadline > now)
+        return [(username, text, deadline - now) for deadline, username, text in entries]
+
+lockout_index = LockoutIndex()
+
+class TokenBucketLimiter:
+    """Token buckets per key, e.g. per IP address or per username.
+
+    A key may spend burst tokens at once and regains per_minute tokens a
+    minute. Buckets are kept in last-use order: a bucket left alone long
+    enough to be full again is the same as no bucket and is dropped from the
+    front, and past max_keys the least recently used one is dropped, so every
+    check is O(1) amortized and memory stays bounded.
+    """
+
+    def __init__(self, burst, per_minute, max_keys):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.idle_seconds = burst / self.rate
+        self.max_keys = max_keys
+        self.buckets = collections.OrderedDict()  # anahtar -> [jeton, son güncelleme zamanı]
+        self.lock = threading.Lock()
+
+    def acquire(self, key):
+        """Spends a token for key; returns 0, or the seconds until one is available."""
+        now = time.monotonic()
+        with self.lock:
+            while self.buckets and now - next(iter(self.buckets.values()))[1] >= self.idle_seconds:
+                self.buckets.popitem(last=False)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_keys:
+                    self.buckets.popitem(last=False)
+                bucket = self.buckets[key] = [float(self.burst), now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self.buckets.move_to_end(key)
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+login_ip_limiter = TokenBucketLimiter(LOGIN_RATE_IP_BURST, LOGIN_RATE_IP_PER_MINUTE, RATE_LIMIT_MAX_KEYS)
+login_user_limiter = TokenBucketLimiter(LOGIN_RATE_USER_BURST, LOGIN_RATE_USER_PER_MINUTE, RATE_LIMIT_MAX_KEYS)
+
+def load_user_data():
+    """Prepares the storage backend and replays the journal on top of it."""
+    with storage.transaction() if SHARED_STORAGE else contextlib.nullcontext():
+        if os.path.exists(USERS_FILE) and storage.is_empty():
+            migrate_users_file()
+
+    replayed = replay_journal()
+    if replayed:
+        print(f"'{JOURNAL_FILE}' günlüğünden {replayed} kayıt yeniden uygulandı.")
+    checkpoint_user_data()
+    storage.prepare_search(journal_seq)
+    for username, lockout_until in storage.iter_lockouts():
+        lockout_index.set(username, lockout_until)
+
+def migrate_users_file():
+    """Moves the users of the old users.json into the storage backend."""
+    try:
+        with open(USERS_FILE, 'r', encoding='utf-8') as f:
+            old_users = json.load(f) if os.path.getsize(USERS_FILE) > 0 else {}
+    except json.JSONDecodeError:
+        print("Hata: 'users.json' dosyası bozuk veya geçersiz JSON formatında. Yeni bir kullanıcı deposu oluşturuluyor.")
+        return
+    for user_data in old_users.values():
+        upgrade_user_record(user_data)
+    storage.import_users(old_users.items())
+    os.replace(USERS_FILE, USERS_FILE + '.migrated')
+    print(f"'users.json' dosyasındaki {len(old_users)} kullanıcı '{STORAGE_BACKEND}' deposuna taşındı.")
+
+def upgrade_user_record(user_data):
+    """Fills in fields that older user records do not have and drops the ones no longer used."""
+    user_data.setdefault("failed_password_attempts", 0)
+    user_data.setdefault("lockout_until", None)
+    user_data.setdefault("security_question", "")
+    user_data.setdefault("security_answer", "")
+    user_data.setdefault("daily_withdrawal_limit", 10000.0)
+    user_data.setdefault("last_end_of_day", None)
+    # Takvim günü çekim toplamı; limitler artık defterden kurulan kayan pencerelerle izlenir
+    user_data.pop("current_day_withdrawal_amount", None)
+    user_data.pop("last_withdrawal_date", None)
+    if "ledger" not in user_data:
+        user_data["ledger"] = legacy_ledger(user_data)
+
+def legacy_ledger(user_data):
+    """Builds a ledger for a record that still has the old text histories.
+
+    Old history lines are kept as zero-amount "legacy" entries, followed by
+    one "opening" posting per account so the postings add up to the balance.
+    """
+    ledger = [{"id": 0, "t": entry[1:20], "type": "legacy", "note": entry} for entry in user_data.pop("user_history", [])]
+    for account_name, account in user_data["accounts"].items():
+        ledger.extend({"id": 0, "t": entry[1:20], "type": "legacy", "a": account_name, "note": entry} for entry in account.pop("işlem_geçmişi", []))
+    ledger.sort(key=lambda entry: entry["t"])
+    opened = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for account_name, account in user_data["accounts"].items():
+        ledger.append({"id": 0, "t": opened, "type": "opening", "a": account_name, "amt": account["bakiye"], "bal": account["bakiye"]})
+    return ledger
+
+# Kasa ve banka gelir hesabı, para yatırma/çekme ve havale ücreti kayıtlarının karşı tarafıdır
+CASH_ACCOUNT = "KASA"
+FEE_ACCOUNT = "BANKA"
+
+def posting(entry_type, account_name=None, amount=None, counterparty=None, counterparty_account=None, **extra):
+    """Builds a ledger entry; commit_changes fills in its transaction id and time.
+
+    Entries with an amount are postings that move an account's balance; the
+    others (logins, balance inquiries, password changes) only record activity.
+    """
+    entry = {"type": entry_type}
+    if account_name is not None:
+        entry["a"] = account_name
+    if amount is not None:
+        entry["amt"] = amount
+    if counterparty is not None:
+        entry["cp"] = counterparty
+    if counterparty_account is not None:
+        entry["cpa"] = counterparty_account
+    entry.update(extra)
+    return entry
+
+# Geçmiş sayfalarındaki işlem türü filtresi
+LEDGER_TYPE_LABELS = {
+    "withdraw": "Para Çekme",
+    "deposit": "Para Yatırma",
+    "internal_transfer": "Hesaplar Arası Havale",
+    "external_transfer": "Havale/EFT",
+    "fee": "Havale Ücreti",
+    "opening": "Açılış Bakiyesi",
+    "balance_inquiry": "Bakiye Sorgulama",
+    "login": "Başarılı Giriş",
+    "login_failed": "Hatalı Giriş",
+    "password_changed": "Parola Değişikliği",
+    "interest": "Faiz",
+    "account_fee": "Hesap İşletim Ücreti",
+    "legacy": "Eski Kayıt"
+}
+
+def format_ledger_entry(entry, show_account=False):
+    """Renders a ledger entry as the history line the pages show."""
+    if entry["type"] == "legacy":
+        return entry["note"]
+    amount = abs(entry.get("amt", 0))
+    kind = entry["type"]
+    if kind == "withdraw":
+        text = f"Para Çekme: {amount:.2f} TL. Kalan Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "deposit":
+        text = f"Para Yatırma: {amount:.2f} TL. Güncel Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "internal_transfer" and entry["amt"] < 0:
+        text = f"Hesaplar Arası Havale: {amount:.2f} TL ({entry['cpa']} hesabına). Kalan Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "internal_transfer":
+        text = f"Hesaplar Arası Havale: {amount:.2f} TL ({entry['cpa']} hesabından). Güncel Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "external_transfer" and entry["amt"] < 0:
+        text = f"Havale/EFT: {amount:.2f} TL (alıcı: {entry['cp']} - {entry['cpa']}). Kalan Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "external_transfer":
+        text = f"Havale/EFT: {amount:.2f} TL (gönderen: {entry['cp']} - {entry['cpa']}). Güncel Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "fee":
+        text = f"Havale Ücreti: {amount:.2f} TL. Kalan Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "interest":
+        text = f"Faiz: {amount:.2f} TL. Güncel Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "account_fee":
+        text = f"Hesap İşletim Ücreti: {amount:.2f} TL. Kalan Bakiye: {entry['bal']:.2f} TL"
+    elif kind == "opening":
+        text = f"Açılış Bakiyesi: {amount:.2f} TL"
+    elif kind == "balance_inquiry":
+        text = f"Bakiye Sorgulama: {entry['bal']:.2f} TL"
+    elif kind == "login":
+        text = "Başarılı giriş."
+    elif kind == "login_failed":
+        text = "Hatalı giriş denemesi."
+    elif kind == "password_changed":
+        text = "Parola değiştirildi."
     else:
-        print("'users.json' dosyası bulunamadı veya boş. Yeni bir kullanıcı sözlüğü oluşturuluyor.")
-        users = {}
-
-    # Ensure all users have lockout and new fields for backward compatibility
-    for user_data in users.values():
-        user_data.setdefault("failed_password_attempts", 0)
-        user_data.setdefault("lockout_until", None)
-        user_data.setdefault("security_question", "")
-        user_data.setdefault("security_answer", "")
-        user_data.setdefault("daily_withdrawal_limit", 10000.0)
-        user_data.setdefault("current_day_withdrawal_amount", 0.0)
-        user_data.setdefault("last_withdrawal_date", None)
-        user_data.setdefault("user_history", [])
+        text = kind
+    if show_account and "a" in entry:
+        text = f"({entry['a']}) {text}"
+    # Aktarılan eski işlemler kendi tarihleriyle gösterilir
+    return f"[{entry.get('vt', entry['t'])}] {text}"
 
 def save_user_data():
-    """Saves user data to users.json file."""
-    global users
+    """Writes every dirty user to storage; persistence_lock must be held."""
+    started = time.perf_counter()
     try:
-        with open(USERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(users, f, indent=4, ensure_ascii=False)
-        print("Kullanıcı verileri 'users.json' dosyasına başarıyla kaydedildi.")
+        users.write_back()
+        metrics.observe('atm_save_user_data_seconds', (), time.perf_counter() - started)
+        return True
     except Exception as e:
         print(f"Hata: Kullanıcı verileri kaydedilirken bir sorun oluştu: {e}")
+        return False
+
+def apply_change(username, change, replay=False):
+    """Applies one user's part of a journal record to the users cache.
+
+    Postings ("p") move the cached balance of their account by "amt" and
+    record the resulting balance in "bal", so replaying a posting just sets
+    the balance again and gives the same result.
+    """
+    if "new" in change:
+        users.add(username, copy.deepcopy(change["new"]))
+    user_data = users[username]
+    for account_name, balance in change.get("b", {}).items():
+        # Defter öncesi günlük kayıtları: [fark, yeni bakiye]
+        user_data["accounts"][account_name]["bakiye"] = balance[1]
+    user_data.update(change.get("f", {}))
+    if "new" in change or "lockout_until" in change.get("f", {}):
+        lockout_index.set(username, user_data["lockout_until"])
+    for entry in change.get("p", []):
+        if "amt" in entry:
+            account = user_data["accounts"][entry["a"]]
+            if replay:
+                account["bakiye"] = entry["bal"]
+            else:
+                account["bakiye"] += entry["amt"]
+                entry["bal"] = account["bakiye"]
+        if storage.keeps_history:
+            user_data["ledger"].append(entry)
+    if storage.keeps_history and ("h" in change or "ah" in change):
+        # Defter öncesi günlük kayıtlarındaki metin geçmişleri
+        user_data["ledger"].extend({"id": 0, "t": entry[1:20], "type": "legacy", "note": entry} for entry in change.get("h", []))
+        for account_name, entries in change.get("ah", {}).items():
+            user_data["ledger"].extend({"id": 0, "t": entry[1:20], "type": "legacy", "a": account_name, "note": entry} for entry in entries)
+
+def commit_changes(*changes, sync=False):
+    """Applies (username, change) pairs and queues them for the journal as one record.
 
-# Flask uygulamasının kapatıldıktan sonra çağrılacak olaylar
-@app.teardown_appcontext
-def save_data_on_shutdown(exception=None):
-    save_user_data()
+    A change may contain "new" (a whole user record), "f" (user fields to set)
+    and "p" (ledger entries built with posting()). Every entry of the record
+    gets the record's sequence number as its transaction id. Changes that touch
+    several users, like an external transfer, are written on a single line so
+    they replay together.
+
+    Records are written by the background flusher; with sync=True the record is
+    flushed and fsync'ed before returning, which money-moving routes rely on.
+    With SHARED_STORAGE every record is written and committed to the database
+    right away, inside the caller's locked() transaction if there is one.
+    """
+    if not SHARED_STORAGE:
+        write_record(changes, sync)
+        return
+    try:
+        with storage.transaction():
+            for username, change in changes:
+                if "new" not in change:
+                    users.refresh(username)
+            write_record(changes, sync)
+    except BaseException:
+        for username, change in changes:
+            users.discard(username)
+        raise
+
+def write_record(changes, sync):
+    global journal_seq, sync_pending_seq
+    started = time.perf_counter()
+    with persistence_lock:
+        metrics.observe('atm_lock_wait_seconds', (('lock', 'persistence'),), time.perf_counter() - started)
+        journal_seq = storage.next_seq() if SHARED_STORAGE else journal_seq + 1
+        # Hemen diske yazılacak kayıt yazılamazsa önbellekteki etkisi geri alınır
+        flush_now = sync and not SHARED_STORAGE and not getattr(deferred_sync, 'active', False)
+        saved = [saved_user_state(username, change) for username, change in changes] if flush_now else None
+        now = datetime.datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        for username, change in changes:
+            for entry in change.get("p", []):
+                entry["id"] = journal_seq
+                entry["t"] = timestamp
+            metrics.inc('atm_ledger_entries_committed_total', amount=len(change.get("p", [])))
+            apply_change(username, change)
+        record = {"s": journal_seq, "t": now.isoformat(timespec='seconds'), "c": [list(item) for item in changes]}
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        # Kaydın boyutu değişen kullanıcılara paylaştırılır (toplu kayıtlarda her birine tamamı değil)
+        grown = len(line) // len(changes)
+        for username, change in changes:
+            users.mark_dirty(username, journal_seq, grown)
+        flush_stats["commits"] += 1
+        if SHARED_STORAGE:
+            # Kayıt açık işlemle birlikte yazılır; işlem bitince diğer işçiler de görür
+            storage.append_records([(record, line)])
+            return
+        pending_records.append((record, line))
+        if sync:
+            flush_stats["sync_commits"] += 1
+            if getattr(deferred_sync, 'active', False):
+                # Yazıcı görevi bu kaydı ilk fırsatta (diğerleriyle birlikte) fsync ile yazar
+                sync_pending_seq = deferred_sync.seq = journal_seq
+            elif not flush_journal_locked(fsync=True):
+                pending_records.pop()
+                journal_seq -= 1
+                for (username, change), state in reversed(list(zip(changes, saved))):
+                    restore_user_state(username, change, state)
+                raise JournalWriteError()
+        elif len(pending_records) >= FLUSH_BATCH_SIZE:
+            flush_condition.notify()
+
+def saved_user_state(username, change):
+    """What restore_user_state needs to take change back out of the users cache."""
+    if "new" in change:
+        return None
+    entry = users.entry(username)
+    user_data = entry[0]
+    return {
+        "fields": {key: user_data.get(key) for key in change.get("f", {})},
+        "balances": {item["a"]: user_data["accounts"][item["a"]]["bakiye"] for item in change.get("p", []) if "amt" in item},
+        "ledger": len(user_data["ledger"]),
+        "entry": entry[1:]
+    }
+
+def restore_user_state(username, change, state):
+    """Undoes apply_change and mark_dirty for a record that could not be written; persistence_lock must be held."""
+    with ledger_index_lock:
+        ledger_indexes.pop(username, None)
+    # Limit sayaçları geri alınan işlemi de saymış olabilir; defterden yeniden kurulur
+    limits.forget(username)
+    if state is None:
+        users.discard(username)
+        return
+    user_data = users[username]
+    user_data.update(state["fields"])
+    for account_name, balance in state["balances"].items():
+        user_data["accounts"][account_name]["bakiye"] = balance
+    del user_data["ledger"][state["ledger"]:]
+    users.restore(username, *state["entry"])
+    if "lockout_until" in state["fields"]:
+        lockout_index.set(username, user_data["lockout_until"])
+
+def flush_journal_locked(fsync=False):
+    """Hands every pending record to storage in one batch; persistence_lock must be held.
+
+    The batch is fsync'ed when asked to, and also when it holds a record whose
+    sync was deferred to the ASGI writer, so no flush path can write such a
+    record without making it durable. Returns False if storage could not take
+    the batch; the records then stay pending for the next flush.
+    """
+    global journal_record_count, synced_seq
+    if not pending_records:
+        return True
+    fsync = fsync or sync_pending_seq > synced_seq
+    started = time.perf_counter()
+    try:
+        storage.append_records(pending_records, fsync)
+    except Exception as e:
+        print(f"Hata: Günlük kaydı yazılırken bir sorun oluştu: {e}")
+        metrics.inc('atm_journal_write_errors_total')
+        return False
+    metrics.observe('atm_journal_flush_seconds', (), time.perf_counter() - started)
+    metrics.inc('atm_journal_bytes_written_total', amount=sum(len(line) for record, line in pending_records))
+    written = len(pending_records)
+    if fsync:
+        synced_seq = pending_records[-1][0]["s"]
+    pending_records.clear()
+    journal_record_count += written
+    flush_stats["flushes"] += 1
+    flush_stats["records_written"] += written
+    flush_stats["coalesced_writes"] += written - 1
+    return True
+
+def flush_journal(fsync=False):
+    with persistence_lock:
+        flush_journal_locked(fsync)
+
+def user_ledger_page(username, user_data, *args, **kwargs):
+    """storage.ledger_page, after flushing pending records of username.
+
+    The sqlite ledger only holds records the flusher has written, so without
+    this a page could leave out a login or balance inquiry made a moment ago
+    (or a sync commit whose write the ASGI bridge deferred).
+    """
+    if not storage.keeps_history:
+        with persistence_lock:
+            if any(name == username for record, line in pending_records for name, change in record["c"]):
+                flush_journal_locked()
+    return storage.ledger_page(username, user_data, *args, **kwargs)
+
+def flusher_loop():
+    """Background writer: flushes pending records every interval or when a batch fills up."""
+    while True:
+        with flush_condition:
+            flush_condition.wait_for(lambda: len(pending_records) >= FLUSH_BATCH_SIZE or users.total_bytes > users.max_bytes, timeout=FLUSH_INTERVAL_SECONDS)
+            flush_journal_locked()
+            # Checkpoint ve hafızadan çıkarma yalnızca burada yapılır, böylece istekler diske yazmayı beklemez
+            if journal_record_count >= JOURNAL_CHECKPOINT_RECORDS:
+                checkpoint_user_data_locked()
+            if users.total_bytes > users.max_bytes:
+                users.write_back(only_over_budget=True)
+
+def start_flusher():
+    global flusher_thread
+    if flusher_thread is None:
+        flusher_thread = threading.Thread(target=flusher_loop, name="journal-flusher", daemon=True)
+        flusher_thread.start()
+
+def lockout_sweeper_loop():
+    while True:
+        time.sleep(LOCKOUT_SWEEP_INTERVAL_SECONDS)
+        lockout_index.sweep()
+
+def start_lockout_sweeper():
+    global lockout_sweeper_thread
+    if lockout_sweeper_thread is None:
+        lockout_sweeper_thread = threading.Thread(target=lockout_sweeper_loop, name="lockout-sweeper", daemon=True)
+        lockout_sweeper_thread.start()
+
+@atexit.register
+def flush_on_exit():
+    if PASSWORD_POOL_PROCESS:
+        return  # Günlük ana süreçte yazılır
+    flush_journal(fsync=True)
+    print(f"Günlük istatistikleri: {flush_stats}")
+
+def replay_journal():
+    """Re-applies journal records that are newer than the stored copy of each user they touch."""
+    global journal_record_count, journal_seq
+    replayed = 0
+    journal_record_count = 0
+    with persistence_lock:
+        for record in storage.read_records():
+            if "c" not in record:
+                # Checkpoint sonrası yazılan başlık satırı: sıra numarası buradan devam eder
+                journal_seq = record["seq"]
+                continue
+            # Sıra numarası olmayan eski kayıtlar sırayla numaralandırılır
+            journal_seq = record.get("s", journal_seq + 1)
+            journal_record_count += 1
+            applied = False
+            # Bir kayıt aynı kullanıcı için birden çok değişiklik taşıyabilir (ör. içe
+            # aktarma partisi); atlanacak kullanıcılar ilk değişiklik uygulanmadan,
+            # kayıt başına bir kez belirlenir
+            written = {}
+            for username, change in record["c"]:
+                if username not in written:
+                    entry = users.entry(username)
+                    written[username] = entry is not None and entry[2] >= journal_seq
+                if written[username]:
+                    continue  # Bu kayıt kullanıcının dosyasına zaten yazılmış
+                if "new" in change:
+                    upgrade_user_record(change["new"])
+                elif users.entry(username) is None:
+                    continue
+                apply_change(username, change, replay=True)
+                users.mark_dirty(username, journal_seq)
+                applied = True
+            replayed += applied
+            if users.total_bytes > users.max_bytes:
+                users.write_back(only_over_budget=True)
+    return replayed
+
+def checkpoint_user_data():
+    with persistence_lock:
+        flush_journal_locked()
+        checkpoint_user_data_locked()
+
+def checkpoint_user_data_locked():
+    """Writes dirty users to storage and empties the journal; persistence_lock must be held."""
+    global journal_record_count
+    if journal_record_count == 0 and not users.dirty_count():
+        return
+    if not save_user_data():
+        return
+    storage.reset_records(journal_seq)
+    journal_record_count = 0
+    flush_stats["checkpoints"] += 1
+
+class JournalWriteError(Exception):
+    """Raised by commit_changes(sync=True) when the record could not be written; the change is undone."""
+
+JOURNAL_WRITE_ERROR_MESSAGE = "Hata: İşlem kaydedilemediği için yapılmadı. Lütfen daha sonra tekrar deneyiniz."
+
+class PasswordPoolBusy(Exception):
+    """Raised when PASSWORD_QUEUE_DEPTH password jobs are already queued."""
+
+PASSWORD_POOL_BUSY_MESSAGE = "Sistem şu anda çok yoğun. Lütfen birkaç saniye sonra tekrar deneyiniz."
+
+def get_password_pool():
+    global password_pool
+    with password_pool_lock:
+        if password_pool is None:
+            # Bu süreçte yazıcı, kilit süpürücü ve profil iş parçacıkları ile açık sqlite
+            # bağlantıları var; fork ile kopyalanan çocuklar kilitlenebilir. forkserver
+            # (yoksa spawn) çocukları temiz bir süreçten başlatır; çocuklar bu dosyayı
+            # yeniden yükler ama depoyu açmaz, yazıcıyı başlatmaz (PASSWORD_POOL_PROCESS)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            password_pool = concurrent.futures.ProcessPoolExecutor(PASSWORD_POOL_WORKERS, mp_context=context)
+        return password_pool
+
+@atexit.register
+def shutdown_password_pool():
+    if password_pool is not None:
+        password_pool.shutdown(wait=False, cancel_futures=True)
+
+def pbkdf2(password, salt, iterations):
+    """Runs PBKDF2 in the process pool so request threads only wait for the result.
+
+    Raises PasswordPoolBusy if no queue slot frees up within
+    PASSWORD_QUEUE_TIMEOUT_SECONDS, so a login burst is turned away instead of
+    piling up behind the pool.
+    """
+    if not password_slots.acquire(timeout=PASSWORD_QUEUE_TIMEOUT_SECONDS):
+        raise PasswordPoolBusy()
+    try:
+        return get_password_pool().submit(hashlib.pbkdf2_hmac, 'sha256', password.encode('utf-8'), salt, iterations).result()
+    finally:
+        password_slots.release()
+
+def hash_password(password):
+    """Returns 'pbkdf2_sha256$<iterations>$<salt>$<hash>' for password."""
+    salt = secrets.token_bytes(16)
+    digest = pbkdf2(password, salt, PASSWORD_HASH_ITERATIONS)
+    return f"{PASSWORD_HASH_PREFIX}${PASSWORD_HASH_ITERATIONS}${salt.hex()}${digest.hex()}"
+
+def verify_password(stored, password):
+    """Returns (matches, needs_rehash) for a stored password.
+
+    Old records keep the password as plain text; those, and hashes made with
+    a different iteration count, need a rehash once the password is known.
+    """
+    if not stored.startswith(PASSWORD_HASH_PREFIX + '$'):
+        return secrets.compare_digest(stored.encode('utf-8'), password.encode('utf-8')), True
+    _, iterations, salt, digest = stored.split('$')
+    matches = secrets.compare_digest(pbkdf2(password, bytes.fromhex(salt), int(iterations)).hex(), digest)
+    return matches, int(iterations) != PASSWORD_HASH_ITERATIONS
+
+def new_user_change(parola_özeti, güvenlik_sorusu, güvenlik_cevabı):
+    """Returns the journal change register_user_web commits for a new user."""
+    new_user = {
+        "parola": parola_özeti,
+        "accounts": {
+            "Vadesiz": {
+                "bakiye": 0.0
+            },
+            "Birikim": {
+                "bakiye": 0.0
+            }
+        },
+        "failed_password_attempts": 0,
+        "lockout_until": None,
+        "security_question": güvenlik_sorusu,
+        "security_answer": güvenlik_cevabı,
+        "daily_withdrawal_limit": 10000.0,
+        "last_end_of_day": None,
+        "ledger": []
+    }
+    # Varsayılan 50.000 TL, Vadesiz hesabın açılış kaydı olarak deftere yazılır
+    return {"new": new_user, "p": [posting("opening", "Vadesiz", 50000.0, FEE_ACCOUNT)]}
 
 # Adapted register_user for Flask
 def register_user_web(kullanıcı_adı, parola, güvenlik_sorusu, güvenlik_cevabı):
@@ -71,29 +2342,28 @@ def register_user_web(kullanıcı_adı, parola, güvenlik_sorusu, güvenlik_ceva
     if not has_uppercase or not has_digit:
         return False, "Hata: Parola en az bir büyük harf ve bir rakam içermelidir."
 
-    users[kullanıcı_adı] = {
-        "parola": parola,
-        "accounts": {
-            "Vadesiz": {
-                "bakiye": 50000.0,
-                "işlem_geçmişi": []
-            },
-            "Birikim": {
-                "bakiye": 0.0,
-                "işlem_geçmişi": []
-            }
-        },
-        "failed_password_attempts": 0,
-        "lockout_until": None,
-        "security_question": güvenlik_sorusu,
-        "security_answer": güvenlik_cevabı,
-        "daily_withdrawal_limit": 10000.0,
-        "current_day_withdrawal_amount": 0.0,
-        "last_withdrawal_date": None,
-        "user_history": []
-    }
-    save_user_data()
-    return True, f"Kullanıcı '{kullanıcı_adı}' başarıyla kaydedildi. Varsayılan hesaplar oluşturuldu."
+    # Özetleme kilit dışında yapılır, kilit yalnızca kaydı yazarken tutulur
+    try:
+        parola_özeti = hash_password(parola)
+    except PasswordPoolBusy:
+        return False, PASSWORD_POOL_BUSY_MESSAGE
+
+    # Aynı adla eş zamanlı iki kayıt birbirini ezmesin diye
+    with lock_manager.locked((kullanıcı_adı, None)):
+        if kullanıcı_adı in users:
+            return False, f"Hata: '{kullanıcı_adı}' kullanıcı adı zaten alınmış. Lütfen başka bir kullanıcı adı seçiniz."
+
+        commit_changes((kullanıcı_adı, new_user_change(parola_özeti, güvenlik_sorusu, güvenlik_cevabı)), sync=True)
+        return True, f"Kullanıcı '{kullanıcı_adı}' başarıyla kaydedildi. Varsayılan hesaplar oluşturuldu."
+
+def login_lockout_message(username):
+    """Returns the lockout message while the user is locked out, otherwise None."""
+    remaining_seconds = lockout_index.remaining(username)
+    if remaining_seconds:
+        hours, remainder = divmod(remaining_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        return f"Hesabınız kilitli. Lütfen {int(hours)} saat {int(minutes)} dakika {int(seconds)} sonra tekrar deneyiniz."
+    return None
 
 # Adapted login for Flask
 def login_web(kullanıcı_adı, parola):
@@ -101,59 +2371,525 @@ def login_web(kullanıcı_adı, parola):
     if kullanıcı_adı not in users:
         return False, "Kullanıcı Adı Bulunamadı...", None
 
-    user_data = users[kullanıcı_adı]
-    if user_data["lockout_until"] and datetime.datetime.fromisoformat(user_data["lockout_until"]) > datetime.datetime.now():
-        locked_until_dt = datetime.datetime.fromisoformat(user_data["lockout_until"])
-        remaining_time = locked_until_dt - datetime.datetime.now()
-        hours, remainder = divmod(remaining_time.total_seconds(), 3600)
-        minutes, seconds = divmod(remainder, 60)
-        return False, f"Hesabınız kilitli. Lütfen {int(hours)} saat {int(minutes)} dakika {int(seconds)} sonra tekrar deneyiniz.", None
-
-    if user_data["parola"] == parola:
-        user_data["failed_password_attempts"] = 0
-        user_data["lockout_until"] = None
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        user_data["user_history"].append(f"[{timestamp}] Başarılı giriş.")
-        save_user_data()
-        return True, "Başarıyla Giriş Yaptınız...", kullanıcı_adı
-    else:
-        user_data["failed_password_attempts"] += 1
-        MAX_LOGIN_ATTEMPTS = 3
-        if user_data["failed_password_attempts"] >= MAX_LOGIN_ATTEMPTS:
-            lockout_duration_minutes = 2 ** user_data["failed_password_attempts"]
-            lockout_time = datetime.datetime.now() + datetime.timedelta(minutes=lockout_duration_minutes)
-            user_data["lockout_until"] = lockout_time.isoformat()
-            message = f"Çok fazla hatalı deneme. Hesabınız {lockout_duration_minutes} dakika kilitlendi."
+    lockout_message = login_lockout_message(kullanıcı_adı)
+    if lockout_message:
+        return False, lockout_message, None
+
+    # Parola kontrolü kilit dışında, süreç havuzunda yapılır
+    try:
+        password_ok, needs_rehash = verify_password(users[kullanıcı_adı]["parola"], parola)
+        new_password_hash = hash_password(parola) if password_ok and needs_rehash else None
+    except PasswordPoolBusy:
+        return False, PASSWORD_POOL_BUSY_MESSAGE, None
+
+    with lock_manager.locked((kullanıcı_adı, None)):
+        user_data = users[kullanıcı_adı]
+        lockout_message = login_lockout_message(kullanıcı_adı)
+        if lockout_message:
+            return False, lockout_message, None
+
+        if password_ok:
+            fields = {"failed_password_attempts": 0, "lockout_until": None}
+            if new_password_hash:
+                # Düz metin (veya eski ayarlarla özetlenmiş) parola yeni özetle değiştirilir
+                fields["parola"] = new_password_hash
+            commit_changes((kullanıcı_adı, {"f": fields, "p": [posting("login")]}))
+            return True, "Başarıyla Giriş Yaptınız...", kullanıcı_adı
+        else:
+            failed_attempts = user_data["failed_password_attempts"] + 1
+            fields = {"failed_password_attempts": failed_attempts}
+            MAX_LOGIN_ATTEMPTS = 3
+            if failed_attempts >= MAX_LOGIN_ATTEMPTS:
+                lockout_duration_minutes = 2 ** failed_attempts
+                lockout_time = datetime.datetime.now() + datetime.timedelta(minutes=lockout_duration_minutes)
+                fields["lockout_until"] = lockout_time.isoformat()
+                message = f"Çok fazla hatalı deneme. Hesabınız {lockout_duration_minutes} dakika kilitlendi."
+            else:
+                message = "Parola Hatalı..."
+            commit_changes((kullanıcı_adı, {"f": fields, "p": [posting("login_failed")]}))
+            return False, message, None
+
+class WindowCounter:
+    """Kuruş and operation totals of one limit rule over a sliding window.
+
+    The window is split into fixed buckets kept in a ring; advance() clears
+    the buckets that fell out of the window and keeps running totals, so a
+    check reads two integers. The window slides a bucket at a time.
+    """
+
+    __slots__ = ("bucket_seconds", "amounts", "counts", "newest", "amount", "count")
+
+    def __init__(self, window_seconds, bucket_seconds, now):
+        self.bucket_seconds = bucket_seconds
+        self.amounts = [0] * max(1, window_seconds // bucket_seconds)
+        self.counts = [0] * len(self.amounts)
+        self.newest = int(now // bucket_seconds)
+        self.amount = 0
+        self.count = 0
+
+    def advance(self, now):
+        bucket = int(now // self.bucket_seconds)
+        size = len(self.amounts)
+        if bucket - self.newest >= size:
+            self.amounts = [0] * size
+            self.counts = [0] * size
+            self.amount = self.count = 0
         else:
-            message = "Parola Hatalı..."
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        user_data["user_history"].append(f"[{timestamp}] Hatalı giriş denemesi.")
-        save_user_data()
-        return False, message, None
+            for expired in range(self.newest + 1, bucket + 1):
+                slot = expired % size
+                self.amount -= self.amounts[slot]
+                self.count -= self.counts[slot]
+                self.amounts[slot] = self.counts[slot] = 0
+        self.newest = max(self.newest, bucket)
+
+    def add(self, when, kuruş, count):
+        bucket = min(int(when // self.bucket_seconds), self.newest)
+        if bucket <= self.newest - len(self.amounts):
+            return
+        slot = bucket % len(self.amounts)
+        self.amounts[slot] += kuruş
+        self.counts[slot] += count
+        self.amount += kuruş
+        self.count += count
+
+class LimitRule:
+    """One entry of LIMIT_RULES."""
+
+    def __init__(self, label, operation, window, bucket, max_amount=None, max_count=None, channel=None):
+        self.label = label
+        self.operation = operation
+        self.window = int(window)
+        self.bucket = int(bucket)
+        self.max_amount = max_amount
+        self.max_count = max_count
+        self.channel = channel
+
+    def window_text(self):
+        if self.window % 3600 == 0:
+            return f"{self.window // 3600} saat"
+        return f"{self.window // 60} dakika"
+
+    def error(self, counter, user_data, kuruş, count):
+        """Returns why kuruş more in count operations would break the rule, or None."""
+        max_amount = user_data[self.max_amount] if isinstance(self.max_amount, str) else self.max_amount
+        if max_amount is not None and counter.amount + kuruş > round(max_amount * 100):
+            used = counter.amount / 100
+            return f"Hata: {self.label} limitini aşmaktasınız. Kalan limitiniz: {max_amount - used:.2f} TL. Son {self.window_text()} içinde yapılan: {used:.2f} TL."
+        if self.max_count is not None and counter.count + count > self.max_count:
+            return f"Hata: {self.label} işlem sayısı limitine ulaştınız. Son {self.window_text()} içinde en fazla {self.max_count} işlem yapabilirsiniz."
+        return None
+
+class LimitsEngine:
+    """Checks money-moving operations against LIMIT_RULES.
+
+    Each user gets one WindowCounter per rule, kept for the LIMIT_COUNTER_USERS
+    most recently active users. Counters of a user seen for the first time (or
+    again after eviction or a restart) are rebuilt from the user's outgoing
+    ledger postings inside the longest window; the channel is read from the
+    "ch" field of those postings. The ledger is read without any lock held;
+    each user's counters have a lock of their own, and self.lock only guards
+    the LRU dict.
+    """
+
+    def __init__(self, rules, max_users):
+        self.rules = [LimitRule(**rule) for rule in rules]
+        self.lookback = max((rule.window for rule in self.rules), default=0)
+        self.max_users = max_users
+        self.counters = collections.OrderedDict()  # kullanıcı adı -> (kilit, kural sırasıyla WindowCounter listesi)
+        self.lock = threading.Lock()
+
+    def matching(self, operation, channel):
+        return [(index, rule) for index, rule in enumerate(self.rules) if rule.operation == operation and rule.channel in (None, channel)]
+
+    def load_counters(self, username, user_data):
+        now = time.time()
+        counters = [WindowCounter(rule.window, rule.bucket, now) for rule in self.rules]
+        since = datetime.datetime.fromtimestamp(now - self.lookback).strftime("%Y-%m-%d %H:%M:%S")
+        for operation in {rule.operation for rule in self.rules}:
+            before = None
+            while True:
+                entries, before = user_ledger_page(username, user_data, None, 1000, before, since, None, operation)
+                for entry in entries:
+                    if entry.get("amt", 0) >= 0:
+                        continue
+                    # Aktarılan eski kayıtlar asıl işlem zamanlarıyla sayılır
+                    when = datetime.datetime.strptime(entry.get("vt", entry["t"]), "%Y-%m-%d %H:%M:%S").timestamp()
+                    for index, rule in self.matching(operation, entry.get("ch", "web")):
+                        if when > now - rule.window:
+                            counters[index].add(when, round(-entry["amt"] * 100), 1)
+                if before is None:
+                    break
+        return counters
+
+    def user_counters(self, username, user_data):
+        """Returns (lock, counters) of username, rebuilding the counters from the ledger if needed."""
+        with self.lock:
+            entry = self.counters.get(username)
+            if entry is not None:
+                self.counters.move_to_end(username)
+                return entry
+        # Defter hiçbir kilit tutulmadan okunur; aynı anda kurulan iki listeden ilki kalır
+        entry = (threading.Lock(), self.load_counters(username, user_data))
+        with self.lock:
+            entry = self.counters.setdefault(username, entry)
+            self.counters.move_to_end(username)
+            while len(self.counters) > self.max_users:
+                self.counters.popitem(last=False)
+        return entry
+
+    def first_error(self, counters, rules, user_data, kuruş, count, now):
+        for index, rule in rules:
+            counters[index].advance(now)
+            error = rule.error(counters[index], user_data, kuruş, count)
+            if error:
+                return error
+        return None
+
+    def check(self, username, user_data, operation, channel, amount, count=1, entry=None):
+        """Returns the message of the first rule amount would break, or None.
+
+        entry is a (lock, counters) pair from user_counters, for callers that
+        check many amounts of one user in a row.
+        """
+        rules = self.matching(operation, channel)
+        if not rules:
+            return None
+        lock, counters = entry or self.user_counters(username, user_data)
+        with lock:
+            return self.first_error(counters, rules, user_data, round(amount * 100), count, time.time())
+
+    def record(self, username, user_data, operation, channel, amount, count=1):
+        rules = self.matching(operation, channel)
+        if not rules:
+            return
+        lock, counters = self.user_counters(username, user_data)
+        now = time.time()
+        with lock:
+            for index, rule in rules:
+                counters[index].advance(now)
+                counters[index].add(now, round(amount * 100), count)
+
+    def forget(self, username):
+        """Drops username's counters; they are rebuilt from the ledger on next use."""
+        with self.lock:
+            self.counters.pop(username, None)
+
+    def reserve(self, username, user_data, operation, channel, amount, count=1, entry=None):
+        """check() and, if every rule passes, record() as one step."""
+        rules = self.matching(operation, channel)
+        if not rules:
+            return None
+        lock, counters = entry or self.user_counters(username, user_data)
+        kuruş = round(amount * 100)
+        now = time.time()
+        with lock:
+            error = self.first_error(counters, rules, user_data, kuruş, count, now)
+            if error is None:
+                for index, rule in rules:
+                    counters[index].add(now, kuruş, count)
+            return error
+
+# Ortak modda sayaçlar tutulmaz: diğer işçilerin işlemleri de sayılsın diye her
+# kontrolde, veritabanı kilidi altında defterden yeniden kurulur
+limits = LimitsEngine(LIMIT_RULES, 0 if SHARED_STORAGE else LIMIT_COUNTER_USERS)
+
+def withdrawal_error(balance, amount):
+    """Returns why amount cannot be withdrawn, or None if the withdrawal is allowed.
+
+    The daily limit is left to the limits engine.
+    """
+    if amount <= 0:
+        return "Hata: Çekilecek tutar pozitif olmalıdır."
+    if balance - amount < 0:
+        return f"Yetersiz bakiye! Hesabınızda {balance:.2f} TL var."
+    if amount < 50 or amount % 50 != 0:
+        return "En az 50 TL ve 50'nin katlarında para çekebilirsiniz."
+    return None
+
+def deposit_error(amount):
+    """Returns why amount cannot be deposited, or None if the deposit is allowed."""
+    if amount <= 0:
+        return "Hata: Yatırılacak tutar pozitif olmalıdır."
+    if amount < 50 or amount % 50 != 0:
+        return "En az 50 TL ve 50'nin katlarında para yatırabilirsiniz."
+    return None
+
+def withdraw_web(username, account_name, amount, channel="web"):
+    """Withdraws amount from one of the user's accounts; returns (success, message)."""
+    with lock_manager.locked((username, account_name), (username, None)):
+        user_data = users[username]
+        selected_account = user_data['accounts'][account_name]
+
+        error = withdrawal_error(selected_account["bakiye"], amount) or limits.reserve(username, user_data, "withdraw", channel, amount)
+        if error:
+            return False, error
+
+        commit_changes((username, {"p": [posting("withdraw", account_name, -amount, CASH_ACCOUNT, ch=channel)]}), sync=True)
+        return True, f"Çekilen tutar: {amount:.2f} TL. Kalan bakiye: {selected_account['bakiye']:.2f} TL"
+
+def deposit_web(username, account_name, amount):
+    """Deposits amount into one of the user's accounts; returns (success, message)."""
+    with lock_manager.locked((username, account_name)):
+        selected_account = users[username]['accounts'][account_name]
+
+        error = deposit_error(amount)
+        if error:
+            return False, error
+
+        commit_changes((username, {"p": [posting("deposit", account_name, amount, CASH_ACCOUNT)]}), sync=True)
+        return True, f"Yatırılan tutar: {amount:.2f} TL. Güncel bakiye: {selected_account['bakiye']:.2f} TL"
+
+def internal_transfer_web(username, source_account_name, destination_account_name, amount, channel="web"):
+    """Moves amount between two accounts of the same user; returns (success, message)."""
+    if source_account_name == destination_account_name:
+        return False, "Hata: Kaynak ve hedef hesap aynı olamaz. Lütfen farklı bir hedef hesap seçiniz."
+    if amount <= 0:
+        return False, "Hata: Transfer tutarı pozitif olmalıdır."
+
+    with lock_manager.locked((username, source_account_name), (username, destination_account_name)):
+        user_accounts = users[username]['accounts']
+        if source_account_name not in user_accounts or destination_account_name not in user_accounts:
+            return False, "Hata: Geçersiz kaynak veya hedef hesap seçimi."
+
+        source_account = user_accounts[source_account_name]
+
+        if source_account["bakiye"] < amount:
+            return False, f"Yetersiz bakiye! {source_account_name} hesabınızda {source_account['bakiye']:.2f} TL var."
+        error = limits.reserve(username, users[username], "internal_transfer", channel, amount)
+        if error:
+            return False, error
+
+        commit_changes((username, {"p": [
+            posting("internal_transfer", source_account_name, -amount, username, destination_account_name, ch=channel),
+            posting("internal_transfer", destination_account_name, amount, username, source_account_name)
+        ]}), sync=True)
+        return True, f"Transfer başarılı! {source_account_name} hesabından {destination_account_name} hesabına {amount:.2f} TL gönderildi."
+
+def external_transfer_web(username, account_name, recipient_username, recipient_account_name, amount, channel="web"):
+    """Sends amount to another user's account and charges HAVALE_UCRETI; returns (success, message)."""
+    if amount <= 0:
+        return False, "Hata: Gönderilecek tutar pozitif olmalıdır."
+    if recipient_username == username:
+        return False, "Hata: Kendi hesabınıza harici havale yapamazsınız. Hesaplarım Arası Havale'yi kullanın."
+    if recipient_username not in users:
+        return False, "Hata: Belirtilen kullanıcı bulunamadı."
+
+    with lock_manager.locked((username, account_name), (recipient_username, recipient_account_name)):
+        selected_account = users[username]['accounts'][account_name]
+        recipient_user_data = users[recipient_username]
+        if recipient_account_name not in recipient_user_data['accounts']:
+            return False, "Hata: Alıcının belirtilen hesabı bulunamadı."
+
+        total_deduction = amount + HAVALE_UCRETI
+
+        if selected_account["bakiye"] < total_deduction:
+            return False, f"Yetersiz bakiye! İşlem için {total_deduction} TL gerekmektedir. Mevcut bakiyeniz: {selected_account['bakiye']} TL."
+        error = limits.reserve(username, users[username], "external_transfer", channel, amount)
+        if error:
+            return False, error
+
+        # Gönderen ve alıcı tek günlük kaydında, aynı işlem numarasıyla yazılır
+        commit_changes(
+            (username, {"p": [
+                posting("external_transfer", account_name, -amount, recipient_username, recipient_account_name, ch=channel),
+                posting("fee", account_name, -HAVALE_UCRETI, FEE_ACCOUNT)
+            ]}),
+            (recipient_username, {"p": [
+                posting("external_transfer", recipient_account_name, amount, username, account_name)
+            ]}),
+            sync=True
+        )
+        return True, f"Transfer başarılı! '{recipient_username}' kullanıcısının '{recipient_account_name}' hesabına {amount} TL gönderildi. Havale ücreti: {HAVALE_UCRETI} TL."
+
+def batch_external_transfer_web(username, account_name, transfers, partial=False, channel="api"):
+    """Sends many external transfers from one account in a single journal record.
+
+    transfers is a list of (recipient_username, recipient_account_name, amount)
+    tuples. Every item is checked against the rules of external_transfer_web,
+    including HAVALE_UCRETI per item, while the sender and all recipient
+    accounts are locked, and the accepted items together must stay within
+    the external transfer limits. Unless partial is set, one rejected item
+    rejects the whole batch. Returns (success, message, results) with one (ok, message)
+    pair per item.
+    """
+    if not transfers:
+        return False, "Hata: Havale listesi boş.", []
+    if len(transfers) > BATCH_TRANSFER_MAX_ITEMS:
+        return False, f"Hata: Tek seferde en fazla {BATCH_TRANSFER_MAX_ITEMS} havale yapılabilir.", []
+
+    # Alıcılar kilitlerden önce yüklenir; bilinmeyen kullanıcılar burada elenir
+    known_recipients = {recipient for recipient, _, _ in transfers if recipient != username and recipient in users}
+    keys = [(username, account_name)] + [(recipient, recipient_account) for recipient, recipient_account, _ in transfers if recipient in known_recipients]
+    with lock_manager.locked(*keys):
+        user_data = users[username]
+        selected_account = user_data['accounts'][account_name]
+        available = selected_account["bakiye"]
+        sent = 0.0
+        sender_postings = []
+        recipient_postings = {}
+        results = []
+        # Sayaçlar parti başına bir kez alınır; ortak modda her çağrıda defterden
+        # kurulacakları için bu, veritabanı kilidi altında tek bir defter okumasıdır
+        limit_counters = limits.user_counters(username, user_data) if limits.matching("external_transfer", channel) else None
+        for recipient_username, recipient_account_name, amount in transfers:
+            if amount is None or amount <= 0:
+                results.append((False, "Hata: Gönderilecek tutar pozitif olmalıdır."))
+            elif recipient_username == username:
+                results.append((False, "Hata: Kendi hesabınıza harici havale yapamazsınız. Hesaplarım Arası Havale'yi kullanın."))
+            elif recipient_username not in known_recipients:
+                results.append((False, "Hata: Belirtilen kullanıcı bulunamadı."))
+            elif recipient_account_name not in users[recipient_username]['accounts']:
+                results.append((False, "Hata: Alıcının belirtilen hesabı bulunamadı."))
+            elif available < amount + HAVALE_UCRETI:
+                results.append((False, f"Yetersiz bakiye! İşlem için {amount + HAVALE_UCRETI} TL gerekmektedir. Kalan bakiye: {available} TL."))
+            else:
+                limit_error = limits.check(username, user_data, "external_transfer", channel, sent + amount, len(sender_postings) // 2 + 1, limit_counters)
+                if limit_error:
+                    results.append((False, limit_error))
+                    continue
+                available -= amount + HAVALE_UCRETI
+                sent += amount
+                sender_postings.append(posting("external_transfer", account_name, -amount, recipient_username, recipient_account_name, ch=channel))
+                sender_postings.append(posting("fee", account_name, -HAVALE_UCRETI, FEE_ACCOUNT))
+                recipient_postings.setdefault(recipient_username, []).append(
+                    posting("external_transfer", recipient_account_name, amount, username, account_name)
+                )
+                results.append((True, f"'{recipient_username}' kullanıcısının '{recipient_account_name}' hesabına {amount} TL gönderildi."))
+
+        accepted = len(sender_postings) // 2
+        rejected = len(results) - accepted
+        if accepted == 0 or (rejected and not partial):
+            return False, f"Toplu havale yapılmadı: {rejected} kalem reddedildi.", results
+        # Kalemler tek tek ön kontrolden geçti; toplam, aradaki başka işlemlere karşı tek adımda ayrılır
+        limit_error = limits.reserve(username, user_data, "external_transfer", channel, sent, accepted, limit_counters)
+        if limit_error:
+            return False, f"Toplu havale yapılmadı: {limit_error}", results
+
+        # Bütün kalemler tek günlük kaydında, aynı işlem numarasıyla yazılır
+        commit_changes(
+            (username, {"p": sender_postings}),
+            *((recipient, {"p": entries}) for recipient, entries in recipient_postings.items()),
+            sync=True
+        )
+        return True, f"Toplu havale tamamlandı: {accepted} kalem gönderildi, {rejected} kalem reddedildi. Toplam havale ücreti: {accepted * HAVALE_UCRETI:.2f} TL.", results
+
+def balance_web(username, account_name):
+    """Returns the balance of one account and records the inquiry in the ledger."""
+    current_balance = users[username]['accounts'][account_name]['bakiye']
+    commit_changes((username, {"p": [posting("balance_inquiry", account_name, bal=current_balance)]}))
+    return current_balance
+
+class StaticAsset:
+    """A file of the static folder kept in memory together with its compressed forms.
+
+    The served name carries a hash of the content, so responses can be cached
+    for a year; editing the file gives it a new name on the next start. The
+    gzip (and, when the brotli package is installed, br) bodies are built once
+    here instead of on every request.
+    """
+
+    def __init__(self, path, mimetype):
+        with open(path, 'rb') as f:
+            self.body = f.read()
+        self.digest = hashlib.sha1(self.body).hexdigest()[:16]
+        root, extension = os.path.splitext(os.path.basename(path))
+        self.name = f"{root}.{self.digest}{extension}"
+        self.mimetype = mimetype
+        self.encoded = {"gzip": gzip.compress(self.body, 9)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body)
+
+    def response(self):
+        """Builds the response for the current request, or a 304 if the client has it."""
+        encoding = next((name for name in ("br", "gzip") if name in self.encoded and request.accept_encodings[name]), None)
+        etag = f"{self.digest}-{encoding}" if encoding else self.digest
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(self.encoded[encoding] if encoding else self.body, mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f"public, max-age={STATIC_MAX_AGE_SECONDS}, immutable"
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+def load_static_assets():
+    """Reads the stylesheet into memory under its content-hashed name."""
+    global stylesheet_asset
+    stylesheet_asset = StaticAsset(os.path.join(app.static_folder, STYLESHEET_FILE), 'text/css')
+    static_assets.clear()
+    static_assets[stylesheet_asset.name] = stylesheet_asset
+
+def compile_templates():
+    """Compiles every registered template once so requests only render them."""
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiler is not None:
+        g.request_profile = profiler.begin(request.endpoint or 'not_found')
+
+@app.before_request
+def refresh_session_user():
+    # Ortak modda oturumdaki kullanıcının bakiyeleri başka bir işçide değişmiş olabilir
+    if SHARED_STORAGE and 'username' in session:
+        users.refresh(session['username'])
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'not_found'
+        metrics.inc('atm_http_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', response.status_code)))
+        metrics.observe('atm_http_request_duration_seconds', (('endpoint', endpoint),), elapsed)
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            profiler.end(profile, elapsed)
+    return response
+
+def cached_ledger_entries():
+    with users.lock:
+        entries = list(users.entries.values())
+    return [((), sum(len(entry[0]["ledger"]) for entry in entries))]
+
+metrics.collect('atm_cached_users', 'gauge', 'Users held in memory.', lambda: [((), len(users.entries))])
+metrics.collect('atm_cached_user_bytes', 'gauge', 'Approximate size of the users held in memory.', lambda: [((), users.total_bytes)])
+metrics.collect('atm_cached_ledger_entries', 'gauge', 'Ledger entries of the users held in memory (0 with the sqlite backend).', cached_ledger_entries)
+metrics.collect('atm_pending_journal_records', 'gauge', 'Committed records waiting for the flusher.', lambda: [((), len(pending_records))])
+metrics.collect('atm_locked_out_users', 'gauge', 'Users currently locked out.', lambda: [((), len(lockout_index.expiry))])
+metrics.collect('atm_journal_events_total', 'counter', 'Journal commits, flushes and checkpoints since start.', lambda: [((('event', key),), value) for key, value in flush_stats.items()])
+metrics.collect('atm_user_cache_events_total', 'counter', 'User cache hits, misses, evictions and write-backs since start.', lambda: [((('event', key),), value) for key, value in users.stats.items()])
+
+@app.route('/metrics')
+def metrics_route():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.context_processor
+def inject_stylesheet_url():
+    return {"stylesheet_url": url_for('asset_route', filename=stylesheet_asset.name)}
 
 # Flask routes
-@app.route('/')
-def home():
-    if 'username' in session:
-        return redirect(url_for('dashboard'))
-    return render_template_string('''
+@app.route('/assets/<filename>')
+def asset_route(filename):
+    asset = static_assets.get(filename)
+    if asset is None:
+        return "Dosya bulunamadı.", 404
+    return asset.response()
+
+TEMPLATES['home.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Banka Sistemi</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); text-align: center; max-width: 400px; width: 90%; animation: fadeIn 0.8s ease-out; }
-                h1 { color: #0056b3; margin-bottom: 25px; font-size: 2.5em; font-weight: 600; }
-                p { margin: 15px 0; font-size: 1.1em; line-height: 1.6; }
-                a { color: #007bff; text-decoration: none; margin: 0 15px; font-weight: 500; transition: color 0.3s ease; }
-                a:hover { color: #0056b3; text-decoration: underline; }
-                @keyframes fadeIn { from { opacity: 0; transform: translateY(-20px); } to { opacity: 1; transform: translateY(0); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-home">
             <div class="container">
                 <h1>Gökçen Bankıng welcome 44 EN BUYUK BAYBURT</h1>
                 <p>
@@ -163,46 +2899,24 @@ def home():
             </div>
         </body>
         </html>
-    ''')
+    '''
 
-@app.route('/login', methods=['GET', 'POST'])
-def login_route():
-    message = request.args.get('message', '')
-    if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
-        success, msg, logged_in_username = login_web(username, password)
-        if success:
-            session['username'] = logged_in_username
-            return redirect(url_for('dashboard'))
-        else:
-            # Explicitly redirect with the message on failure
-            return redirect(url_for('login_route', message=msg))
-    return render_template_string('''
+@app.route('/')
+def home():
+    if 'username' in session:
+        return redirect(url_for('dashboard'))
+    return render_template('home.html')
+
+TEMPLATES['login.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Giriş Yap</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 400px; width: 90%; animation: slideIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                form p { margin-bottom: 20px; text-align: left; }
-                form label { display: block; margin-bottom: 8px; color: #555; font-weight: 500; }
-                form input[type="text"], form input[type="password"] { width: calc(100% - 22px); padding: 12px; border: 1px solid #ced4da; border-radius: 8px; font-size: 1em; transition: border-color 0.3s ease, box-shadow 0.3s ease; }
-                form input[type="text"]:focus, form input[type="password"]:focus { border-color: #007bff; box-shadow: 0 0 0 0.2rem rgba(0,123,255,.25); outline: none; }
-                form input[type="submit"] { width: 100%; padding: 12px; border: none; border-radius: 8px; background-color: #007bff; color: white; font-size: 1.1em; cursor: pointer; transition: background-color 0.3s ease, transform 0.2s ease; margin-top: 20px; }
-                form input[type="submit"]:hover { background-color: #0056b3; transform: translateY(-2px); }
-                .message { color: #dc3545; text-align: center; margin-bottom: 20px; font-weight: 500; animation: shake 0.5s; }
-                .back-link { display: block; text-align: center; margin-top: 25px; color: #007bff; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #0056b3; text-decoration: underline; }
-                @keyframes slideIn { from { opacity: 0; transform: translateY(-30px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes shake { 0%, 100% { transform: translateX(0); } 10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); } 20%, 40%, 60%, 80% { transform: translateX(5px); } })
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-login">
             <div class="container">
                 <h1>Giriş Yap</h1>
                 {% if message %}<p class="message">{{ message }}</p>{% endif %}
@@ -223,45 +2937,48 @@ def login_route():
             </div>
         </body>
         </html>
-    ''', message=message)
+    '''
 
-@app.route('/register', methods=['GET', 'POST'])
-def register_route():
-    message = ""
+def login_throttle_message(username):
+    """Spends a token from the client's IP and from username's bucket.
+
+    Returns the message to show when either bucket is empty, otherwise None.
+    Throttled attempts never reach login_web, so they neither touch the user
+    record nor write to the journal.
+    """
+    retry_after = login_ip_limiter.acquire(request.remote_addr) or login_user_limiter.acquire(username)
+    if retry_after:
+        return f"Çok fazla deneme yaptınız. Lütfen {math.ceil(retry_after)} saniye sonra tekrar deneyiniz."
+    return None
+
+@app.route('/login', methods=['GET', 'POST'])
+def login_route():
+    message = request.args.get('message', '')
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        security_q = request.form['security_question']
-        security_a = request.form['security_answer']
-        success, msg = register_user_web(username, password, security_q, security_a)
-        message = msg
+        throttle_message = login_throttle_message(username)
+        if throttle_message:
+            return render_template('login.html', message=throttle_message), 429
+        success, msg, logged_in_username = login_web(username, password)
         if success:
-            return redirect(url_for('login_route', message="Kayıt başarılı! Lütfen giriş yapın."))
-    return render_template_string('''
+            session['username'] = logged_in_username
+            return redirect(url_for('dashboard'))
+        else:
+            # Explicitly redirect with the message on failure
+            return redirect(url_for('login_route', message=msg))
+    return render_template('login.html', message=message)
+
+TEMPLATES['register.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Kayıt Ol</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 500px; width: 90%; animation: slideIn 0.8s ease-out; }
-                h1 { color: #28a745; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                form p { margin-bottom: 20px; text-align: left; }
-                form label { display: block; margin-bottom: 8px; color: #555; font-weight: 500; }
-                form input[type="text"], form input[type="password"] { width: calc(100% - 22px); padding: 12px; border: 1px solid #ced4da; border-radius: 8px; font-size: 1em; transition: border-color 0.3s ease, box-shadow 0.3s ease; }
-                form input[type="text"]:focus, form input[type="password"]:focus { border-color: #28a745; box-shadow: 0 0 0 0.2rem rgba(40,167,69,.25); outline: none; }
-                form input[type="submit"] { width: 100%; padding: 12px; border: none; border-radius: 8px; background-color: #28a745; color: white; font-size: 1.1em; cursor: pointer; transition: background-color 0.3s ease, transform 0.2s ease; margin-top: 20px; }
-                form input[type="submit"]:hover { background-color: #218838; transform: translateY(-2px); }
-                .message { color: #dc3545; text-align: center; margin-bottom: 20px; font-weight: 500; animation: shake 0.5s; }
-                .back-link { display: block; text-align: center; margin-top: 25px; color: #007bff; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #0056b3; text-decoration: underline; }
-                @keyframes slideIn { from { opacity: 0; transform: translateY(-30px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes shake { 0%, 100% { transform: translateX(0); } 10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); } 20%, 40%, 60%, 80% { transform: translateX(5px); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-register">
             <div class="container">
                 <h1>Kayıt Ol</h1>
                 {% if message %}<p class="message">{{ message }}</p>{% endif %}
@@ -290,53 +3007,32 @@ def register_route():
             </div>
         </body>
         </html>
-    ''', message=message)
-
-@app.route('/dashboard')
-def dashboard():
-    if 'username' not in session:
-        return redirect(url_for('login_route'))
-    username = session['username']
-    user_data = users.get(username)
-    if not user_data:
-        return redirect(url_for('logout')) # Kullanıcı verisi bulunamazsa çıkış yap
+    '''
 
-    # Lockout check (moved here from console version)
-    if user_data["lockout_until"] and datetime.datetime.fromisoformat(user_data["lockout_until"]) > datetime.datetime.now():
-        locked_until_dt = datetime.datetime.fromisoformat(user_data["lockout_until"])
-        remaining_time = locked_until_dt - datetime.datetime.now()
-        hours, remainder = divmod(remaining_time.total_seconds(), 3600)
-        minutes, seconds = divmod(remainder, 60)
-        message = f"Hesabınız kilitli olduğu için işlem yapamazsınız. Lütfen {int(hours)} saat {int(minutes)} dakika {int(seconds)} saniye sonra tekrar deneyiniz."
-        session.pop('username', None) # Kilitliyse oturumu kapat
-        return redirect(url_for('login_route', message=message))
+@app.route('/register', methods=['GET', 'POST'])
+def register_route():
+    message = ""
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        security_q = request.form['security_question']
+        security_a = request.form['security_answer']
+        success, msg = register_user_web(username, password, security_q, security_a)
+        message = msg
+        if success:
+            return redirect(url_for('login_route', message="Kayıt başarılı! Lütfen giriş yapın."))
+    return render_template('register.html', message=message)
 
-    user_accounts = user_data['accounts']
-    return render_template_string('''
+TEMPLATES['dashboard.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Kontrol Paneli</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 600px; width: 90%; animation: fadeIn 0.8s ease-out; }
-                h1 { color: #0056b3; margin-bottom: 25px; font-size: 2.5em; font-weight: 600; text-align: center; }
-                h2 { color: #007bff; margin-top: 30px; margin-bottom: 20px; font-size: 1.8em; font-weight: 500; text-align: center; }
-                ul { list-style: none; padding: 0; margin: 20px 0; }
-                ul li { background-color: #e9ecef; padding: 15px 20px; margin-bottom: 12px; border-radius: 8px; display: flex; justify-content: space-between; align-items: center; transition: transform 0.2s ease, box-shadow 0.2s ease; }
-                ul li:hover { transform: translateY(-3px); box-shadow: 0 4px 8px rgba(0,0,0,0.1); }
-                .account-details { flex-grow: 1; text-align: left; font-size: 1.1em; }
-                .account-details strong { color: #0056b3; font-weight: 600; }
-                .account-actions a { margin-left: 15px; color: #28a745; text-decoration: none; font-weight: 500; padding: 8px 12px; border-radius: 5px; border: 1px solid #28a745; transition: background-color 0.3s ease, color 0.3s ease; }
-                .account-actions a:hover { background-color: #28a745; color: white; text-decoration: none; }
-                .logout-link { display: block; text-align: center; margin-top: 30px; color: #dc3545; text-decoration: none; font-weight: 500; font-size: 1.1em; transition: color 0.3s ease; }
-                .logout-link:hover { color: #c82333; text-decoration: underline; }
-                @keyframes fadeIn { from { opacity: 0; transform: translateY(-20px); } to { opacity: 1; transform: translateY(0); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-dashboard">
             <div class="container">
                 <h1>Hoş Geldiniz, {{ username }}!</h1>
                 <h2>Hesaplarınız:</h2>
@@ -356,47 +3052,39 @@ def dashboard():
             </div>
         </body>
         </html>
-    ''', username=username, accounts=user_accounts)
+    '''
 
-@app.route('/account/<account_name>')
-def account_operations(account_name):
+@app.route('/dashboard')
+def dashboard():
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
     user_data = users.get(username)
-    if not user_data or account_name not in user_data['accounts']:
-        return redirect(url_for('dashboard')) # Geçersiz hesap veya kullanıcı yoksa kontrol paneline dön
+    if not user_data:
+        return redirect(url_for('logout')) # Kullanıcı verisi bulunamazsa çıkış yap
 
-    selected_account = user_data['accounts'][account_name]
-    message = request.args.get('message', '') # Get messages from redirects
+    # Lockout check (moved here from console version)
+    remaining_seconds = lockout_index.remaining(username)
+    if remaining_seconds:
+        hours, remainder = divmod(remaining_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        message = f"Hesabınız kilitli olduğu için işlem yapamazsınız. Lütfen {int(hours)} saat {int(minutes)} dakika {int(seconds)} saniye sonra tekrar deneyiniz."
+        session.pop('username', None) # Kilitliyse oturumu kapat
+        return redirect(url_for('login_route', message=message))
+
+    user_accounts = user_data['accounts']
+    return render_template('dashboard.html', username=username, accounts=user_accounts)
 
-    return render_template_string('''
+TEMPLATES['account.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>{{ account_name }} Hesap İşlemleri</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 500px; width: 90%; animation: fadeIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                ul { list-style: none; padding: 0; margin: 20px 0; }
-                ul li { background-color: #e9ecef; padding: 15px 20px; margin-bottom: 10px; border-radius: 8px; transition: transform 0.2s ease, box-shadow 0.2s ease; }
-                ul li:hover { background-color: #dbe3eb; transform: translateY(-2px); }
-                ul li a { color: #007bff; text-decoration: none; display: block; font-size: 1.1em; font-weight: 500; transition: color 0.3s ease; }
-                ul li a:hover { color: #0056b3; }
-                .back-link, .home-link { display: block; text-align: center; margin-top: 30px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover, .home-link:hover { color: #495057; text-decoration: underline; }
-                .message { text-align: center; margin-bottom: 20px; padding: 10px; border-radius: 8px; font-weight: 500; }
-                .message.success { background-color: #d4edda; color: #155724; border: 1px solid #c3e6cb; animation: slideInFromTop 0.5s ease; }
-                .message.error { background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; animation: shake 0.5s; }
-                @keyframes fadeIn { from { opacity: 0; transform: translateY(-20px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes slideInFromTop { from { opacity: 0; transform: translateY(-10px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes shake { 0%, 100% { transform: translateX(0); } 10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); } 20%, 40%, 60%, 80% { transform: translateX(5px); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-account">
             <div class="container">
                 <h1>{{ account_name }} Hesabı İşlemleri</h1>
                 {% if message %}<p class="message {% if 'Hata' not in message %}success{% else %}error{% endif %}">{{ message }}</p>{% endif %}
@@ -415,83 +3103,33 @@ def account_operations(account_name):
             </div>
         </body>
         </html>
-    ''', username=username, account_name=account_name, account_info=selected_account, message=message)
+    '''
 
-
-@app.route('/account/<account_name>/withdraw', methods=['GET', 'POST'])
-def withdraw_route(account_name):
+@app.route('/account/<account_name>')
+def account_operations(account_name):
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
-    user_data = users.get(username)
-    if not user_data or account_name not in user_data['accounts']:
-        return redirect(url_for('dashboard'))
-
-    selected_account = user_data['accounts'][account_name]
-    message = ""
-
-    if request.method == 'POST':
-        try:
-            amount = float(request.form['amount'])
-
-            if amount <= 0:
-                message = "Hata: Çekilecek tutar pozitif olmalıdır."
-            elif selected_account["bakiye"] - amount < 0:
-                message = f"Yetersiz bakiye! Hesabınızda {selected_account['bakiye']:.2f} TL var."
-            elif amount < 50 or amount % 50 != 0:
-                message = "En az 50 TL ve 50'nin katlarında para çekebilirsiniz."
-            else:
-                today_str = datetime.date.today().isoformat()
+    user_data = users.get(username)
+    if not user_data or account_name not in user_data['accounts']:
+        return redirect(url_for('dashboard')) # Geçersiz hesap veya kullanıcı yoksa kontrol paneline dön
 
-                if user_data["last_withdrawal_date"] != today_str:
-                    user_data["current_day_withdrawal_amount"] = 0.0
-                    user_data["last_withdrawal_date"] = today_str
+    selected_account = user_data['accounts'][account_name]
+    message = request.args.get('message', '') # Get messages from redirects
 
-                proposed_total_withdrawal = amount + user_data["current_day_withdrawal_amount"]
+    return render_template('account.html', username=username, account_name=account_name, account_info=selected_account, message=message)
 
-                if proposed_total_withdrawal > user_data["daily_withdrawal_limit"]:
-                    remaining_limit = user_data["daily_withdrawal_limit"] - user_data["current_day_withdrawal_amount"]
-                    message = f"Hata: Günlük çekim limitini aşmaktasınız. Kalan günlük çekim limitiniz: {remaining_limit:.2f} TL. Bugüne kadar çektiğiniz: {user_data['current_day_withdrawal_amount']:.2f} TL."
-                else:
-                    selected_account["bakiye"] -= amount
-                    user_data["current_day_withdrawal_amount"] += amount
-
-                    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    selected_account["işlem_geçmişi"].append(f"[{timestamp}] Para Çekme: {amount:.2f} TL. Kalan Bakiye: {selected_account['bakiye']:.2f} TL")
-                    user_data["user_history"].append(f"[{timestamp}] '{account_name}' hesabından {amount:.2f} TL çekildi.")
-                    save_user_data()
-                    message = f"Çekilen tutar: {amount:.2f} TL. Kalan bakiye: {selected_account['bakiye']:.2f} TL"
-        except ValueError:
-            message = "Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz."
 
-    return render_template_string('''
+TEMPLATES['withdraw.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Para Çekme</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 450px; width: 90%; animation: slideIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                .message { text-align: center; margin-bottom: 20px; padding: 10px; border-radius: 8px; font-weight: 500; }
-                .message.success { background-color: #d4edda; color: #155724; border: 1px solid #c3e6cb; animation: slideInFromTop 0.5s ease; }
-                .message.error { background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; animation: shake 0.5s; }
-                form p { margin-bottom: 20px; text-align: left; }
-                form label { display: block; margin-bottom: 8px; color: #555; font-weight: 500; }
-                form input[type="number"] { width: calc(100% - 22px); padding: 12px; border: 1px solid #ced4da; border-radius: 8px; font-size: 1em; transition: border-color 0.3s ease, box-shadow 0.3s ease; }
-                form input[type="number"]:focus { border-color: #007bff; box-shadow: 0 0 0 0.2rem rgba(0,123,255,.25); outline: none; }
-                form input[type="submit"] { width: 100%; padding: 12px; border: none; border-radius: 8px; background-color: #007bff; color: white; font-size: 1.1em; cursor: pointer; transition: background-color 0.3s ease, transform 0.2s ease; margin-top: 20px; }
-                form input[type="submit"]:hover { background-color: #0056b3; transform: translateY(-2px); }
-                .back-link { display: block; text-align: center; margin-top: 25px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #495057; text-decoration: underline; }
-                @keyframes slideIn { from { opacity: 0; transform: translateY(-30px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes slideInFromTop { from { opacity: 0; transform: translateY(-10px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes shake { 0%, 100% { transform: translateX(0); } 10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); } 20%, 40%, 60%, 80% { transform: translateX(5px); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-withdraw">
             <div class="container">
                 <h1>{{ account_name }} Hesabından Para Çekme</h1>
                 {% if message %}<p class="message {% if 'Hata' not in message %}success{% else %}error{% endif %}">{{ message }}</p>{% endif %}
@@ -508,10 +3146,10 @@ def withdraw_route(account_name):
             </div>
         </body>
         </html>
-    ''', account_name=account_name, message=message)
+    '''
 
-@app.route('/account/<account_name>/deposit', methods=['GET', 'POST'])
-def deposit_route(account_name):
+@app.route('/account/<account_name>/withdraw', methods=['GET', 'POST'])
+def withdraw_route(account_name):
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
@@ -519,55 +3157,30 @@ def deposit_route(account_name):
     if not user_data or account_name not in user_data['accounts']:
         return redirect(url_for('dashboard'))
 
-    selected_account = user_data['accounts'][account_name]
     message = ""
+    status = 200
 
     if request.method == 'POST':
         try:
             amount = float(request.form['amount'])
-
-            if amount <= 0:
-                message = "Hata: Yatırılacak tutar pozitif olmalıdır."
-            elif amount < 50 or amount % 50 != 0:
-                message = "En az 50 TL ve 50'nin katlarında para yatırabilirsiniz."
-            else:
-                selected_account["bakiye"] += amount
-                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                selected_account["işlem_geçmişi"].append(f"[{timestamp}] Para Yatırma: {amount:.2f} TL. Güncel Bakiye: {selected_account['bakiye']:.2f} TL")
-                user_data["user_history"].append(f"[{timestamp}] '{account_name}' hesabına {amount:.2f} TL yatırıldı.")
-                save_user_data()
-                message = f"Yatırılan tutar: {amount:.2f} TL. Güncel bakiye: {selected_account['bakiye']:.2f} TL"
+            success, message = withdraw_web(username, account_name, amount)
         except ValueError:
             message = "Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz."
+        except JournalWriteError:
+            message, status = JOURNAL_WRITE_ERROR_MESSAGE, 503
 
-    return render_template_string('''
+    return render_template('withdraw.html', account_name=account_name, message=message), status
+
+TEMPLATES['deposit.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Para Yatırma</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 450px; width: 90%; animation: slideIn 0.8s ease-out; }
-                h1 { color: #28a745; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                .message { text-align: center; margin-bottom: 20px; padding: 10px; border-radius: 8px; font-weight: 500; }
-                .message.success { background-color: #d4edda; color: #155724; border: 1px solid #c3e6cb; animation: slideInFromTop 0.5s ease; }
-                .message.error { background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; animation: shake 0.5s; }
-                form p { margin-bottom: 20px; text-align: left; }
-                form label { display: block; margin-bottom: 8px; color: #555; font-weight: 500; }
-                form input[type="number"] { width: calc(100% - 22px); padding: 12px; border: 1px solid #ced4da; border-radius: 8px; font-size: 1em; transition: border-color 0.3s ease, box-shadow 0.3s ease; }
-                form input[type="number"]:focus { border-color: #28a745; box-shadow: 0 0 0 0.2rem rgba(40,167,69,.25); outline: none; }
-                form input[type="submit"] { width: 100%; padding: 12px; border: none; border-radius: 8px; background-color: #28a745; color: white; font-size: 1.1em; cursor: pointer; transition: background-color 0.3s ease, transform 0.2s ease; margin-top: 20px; }
-                form input[type="submit"]:hover { background-color: #218838; transform: translateY(-2px); }
-                .back-link { display: block; text-align: center; margin-top: 25px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #495057; text-decoration: underline; }
-                @keyframes slideIn { from { opacity: 0; transform: translateY(-30px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes slideInFromTop { from { opacity: 0; transform: translateY(-10px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes shake { 0%, 100% { transform: translateX(0); } 10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); } 20%, 40%, 60%, 80% { transform: translateX(5px); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-deposit">
             <div class="container">
                 <h1>{{ account_name }} Hesabına Para Yatırma</h1>
                 {% if message %}<p class="message {% if 'Hata' not in message %}success{% else %}error{% endif %}">{{ message }}</p>{% endif %}
@@ -584,10 +3197,10 @@ def deposit_route(account_name):
             </div>
         </body>
         </html>
-    ''', account_name=account_name, message=message)
+    '''
 
-@app.route('/account/<account_name>/balance')
-def balance_route(account_name):
+@app.route('/account/<account_name>/deposit', methods=['GET', 'POST'])
+def deposit_route(account_name):
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
@@ -595,35 +3208,30 @@ def balance_route(account_name):
     if not user_data or account_name not in user_data['accounts']:
         return redirect(url_for('dashboard'))
 
-    selected_account = user_data['accounts'][account_name]
-    current_balance = selected_account['bakiye']
+    message = ""
+    status = 200
 
-    # Record balance inquiry in user history
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    selected_account["işlem_geçmişi"].append(f"[{timestamp}] Bakiye Sorgulama: {current_balance:.2f} TL")
-    user_data["user_history"].append(f"[{timestamp}] '{account_name}' bakiyesi sorgulandı.")
-    save_user_data()
+    if request.method == 'POST':
+        try:
+            amount = float(request.form['amount'])
+            success, message = deposit_web(username, account_name, amount)
+        except ValueError:
+            message = "Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz."
+        except JournalWriteError:
+            message, status = JOURNAL_WRITE_ERROR_MESSAGE, 503
+
+    return render_template('deposit.html', account_name=account_name, message=message), status
 
-    return render_template_string('''
+TEMPLATES['balance.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Bakiye Sorgulama</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 400px; width: 90%; animation: fadeIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 25px; font-size: 2em; font-weight: 600; }
-                .balance-info { text-align: center; margin-top: 30px; }
-                .balance-label { font-size: 1.2em; color: #555; margin-bottom: 10px; }
-                .balance-amount { font-size: 2.5em; font-weight: bold; color: #28a745; margin-top: 10px; letter-spacing: 0.05em; }
-                .back-link { display: block; text-align: center; margin-top: 40px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #495057; text-decoration: underline; }
-                @keyframes fadeIn { from { opacity: 0; transform: translateY(-20px); } to { opacity: 1; transform: translateY(0); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-balance">
             <div class="container">
                 <h1>{{ account_name }} Hesabı Bakiye Sorgulama</h1>
                 <div class="balance-info">
@@ -634,10 +3242,10 @@ def balance_route(account_name):
             </div>
         </body>
         </html>
-    ''', account_name=account_name, current_balance=current_balance)
+    '''
 
-@app.route('/account/<account_name>/history')
-def history_route(account_name):
+@app.route('/account/<account_name>/balance')
+def balance_route(account_name):
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
@@ -645,33 +3253,70 @@ def history_route(account_name):
     if not user_data or account_name not in user_data['accounts']:
         return redirect(url_for('dashboard'))
 
-    selected_account = user_data['accounts'][account_name]
-    # Display last 10 transactions, newest first
-    transaction_history = selected_account['işlem_geçmişi'][-10:][::-1]
+    # Record balance inquiry in user history
+    current_balance = balance_web(username, account_name)
+
+    return render_template('balance.html', account_name=account_name, current_balance=current_balance)
+
+def history_query():
+    """Reads the cursor, page size and filters of a history page from the query string.
+
+    Returns (query, filters, error): query holds the ledger_page arguments and
+    filters the raw values the filter form shows again.
+    """
+    filters = {
+        "limit": min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_PAGE_MAX),
+        "since": request.args.get('since', ''),
+        "until": request.args.get('until', ''),
+        "type": request.args.get('type', '')
+    }
+    query = {"limit": filters["limit"], "before": request.args.get('before', type=int)}
+    error = None
+    try:
+        if filters["since"]:
+            query["since"] = datetime.date.fromisoformat(filters["since"]).strftime("%Y-%m-%d 00:00:00")
+        if filters["until"]:
+            query["until"] = datetime.date.fromisoformat(filters["until"]).strftime("%Y-%m-%d 23:59:59")
+    except ValueError:
+        error = "Hata: Tarihler YYYY-AA-GG biçiminde olmalıdır."
+        query.pop("since", None)
+        query.pop("until", None)
+    if filters["type"] in LEDGER_TYPE_LABELS:
+        query["entry_type"] = filters["type"]
+    return query, filters, error
+
+def history_page_urls(endpoint, account_name, filters, before, next_cursor):
+    """Returns the links to the newest page and to the next older page."""
+    args = {key: value for key, value in filters.items() if value}
+    newest_url = url_for(endpoint, account_name=account_name, **args) if before is not None else None
+    older_url = url_for(endpoint, account_name=account_name, before=next_cursor, **args) if next_cursor is not None else None
+    return newest_url, older_url
 
-    return render_template_string('''
+TEMPLATES['history.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>İşlem Geçmişi</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 700px; width: 90%; animation: fadeIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                .history-list { list-style: none; padding: 0; max-height: 350px; overflow-y: auto; border: 1px solid #e0e6ed; border-radius: 8px; background-color: #fdfefe; margin-bottom: 20px; }
-                .history-list li { padding: 12px 15px; border-bottom: 1px solid #f0f0f0; text-align: left; font-size: 0.95em; line-height: 1.4; }
-                .history-list li:last-child { border-bottom: none; }
-                .no-history { text-align: center; color: #777; padding: 30px; font-size: 1.1em; background-color: #f8f9fa; border: 1px solid #e0e6ed; border-radius: 8px; }
-                .back-link { display: block; text-align: center; margin-top: 30px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #495057; text-decoration: underline; }
-                @keyframes fadeIn { from { opacity: 0; transform: translateY(-20px); } to { opacity: 1; transform: translateY(0); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-history">
             <div class="container">
                 <h1>{{ account_name }} Hesabı İşlem Geçmişi</h1>
+                {% if message %}<p class="message">{{ message }}</p>{% endif %}
+                <form method="get" class="history-filter">
+                    <input type="date" name="since" value="{{ filters.since }}" title="Başlangıç tarihi">
+                    <input type="date" name="until" value="{{ filters.until }}" title="Bitiş tarihi">
+                    <select name="type">
+                        <option value="">Tüm İşlemler</option>
+                        {% for value, label in type_labels.items() %}
+                        <option value="{{ value }}" {% if filters.type == value %}selected{% endif %}>{{ label }}</option>
+                        {% endfor %}
+                    </select>
+                    <input type="hidden" name="limit" value="{{ filters.limit }}">
+                    <button type="submit">Filtrele</button>
+                </form>
                 {% if transaction_history %}
                 <ul class="history-list">
                     {% for transaction in transaction_history %}
@@ -681,14 +3326,19 @@ def history_route(account_name):
                 {% else %}
                 <p class="no-history">Bu hesapta henüz bir işlem kaydı yok.</p>
                 {% endif %}
+                <div class="pager">
+                    <span>{% if newest_url %}<a href="{{ newest_url }}">&laquo; En Yeni Kayıtlar</a>{% endif %}</span>
+                    <span>{% if older_url %}<a href="{{ older_url }}">Daha Eski Kayıtlar &raquo;</a>{% endif %}</span>
+                </div>
+                <p class="statement-links">Hesap Özeti İndir: <a href="{{ statement_urls.csv }}">CSV</a> | <a href="{{ statement_urls.jsonl }}">JSON Lines</a></p>
                 <a href="{{ url_for('account_operations', account_name=account_name) }}" class="back-link">Geri Dön</a>
             </div>
         </body>
         </html>
-    ''', account_name=account_name, transaction_history=transaction_history)
+    '''
 
-@app.route('/account/<account_name>/internal_transfer', methods=['GET', 'POST'])
-def internal_transfer_route(account_name):
+@app.route('/account/<account_name>/history')
+def history_route(account_name):
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
@@ -696,74 +3346,100 @@ def internal_transfer_route(account_name):
     if not user_data or account_name not in user_data['accounts']:
         return redirect(url_for('dashboard'))
 
-    selected_account = user_data['accounts'][account_name] # This is the currently selected account for operations
-    user_accounts = user_data['accounts']
-    message = request.args.get('message', '')
+    # ?before=<imleç>&limit=N&since=YYYY-AA-GG&until=YYYY-AA-GG&type=<tür>, en yeniler başta
+    query, filters, message = history_query()
+    entries, next_cursor = user_ledger_page(username, user_data, account_name, **query)
+    transaction_history = [format_ledger_entry(entry) for entry in entries]
+    newest_url, older_url = history_page_urls('history_route', account_name, filters, query["before"], next_cursor)
 
-    if request.method == 'POST':
-        try:
-            source_account_name = request.form['source_account']
-            destination_account_name = request.form['destination_account']
-            amount = float(request.form['amount'])
+    return render_template('history.html', account_name=account_name, transaction_history=transaction_history, message=message, filters=filters,
+       type_labels=LEDGER_TYPE_LABELS, newest_url=newest_url, older_url=older_url,
+       statement_urls={fmt: url_for('statement_route', account_name=account_name, format=fmt, since=filters["since"] or None,
+           until=filters["until"] or None, type=filters["type"] or None) for fmt in STATEMENT_FORMATS})
 
-            if source_account_name == destination_account_name:
-                message = "Hata: Kaynak ve hedef hesap aynı olamaz. Lütfen farklı bir hedef hesap seçiniz."
-            elif amount <= 0:
-                message = "Hata: Transfer tutarı pozitif olmalıdır."
-            elif source_account_name not in user_accounts or destination_account_name not in user_accounts:
-                message = "Hata: Geçersiz kaynak veya hedef hesap seçimi."
-            else:
-                source_account = user_accounts[source_account_name]
-                destination_account = user_accounts[destination_account_name]
+# Hesap özeti biçimi -> yanıt türü
+STATEMENT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson"
+}
+STATEMENT_CSV_HEADER = ("İşlem No", "Tarih", "İşlem Türü", "Tutar", "Bakiye", "Karşı Taraf", "Karşı Hesap", "Kanal", "Açıklama")
+# JSON Lines satırlarının alanları, CSV sütunlarıyla aynı sırada
+STATEMENT_JSON_FIELDS = ("id", "date", "type", "amount", "balance", "counterparty", "counterparty_account", "channel", "description")
 
-                if source_account["bakiye"] < amount:
-                    message = f"Yetersiz bakiye! {source_account_name} hesabınızda {source_account['bakiye']:.2f} TL var."
-                else:
-                    source_account["bakiye"] -= amount
-                    destination_account["bakiye"] += amount
-                    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def statement_csv_row(entry):
+    amount, balance = entry.get("amt"), entry.get("bal")
+    return (
+        entry.get("id", ""), entry.get("vt", entry["t"]), LEDGER_TYPE_LABELS.get(entry["type"], entry["type"]),
+        "" if amount is None else f"{amount:.2f}", "" if balance is None else f"{balance:.2f}",
+        entry.get("cp", ""), entry.get("cpa", ""), entry.get("ch", ""), format_ledger_entry(entry)
+    )
 
-                    source_account["işlem_geçmişi"].append(f"[{timestamp}] Hesaplar Arası Havale: {amount:.2f} TL ({destination_account_name} hesabına). Kalan Bakiye: {source_account['bakiye']:.2f} TL")
-                    destination_account["işlem_geçmişi"].append(f"[{timestamp}] Hesaplar Arası Havale: {amount:.2f} TL ({source_account_name} hesabından). Güncel Bakiye: {destination_account['bakiye']:.2f} TL")
-                    user_data["user_history"].append(f"[{timestamp}] '{source_account_name}' hesabından '{destination_account_name}' hesabına {amount:.2f} TL dahili havale yapıldı.")
+def statement_json_row(entry):
+    values = (
+        entry.get("id"), entry.get("vt", entry["t"]), LEDGER_TYPE_LABELS.get(entry["type"], entry["type"]),
+        entry.get("amt"), entry.get("bal"), entry.get("cp"), entry.get("cpa"), entry.get("ch"), format_ledger_entry(entry)
+    )
+    return dict(zip(STATEMENT_JSON_FIELDS, values))
 
-                    save_user_data()
-                    message = f"Transfer başarılı! {source_account_name} hesabından {destination_account_name} hesabına {amount:.2f} TL gönderildi."
-                    return redirect(url_for('account_operations', account_name=account_name, message=message))
+def statement_chunks(username, user_data, account_name, query, fmt):
+    """Yields an account statement as encoded chunks, newest entries first.
 
-        except ValueError:
-            message = "Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz."
-        except Exception as e:
-            message = f"Bir hata oluştu: {e}"
+    The ledger is read STATEMENT_CHUNK_SIZE entries at a time and each page is
+    sent as one chunk, so memory stays flat however long the range is. The CSV
+    header goes out before the first page is read.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(STATEMENT_CSV_HEADER)
+        yield buffer.getvalue().encode('utf-8')
+    page_query = dict(query, limit=STATEMENT_CHUNK_SIZE)
+    while True:
+        entries, page_query["before"] = user_ledger_page(username, user_data, account_name, **page_query)
+        buffer.seek(0)
+        buffer.truncate()
+        if fmt == "csv":
+            writer.writerows(statement_csv_row(entry) for entry in entries)
+        else:
+            for entry in entries:
+                buffer.write(json.dumps(statement_json_row(entry), ensure_ascii=False, separators=(',', ':')))
+                buffer.write('\n')
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+        if page_query["before"] is None:
+            return
 
-    return render_template_string('''
+@app.route('/account/<account_name>/statement')
+def statement_route(account_name):
+    if 'username' not in session:
+        return redirect(url_for('login_route'))
+    username = session['username']
+    user_data = users.get(username)
+    if not user_data or account_name not in user_data['accounts']:
+        return redirect(url_for('dashboard'))
+
+    # ?format=csv|jsonl&since=YYYY-AA-GG&until=YYYY-AA-GG&type=<tür>; boyut belirtilmez, yanıt parça parça (chunked) gider
+    fmt = request.args.get('format', 'csv')
+    if fmt not in STATEMENT_FORMATS:
+        return app.response_class("Hata: Hesap özeti biçimi 'csv' veya 'jsonl' olmalıdır.", status=400, mimetype='text/plain')
+    query, filters, error = history_query()
+    if error:
+        return app.response_class(error, status=400, mimetype='text/plain')
+    response = app.response_class(stream_with_context(statement_chunks(username, user_data, account_name, query, fmt)), mimetype=STATEMENT_FORMATS[fmt])
+    response.headers.set('Content-Disposition', 'attachment', filename=secure_filename(f"{account_name}-hesap-ozeti.{fmt}"))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+TEMPLATES['internal_transfer.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Hesaplar Arası Havale</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 500px; width: 90%; animation: slideIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                .message { text-align: center; margin-bottom: 20px; padding: 10px; border-radius: 8px; font-weight: 500; }
-                .message.success { background-color: #d4edda; color: #155724; border: 1px solid #c3e6cb; animation: slideInFromTop 0.5s ease; }
-                .message.error { background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; animation: shake 0.5s; }
-                form p { margin-bottom: 20px; text-align: left; }
-                form label { display: block; margin-bottom: 8px; color: #555; font-weight: 500; }
-                form select, form input[type="number"] { width: calc(100% - 22px); padding: 12px; border: 1px solid #ced4da; border-radius: 8px; font-size: 1em; transition: border-color 0.3s ease, box-shadow 0.3s ease; }
-                form input[type="number"]:focus { border-color: #007bff; box-shadow: 0 0 0 0.2rem rgba(0,123,255,.25); outline: none; }
-                form input[type="submit"] { width: 100%; padding: 12px; border: none; border-radius: 8px; background-color: #007bff; color: white; font-size: 1.1em; cursor: pointer; transition: background-color 0.3s ease, transform 0.2s ease; margin-top: 20px; }
-                form input[type="submit"]:hover { background-color: #0056b3; transform: translateY(-2px); }
-                .back-link { display: block; text-align: center; margin-top: 25px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #495057; text-decoration: underline; }
-                @keyframes slideIn { from { opacity: 0; transform: translateY(-30px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes slideInFromTop { from { opacity: 0; transform: translateY(-10px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes shake { 0%, 100% { transform: translateX(0); } 10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); } 20%, 40%, 60%, 80% { transform: translateX(5px); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-internal_transfer">
             <div class="container">
                 <h1>Hesaplar Arası Havale</h1>
                 {% if message %}<p class="message {% if 'Hata' not in message %}success{% else %}error{% endif %}">{{ message }}</p>{% endif %}
@@ -796,10 +3472,10 @@ def internal_transfer_route(account_name):
             </div>
         </body>
         </html>
-    ''', account_name=account_name, user_accounts=user_accounts, message=message)
+    '''
 
-@app.route('/account/<account_name>/external_transfer', methods=['GET', 'POST'])
-def external_transfer_route(account_name):
+@app.route('/account/<account_name>/internal_transfer', methods=['GET', 'POST'])
+def internal_transfer_route(account_name):
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
@@ -807,83 +3483,40 @@ def external_transfer_route(account_name):
     if not user_data or account_name not in user_data['accounts']:
         return redirect(url_for('dashboard'))
 
-    selected_account = user_data['accounts'][account_name]
+    user_accounts = user_data['accounts']
     message = request.args.get('message', '')
-    havale_ucreti = 6.39
+    status = 200
 
     if request.method == 'POST':
-        recipient_username = request.form.get('recipient_username', '').strip()
-        recipient_account_name = request.form.get('recipient_account_name', '').strip()
-        amount_str = request.form.get('amount', '').strip()
-
-        if recipient_username.lower() == 'c' or recipient_account_name.lower() == 'c' or amount_str.lower() == 'c':
-            message = "Havale işlemi iptal edildi."
-            return redirect(url_for('account_operations', account_name=account_name, message=message))
-
         try:
-            amount = float(amount_str)
-            if amount <= 0:
-                message = "Hata: Gönderilecek tutar pozitif olmalıdır."
-            elif recipient_username == username:
-                message = "Hata: Kendi hesabınıza harici havale yapamazsınız. Hesaplarım Arası Havale'yi kullanın."
-            elif recipient_username not in users:
-                message = "Hata: Belirtilen kullanıcı bulunamadı."
-            else:
-                recipient_user_data = users[recipient_username]
-                if recipient_account_name not in recipient_user_data['accounts']:
-                    message = "Hata: Alıcının belirtilen hesabı bulunamadı."
-                else:
-                    recipient_account = recipient_user_data['accounts'][recipient_account_name]
-                    total_deduction = amount + havale_ucreti
-
-                    if selected_account["bakiye"] < total_deduction:
-                        message = f"Yetersiz bakiye! İşlem için {total_deduction} TL gerekmektedir. Mevcut bakiyeniz: {selected_account['bakiye']} TL."
-                    else:
-                        selected_account["bakiye"] -= total_deduction
-                        recipient_account["bakiye"] += amount
-
-                        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        selected_account["işlem_geçmişi"].append(f"[{timestamp}] Havale/EFT: {amount} TL (alıcı: {recipient_username} - {recipient_account_name}), Ücret: {havale_ucreti} TL. Kalan Bakiye: {selected_account['bakiye']} TL")
-                        user_data["user_history"].append(f"[{timestamp}] '{account_name}' hesabından '{recipient_username}' kullanıcısının '{recipient_account_name}' hesabına {amount} TL havale yapıldı.")
-                        recipient_account["işlem_geçmişi"].append(f"[{timestamp}] Havale/EFT: {amount} TL (gönderen: {username} - {account_name}). Güncel Bakiye: {recipient_account['bakiye']} TL")
+            source_account_name = request.form['source_account']
+            destination_account_name = request.form['destination_account']
+            amount = float(request.form['amount'])
 
-                        save_user_data()
-                        message = f"Transfer başarılı! '{recipient_username}' kullanıcısının '{recipient_account_name}' hesabına {amount} TL gönderildi. Havale ücreti: {havale_ucreti} TL."
-                        return redirect(url_for('account_operations', account_name=account_name, message=message))
+            success, message = internal_transfer_web(username, source_account_name, destination_account_name, amount)
+            if success:
+                return redirect(url_for('account_operations', account_name=account_name, message=message))
 
         except ValueError:
             message = "Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz."
+        except JournalWriteError:
+            # İşlem geri alındı; genel hata iletisi yerine kaydedilemediği söylenir
+            message, status = JOURNAL_WRITE_ERROR_MESSAGE, 503
         except Exception as e:
             message = f"Bir hata oluştu: {e}"
 
-    return render_template_string('''
+    return render_template('internal_transfer.html', account_name=account_name, user_accounts=user_accounts, message=message), status
+
+TEMPLATES['external_transfer.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Harici Havale/EFT</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 500px; width: 90%; animation: slideIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                .message { text-align: center; margin-bottom: 20px; padding: 10px; border-radius: 8px; font-weight: 500; }
-                .message.success { background-color: #d4edda; color: #155724; border: 1px solid #c3e6cb; animation: slideInFromTop 0.5s ease; }
-                .message.error { background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; animation: shake 0.5s; }
-                form p { margin-bottom: 20px; text-align: left; }
-                form label { display: block; margin-bottom: 8px; color: #555; font-weight: 500; }
-                form input[type="text"], form input[type="number"] { width: calc(100% - 22px); padding: 12px; border: 1px solid #ced4da; border-radius: 8px; font-size: 1em; transition: border-color 0.3s ease, box-shadow 0.3s ease; }
-                form input[type="text"]:focus, form input[type="number"]:focus { border-color: #007bff; box-shadow: 0 0 0 0.2rem rgba(0,123,255,.25); outline: none; }
-                form input[type="submit"] { width: 100%; padding: 12px; border: none; border-radius: 8px; background-color: #007bff; color: white; font-size: 1.1em; cursor: pointer; transition: background-color 0.3s ease, transform 0.2s ease; margin-top: 20px; }
-                form input[type="submit"]:hover { background-color: #0056b3; transform: translateY(-2px); }
-                .back-link { display: block; text-align: center; margin-top: 25px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #495057; text-decoration: underline; }
-                @keyframes slideIn { from { opacity: 0; transform: translateY(-30px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes slideInFromTop { from { opacity: 0; transform: translateY(-10px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes shake { 0%, 100% { transform: translateX(0); } 10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); } 20%, 40%, 60%, 80% { transform: translateX(5px); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-external_transfer">
             <div class="container">
                 <h1>Harici Havale/EFT İşlemi</h1>
                 {% if message %}<p class="message {% if 'Hata' not in message %}success{% else %}error{% endif %}">{{ message }}</p>{% endif %}
@@ -908,43 +3541,70 @@ def external_transfer_route(account_name):
             </div>
         </body>
         </html>
-    ''', account_name=account_name, message=message, havale_ucreti=havale_ucreti)
+    '''
 
-
-@app.route('/user/<account_name>/user_history') # Updated route for user history
-def user_history_route(account_name):
+@app.route('/account/<account_name>/external_transfer', methods=['GET', 'POST'])
+def external_transfer_route(account_name):
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
     user_data = users.get(username)
-    if not user_data:
-        return redirect(url_for('logout'))
+    if not user_data or account_name not in user_data['accounts']:
+        return redirect(url_for('dashboard'))
+
+    message = request.args.get('message', '')
+    status = 200
+
+    if request.method == 'POST':
+        recipient_username = request.form.get('recipient_username', '').strip()
+        recipient_account_name = request.form.get('recipient_account_name', '').strip()
+        amount_str = request.form.get('amount', '').strip()
+
+        if recipient_username.lower() == 'c' or recipient_account_name.lower() == 'c' or amount_str.lower() == 'c':
+            message = "Havale işlemi iptal edildi."
+            return redirect(url_for('account_operations', account_name=account_name, message=message))
+
+        try:
+            amount = float(amount_str)
+            success, message = external_transfer_web(username, account_name, recipient_username, recipient_account_name, amount)
+            if success:
+                return redirect(url_for('account_operations', account_name=account_name, message=message))
+
+        except ValueError:
+            message = "Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz."
+        except JournalWriteError:
+            message, status = JOURNAL_WRITE_ERROR_MESSAGE, 503
+        except Exception as e:
+            message = f"Bir hata oluştu: {e}"
+
+    return render_template('external_transfer.html', account_name=account_name, message=message, havale_ucreti=HAVALE_UCRETI), status
 
-    user_activity_history = user_data['user_history'][-10:][::-1] # Son 10 hareketi al ve en yeniyi başa getir
 
-    return render_template_string('''
+TEMPLATES['user_history.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Kullanıcı Hareket Geçmişi</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 700px; width: 90%; animation: fadeIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                .history-list { list-style: none; padding: 0; max-height: 350px; overflow-y: auto; border: 1px solid #e0e6ed; border-radius: 8px; background-color: #fdfefe; margin-bottom: 20px; }
-                .history-list li { padding: 12px 15px; border-bottom: 1px solid #f0f0f0; text-align: left; font-size: 0.95em; line-height: 1.4; }
-                .history-list li:last-child { border-bottom: none; }
-                .no-history { text-align: center; color: #777; padding: 30px; font-size: 1.1em; background-color: #f8f9fa; border: 1px solid #e0e6ed; border-radius: 8px; }
-                .back-link { display: block; text-align: center; margin-top: 30px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #495057; text-decoration: underline; }
-                @keyframes fadeIn { from { opacity: 0; transform: translateY(-20px); } to { opacity: 1; transform: translateY(0); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-user_history">
             <div class="container">
                 <h1>Kullanıcı Hareket Geçmişi</h1>
+                {% if message %}<p class="message">{{ message }}</p>{% endif %}
+                <form method="get" class="history-filter">
+                    <input type="date" name="since" value="{{ filters.since }}" title="Başlangıç tarihi">
+                    <input type="date" name="until" value="{{ filters.until }}" title="Bitiş tarihi">
+                    <select name="type">
+                        <option value="">Tüm İşlemler</option>
+                        {% for value, label in type_labels.items() %}
+                        <option value="{{ value }}" {% if filters.type == value %}selected{% endif %}>{{ label }}</option>
+                        {% endfor %}
+                    </select>
+                    <input type="hidden" name="limit" value="{{ filters.limit }}">
+                    <button type="submit">Filtrele</button>
+                </form>
                 {% if user_activity_history %}
                 <ul class="history-list">
                     {% for activity in user_activity_history %}
@@ -954,15 +3614,18 @@ def user_history_route(account_name):
                 {% else %}
                 <p class="no-history">Henüz bir kullanıcı hareket kaydı yok.</p>
                 {% endif %}
+                <div class="pager">
+                    <span>{% if newest_url %}<a href="{{ newest_url }}">&laquo; En Yeni Kayıtlar</a>{% endif %}</span>
+                    <span>{% if older_url %}<a href="{{ older_url }}">Daha Eski Kayıtlar &raquo;</a>{% endif %}</span>
+                </div>
                 <a href="{{ url_for('account_operations', account_name=account_name) }}" class="back-link">Geri Dön</a>
             </div>
         </body>
         </html>
-    ''', account_name=account_name, user_activity_history=user_activity_history)
-
+    '''
 
-@app.route('/account/<account_name>/change_password', methods=['GET', 'POST'])
-def change_password_route(account_name):
+@app.route('/user/<account_name>/user_history') # Updated route for user history
+def user_history_route(account_name):
     if 'username' not in session:
         return redirect(url_for('login_route'))
     username = session['username']
@@ -970,86 +3633,25 @@ def change_password_route(account_name):
     if not user_data:
         return redirect(url_for('logout'))
 
-    message = request.args.get('message', '')
-
-    # Check if user is currently locked out
-    if user_data["lockout_until"] and datetime.datetime.fromisoformat(user_data["lockout_until"]) > datetime.datetime.now():
-        locked_until_dt = datetime.datetime.fromisoformat(user_data["lockout_until"])
-        print(f"Hesabınız kilitli. Lütfen {locked_until_dt.strftime('%H:%M:%S')} tarihine kadar bekleyiniz.")
-        return redirect(url_for('account_operations', account_name=account_name, message="Hesabınız kilitli olduğu için parola değiştiremezsiniz."))
-
-    if request.method == 'POST':
-        current_password = request.form['current_password']
-        new_password = request.form['new_password']
-
-        attempts = session.get('change_password_attempts', 0)
-        MAX_ATTEMPTS = 3
-
-        if user_data["parola"] == current_password:
-            # Correct password, reset failed attempts and lockout
-            user_data["failed_password_attempts"] = 0
-            user_data["lockout_until"] = None
-            session['change_password_attempts'] = 0
+    query, filters, message = history_query()
+    entries, next_cursor = user_ledger_page(username, user_data, **query)
+    user_activity_history = [format_ledger_entry(entry, show_account=True) for entry in entries]
+    newest_url, older_url = history_page_urls('user_history_route', account_name, filters, query["before"], next_cursor)
 
-            # Password policy checks for new password
-            has_uppercase = any(char.isupper() for char in new_password)
-            has_digit = any(char.isdigit() for char in new_password)
-
-            if not has_uppercase or not has_digit:
-                message = "Hata: Yeni parola en az bir büyük harf ve bir rakam içermelidir."
-            else:
-                user_data["parola"] = new_password
-                timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                user_data["user_history"].append(f"[{timestamp}] Parola değiştirildi.")
-                save_user_data()
-                message = "Parolanız başarıyla değiştirildi."
-                return redirect(url_for('account_operations', account_name=account_name, message=message))
-        else:
-            attempts += 1
-            session['change_password_attempts'] = attempts
-            user_data["failed_password_attempts"] += 1
+    return render_template('user_history.html', account_name=account_name, user_activity_history=user_activity_history, message=message, filters=filters,
+       type_labels=LEDGER_TYPE_LABELS, newest_url=newest_url, older_url=older_url)
 
-            if attempts >= MAX_ATTEMPTS:
-                current_failed_attempts_for_cpw = user_data["failed_password_attempts"]
-                lockout_duration_minutes = 2 ** current_failed_attempts_for_cpw
-                lockout_time = datetime.datetime.now() + datetime.timedelta(minutes=lockout_duration_minutes)
-                user_data["lockout_until"] = lockout_time.isoformat()
-                message = f"Hata: Mevcut parola yanlış. Çok fazla hatalı deneme. Hesabınız {lockout_duration_minutes} dakika kilitlendi."
-                session.pop('username', None) # Kilitlendiği için oturumu kapat
-                save_user_data()
-                return redirect(url_for('login_route', message=message))
-            else:
-                message = f"Hata: Mevcut parola yanlış. Kalan deneme hakkı: {MAX_ATTEMPTS - attempts}"
-            save_user_data() # Save failed attempt count after each try
 
-    return render_template_string('''
+TEMPLATES['change_password.html'] = '''
         <!DOCTYPE html>
         <html lang="tr">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Parola Değiştir</title>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f0f2f5; margin: 0; display: flex; justify-content: center; align-items: center; height: 100vh; color: #333; }
-                .container { background-color: #ffffff; padding: 40px; border-radius: 12px; box-shadow: 0 8px 16px rgba(0,0,0,0.1); max-width: 450px; width: 90%; animation: slideIn 0.8s ease-out; }
-                h1 { color: #0056b3; text-align: center; margin-bottom: 30px; font-size: 2em; font-weight: 600; }
-                .message { text-align: center; margin-bottom: 20px; padding: 10px; border-radius: 8px; font-weight: 500; }
-                .message.success { background-color: #d4edda; color: #155724; border: 1px solid #c3e6cb; animation: slideInFromTop 0.5s ease; }
-                .message.error { background-color: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; animation: shake 0.5s; }
-                form p { margin-bottom: 20px; text-align: left; }
-                form label { display: block; margin-bottom: 8px; color: #555; font-weight: 500; }
-                form input[type="password"] { width: calc(100% - 22px); padding: 12px; border: 1px solid #ced4da; border-radius: 8px; font-size: 1em; transition: border-color 0.3s ease, box-shadow 0.3s ease; }
-                form input[type="password"]:focus { border-color: #007bff; box-shadow: 0 0 0 0.2rem rgba(0,123,255,.25); outline: none; }
-                form input[type="submit"] { width: 100%; padding: 12px; border: none; border-radius: 8px; background-color: #007bff; color: white; font-size: 1.1em; cursor: pointer; transition: background-color 0.3s ease, transform 0.2s ease; margin-top: 20px; }
-                form input[type="submit"]:hover { background-color: #0056b3; transform: translateY(-2px); }
-                .back-link { display: block; text-align: center; margin-top: 25px; color: #6c757d; text-decoration: none; font-weight: 500; transition: color 0.3s ease; }
-                .back-link:hover { color: #495057; text-decoration: underline; }
-                @keyframes slideIn { from { opacity: 0; transform: translateY(-30px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes slideInFromTop { from { opacity: 0; transform: translateY(-10px); } to { opacity: 1; transform: translateY(0); } }
-                @keyframes shake { 0%, 100% { transform: translateX(0); } 10%, 30%, 50%, 70%, 90% { transform: translateX(-5px); } 20%, 40%, 60%, 80% { transform: translateX(5px); } }
-            </style>
+            <link rel="stylesheet" href="{{ stylesheet_url }}">
         </head>
-        <body>
+        <body class="page-change_password">
             <div class="container">
                 <h1>Parola Değiştir</h1>
                 {% if message %}<p class="message {% if 'Hata' not in message %}success{% else %}error{% endif %}">{{ message }}</p>{% endif %}
@@ -1070,15 +3672,810 @@ def change_password_route(account_name):
             </div>
         </body>
         </html>
-    ''', account_name=account_name, message=message)
+    '''
+
+@app.route('/account/<account_name>/change_password', methods=['GET', 'POST'])
+def change_password_route(account_name):
+    if 'username' not in session:
+        return redirect(url_for('login_route'))
+    username = session['username']
+    user_data = users.get(username)
+    if not user_data:
+        return redirect(url_for('logout'))
+
+    message = request.args.get('message', '')
+
+    # Check if user is currently locked out
+    if lockout_index.remaining(username):
+        return redirect(url_for('account_operations', account_name=account_name, message="Hesabınız kilitli olduğu için parola değiştiremezsiniz."))
+
+    if request.method == 'POST':
+        current_password = request.form['current_password']
+        new_password = request.form['new_password']
+        throttle_message = login_throttle_message(username)
+        if throttle_message:
+            return render_template('change_password.html', account_name=account_name, message=throttle_message), 429
+
+        # Parola kontrolü ve yeni parolanın özeti kilit dışında, süreç havuzunda hesaplanır
+        try:
+            password_ok, _ = verify_password(user_data["parola"], current_password)
+            policy_ok = any(char.isupper() for char in new_password) and any(char.isdigit() for char in new_password)
+            new_password_hash = hash_password(new_password) if password_ok and policy_ok else None
+        except PasswordPoolBusy:
+            return render_template('change_password.html', account_name=account_name, message=PASSWORD_POOL_BUSY_MESSAGE)
+
+        with lock_manager.locked((username, None)):
+            user_data = users[username]
+            attempts = session.get('change_password_attempts', 0)
+            MAX_ATTEMPTS = 3
+
+            if password_ok:
+                # Correct password, reset failed attempts and lockout
+                fields = {"failed_password_attempts": 0, "lockout_until": None}
+                session['change_password_attempts'] = 0
+
+                # Password policy checks for new password
+                if not new_password_hash:
+                    commit_changes((username, {"f": fields}))
+                    message = "Hata: Yeni parola en az bir büyük harf ve bir rakam içermelidir."
+                else:
+                    fields["parola"] = new_password_hash
+                    commit_changes((username, {"f": fields, "p": [posting("password_changed")]}), sync=True)
+                    message = "Parolanız başarıyla değiştirildi."
+                    return redirect(url_for('account_operations', account_name=account_name, message=message))
+            else:
+                attempts += 1
+                session['change_password_attempts'] = attempts
+                fields = {"failed_password_attempts": user_data["failed_password_attempts"] + 1}
+
+                if attempts >= MAX_ATTEMPTS:
+                    current_failed_attempts_for_cpw = fields["failed_password_attempts"]
+                    lockout_duration_minutes = 2 ** current_failed_attempts_for_cpw
+                    lockout_time = datetime.datetime.now() + datetime.timedelta(minutes=lockout_duration_minutes)
+                    fields["lockout_until"] = lockout_time.isoformat()
+                    message = f"Hata: Mevcut parola yanlış. Çok fazla hatalı deneme. Hesabınız {lockout_duration_minutes} dakika kilitlendi."
+                    session.pop('username', None) # Kilitlendiği için oturumu kapat
+                    commit_changes((username, {"f": fields}))
+                    return redirect(url_for('login_route', message=message))
+                else:
+                    message = f"Hata: Mevcut parola yanlış. Kalan deneme hakkı: {MAX_ATTEMPTS - attempts}"
+                commit_changes((username, {"f": fields})) # Save failed attempt count after each try
+
+    return render_template('change_password.html', account_name=account_name, message=message)
 
 @app.route('/logout')
 def logout():
     session.pop('username', None)
     return redirect(url_for('home'))
 
-# Call load_user_data outside of any request context
-load_user_data()
+# JSON API (/api/v1): aynı *_web işlevlerini ve kurallarını kullanır, oturum
+# yerine "Authorization: Bearer <anahtar>" başlığıyla çalışır
+def api_response(payload, status=200):
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+    return app.response_class(body, status=status, mimetype='application/json')
+
+def api_error(message, status=400):
+    return api_response({"ok": False, "error": message}, status)
+
+@app.errorhandler(JournalWriteError)
+def journal_write_error(error):
+    if request.path.startswith('/api/'):
+        return api_error(JOURNAL_WRITE_ERROR_MESSAGE, 503)
+    return app.response_class(JOURNAL_WRITE_ERROR_MESSAGE, status=503, mimetype='text/plain')
+
+def issue_api_token(username):
+    """Creates a token for username and drops the expired ones."""
+    token = secrets.token_urlsafe(32)
+    if SHARED_STORAGE:
+        # Anahtar hangi işçiye gelirse gelsin tanınsın diye veritabanında tutulur
+        storage.save_api_token(token, username, time.time() + API_TOKEN_TTL_SECONDS)
+        return token
+    now = time.monotonic()
+    with api_tokens_lock:
+        # Anahtarlar veriliş sırasıyla durduğu için süresi dolanlar hep baştadır
+        while api_tokens and next(iter(api_tokens.values()))[1] <= now:
+            api_tokens.popitem(last=False)
+        api_tokens[token] = (username, now + API_TOKEN_TTL_SECONDS)
+    return token
+
+def api_auth(view):
+    """Passes the username of a valid bearer token to view, or answers 401."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer':
+            username = None
+        elif SHARED_STORAGE:
+            username = storage.api_token_user(token)
+            if username is not None:
+                users.refresh(username)
+        else:
+            with api_tokens_lock:
+                entry = api_tokens.get(token)
+            username = entry[0] if entry is not None and entry[1] > time.monotonic() else None
+        if username is None:
+            return api_error("Geçersiz veya süresi dolmuş oturum anahtarı.", 401)
+        return view(username, *args, **kwargs)
+    return wrapper
+
+def api_amount(body):
+    """Reads "amount" from a JSON body; returns None if it is not a finite number."""
+    try:
+        amount = float(body.get("amount"))
+    except (TypeError, ValueError):
+        return None
+    return amount if math.isfinite(amount) else None
+
+def api_result(username, success, message, *account_names):
+    """Turns a *_web (success, message) pair into a response with the touched balances."""
+    if not success:
+        return api_error(message)
+    accounts = users[username]['accounts']
+    return api_response({"ok": True, "message": message, "balances": {name: accounts[name]['bakiye'] for name in account_names}})
+
+def api_history(username, account_name):
+    query, filters, error = history_query()
+    if error:
+        return api_error(error)
+    entries, next_cursor = user_ledger_page(username, users[username], account_name, **query)
+    return api_response({"ok": True, "entries": entries, "next_cursor": next_cursor})
+
+def api_batch_external_transfer(username, account_name, body):
+    """Body: {"transfers": [{"recipient_username", "recipient_account", "amount"}, ...], "partial": false}."""
+    items = body.get("transfers")
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return api_error("Hata: 'transfers' bir havale listesi olmalıdır.")
+    transfers = [(str(item.get("recipient_username", "")), str(item.get("recipient_account", "")), api_amount(item)) for item in items]
+    success, message, results = batch_external_transfer_web(username, account_name, transfers, bool(body.get("partial")))
+    payload = {
+        "ok": success,
+        "message": message,
+        "results": [{"ok": True} if ok else {"ok": False, "error": text} for ok, text in results],
+        "balances": {account_name: users[username]['accounts'][account_name]['bakiye']}
+    }
+    return api_response(payload, 200 if success else 400)
+
+@app.route('/api/v1/login', methods=['POST'])
+def api_login():
+    body = request.get_json(silent=True) or {}
+    throttle_message = login_throttle_message(str(body.get("username", "")))
+    if throttle_message:
+        return api_error(throttle_message, 429)
+    success, message, username = login_web(str(body.get("username", "")), str(body.get("password", "")))
+    if not success:
+        return api_error(message, 401)
+    return api_response({"ok": True, "token": issue_api_token(username), "expires_in": API_TOKEN_TTL_SECONDS})
+
+@app.route('/api/v1/logout', methods=['POST'])
+@api_auth
+def api_logout(username):
+    token = request.headers['Authorization'].partition(' ')[2]
+    if SHARED_STORAGE:
+        storage.delete_api_token(token)
+    else:
+        with api_tokens_lock:
+            api_tokens.pop(token, None)
+    return api_response({"ok": True})
+
+@app.route('/api/v1/accounts')
+@api_auth
+def api_accounts(username):
+    accounts = users[username]['accounts']
+    return api_response({"ok": True, "accounts": {name: account['bakiye'] for name, account in accounts.items()}})
+
+@app.route('/api/v1/history')
+@api_auth
+def api_user_history(username):
+    return api_history(username, None)
+
+@app.route('/api/v1/accounts/<account_name>/<operation>', methods=['GET', 'POST'])
+@api_auth
+def api_account_operation(username, account_name, operation):
+    if account_name not in users[username]['accounts']:
+        return api_error("Hesap bulunamadı.", 404)
+    if request.method == 'GET':
+        if operation == 'balance':
+            return api_response({"ok": True, "account": account_name, "balance": balance_web(username, account_name)})
+        if operation == 'history':
+            return api_history(username, account_name)
+        return api_error("Bilinmeyen işlem.", 404)
+
+    body = request.get_json(silent=True) or {}
+    if operation == 'external_transfer_batch':
+        return api_batch_external_transfer(username, account_name, body)
+    amount = api_amount(body)
+    if operation not in ('withdraw', 'deposit', 'internal_transfer', 'external_transfer'):
+        return api_error("Bilinmeyen işlem.", 404)
+    if amount is None:
+        return api_error("Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz.")
+    if operation == 'withdraw':
+        success, message = withdraw_web(username, account_name, amount, channel="api")
+        return api_result(username, success, message, account_name)
+    if operation == 'deposit':
+        success, message = deposit_web(username, account_name, amount)
+        return api_result(username, success, message, account_name)
+    if operation == 'internal_transfer':
+        destination_account_name = str(body.get("destination_account", ""))
+        success, message = internal_transfer_web(username, account_name, destination_account_name, amount, channel="api")
+        return api_result(username, success, message, account_name, destination_account_name)
+    success, message = external_transfer_web(
+        username, account_name, str(body.get("recipient_username", "")), str(body.get("recipient_account", "")), amount, channel="api"
+    )
+    return api_result(username, success, message, account_name)
+
+def admin_auth(view):
+    """Lets requests carrying ADMIN_TOKEN through; the admin endpoints do not exist without it."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return api_error("Bilinmeyen işlem.", 404)
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not secrets.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+            return api_error("Geçersiz yönetici anahtarı.", 401)
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/api/v1/admin/lockouts')
+@admin_auth
+def api_admin_lockouts():
+    lockouts = [
+        {"username": username, "lockout_until": lockout_until, "remaining_seconds": math.ceil(remaining_seconds)}
+        for username, lockout_until, remaining_seconds in lockout_index.locked()
+    ]
+    return api_response({"ok": True, "lockouts": lockouts})
+
+@app.route('/api/v1/admin/transactions')
+@admin_auth
+def api_admin_transactions():
+    """Searches the ledger of every user.
+
+    Query: type, username, account, counterparty, direction (in/out),
+    min_amount/max_amount (TL, absolute), since/until (YYYY-MM-DD, compared
+    with the original date of imported entries), limit and before (the
+    next_cursor of the previous page).
+    """
+    filters = {key: request.args.get(key) or None for key in ("username", "account", "counterparty", "type", "direction")}
+    if filters["type"] is not None and filters["type"] not in LEDGER_TYPE_LABELS:
+        return api_error("Bilinmeyen işlem türü.")
+    if filters["direction"] not in (None, "in", "out"):
+        return api_error('direction "in" veya "out" olmalıdır.')
+    try:
+        for key in ("min_amount", "max_amount"):
+            filters[key] = float(request.args[key]) if request.args.get(key) else None
+            if filters[key] is not None and not math.isfinite(filters[key]):
+                raise ValueError(key)
+    except ValueError:
+        return api_error("Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz.")
+    try:
+        if request.args.get('since'):
+            filters["since"] = datetime.date.fromisoformat(request.args['since']).strftime("%Y-%m-%d 00:00:00")
+        if request.args.get('until'):
+            filters["until"] = datetime.date.fromisoformat(request.args['until']).strftime("%Y-%m-%d 23:59:59")
+    except ValueError:
+        return api_error("Hata: Tarihler YYYY-AA-GG biçiminde olmalıdır.")
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), LEDGER_SEARCH_PAGE_MAX)
+    entries, next_cursor = storage.search_ledger(filters, limit, request.args.get('before', type=int))
+    return api_response({"ok": True, "entries": entries, "next_cursor": next_cursor})
+
+# Komut satırı işleri (import, end-of-day) arka plan yazıcısı olmadan çalışır
+def flush_offline_batch():
+    """Does the flusher's work after a batch: writes the journal and trims the cache."""
+    with persistence_lock:
+        flush_journal_locked()
+        if users.total_bytes > users.max_bytes:
+            users.write_back(only_over_budget=True)
+
+# Geçmiş işlemlerin toplu aktarımı: python "app (1).py" import <dosya>
+def read_import_rows(path, file_format):
+    """Yields (line_number, row) from a CSV file with a header line or a JSONL file.
+
+    row is None for a JSONL line that is not a JSON object.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+def parse_import_rows(rows):
+    """Turns raw rows into (line_number, row, error) with a numeric amount and a normalised time."""
+    for line_number, row in rows:
+        if row is None:
+            yield line_number, row, "Satır okunamadı."
+            continue
+        if row.get("type") not in ('deposit', 'withdraw', 'internal_transfer', 'external_transfer'):
+            yield line_number, row, f"Bilinmeyen işlem türü: {row.get('type')!r}"
+            continue
+        try:
+            row["amount"] = float(row.get("amount"))
+        except (TypeError, ValueError):
+            yield line_number, row, "Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz."
+            continue
+        if not math.isfinite(row["amount"]):
+            yield line_number, row, "Hata: Geçersiz tutar girdiniz. Lütfen sayısal bir değer giriniz."
+            continue
+        if row.get("timestamp"):
+            try:
+                row["timestamp"] = datetime.datetime.fromisoformat(row["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+            except (TypeError, ValueError):
+                yield line_number, row, "Hata: Zaman YYYY-AA-GG SS:DD:ss biçiminde olmalıdır."
+                continue
+        yield line_number, row, None
+
+class LedgerImporter:
+    """Applies imported rows in batches of one journal record each.
+
+    Rows are checked with the rules of the routes (withdrawal_error,
+    deposit_error, HAVALE_UCRETI) against the balances as they will be after
+    the earlier rows of the same batch, which are kept in a small per-batch
+    dict, so memory does not grow with the file. Withdrawal and transfer
+    limits are not checked: the rows already happened in the system they come
+    from. Once imported they count towards the limits engine's windows by
+    their original time, like any other posting. Entries are booked at import
+    time ("t", which keeps the history index sorted) and carry the original
+    time of the row as "vt". The importer runs on its own (without the
+    flusher): it flushes the journal after every batch and checkpoints once at
+    the end.
+    """
+
+    def __init__(self, rejects=None):
+        self.rejects = rejects
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+
+    def run(self, rows, batch_size):
+        started = time.perf_counter()
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            self.apply_batch(batch)
+        flush_journal(fsync=True)
+        checkpoint_user_data()
+        return time.perf_counter() - started
+
+    def apply_batch(self, batch):
+        self.balances = {}
+        changes = []
+        for line_number, row, error in batch:
+            self.rows += 1
+            if error is None:
+                error = self.check(row, changes)
+            if error:
+                self.rejected += 1
+                if self.rejects is not None:
+                    self.rejects.write(f"{line_number}\t{error}\n")
+            else:
+                self.imported += 1
+        if changes:
+            commit_changes(*changes)
+        flush_offline_batch()
+
+    def balance(self, username, account_name):
+        key = (username, account_name)
+        if key not in self.balances:
+            self.balances[key] = users[username]['accounts'][account_name]['bakiye']
+        return self.balances[key]
+
+    def check(self, row, changes):
+        """Validates one row; on success appends its changes and returns None."""
+        username = row.get("username")
+        account_name = row.get("account")
+        amount = row["amount"]
+        if not username or username not in users:
+            return "Hata: Belirtilen kullanıcı bulunamadı."
+        user_data = users[username]
+        if account_name not in user_data['accounts']:
+            return "Hata: Geçersiz hesap seçimi."
+        value_time = {"vt": row["timestamp"]} if row.get("timestamp") else {}
+
+        balance = self.balance(username, account_name)
+        kind = row["type"]
+        if kind == 'deposit':
+            error = deposit_error(amount)
+            if error:
+                return error
+            entries = [posting("deposit", account_name, amount, CASH_ACCOUNT, **value_time)]
+            change = {"p": entries}
+        elif kind == 'withdraw':
+            error = withdrawal_error(balance, amount)
+            if error:
+                return error
+            entries = [posting("withdraw", account_name, -amount, CASH_ACCOUNT, **value_time)]
+            change = {"p": entries}
+        elif kind == 'internal_transfer':
+            destination_account_name = row.get("destination_account")
+            if destination_account_name == account_name or destination_account_name not in user_data['accounts']:
+                return "Hata: Geçersiz kaynak veya hedef hesap seçimi."
+            if amount <= 0:
+                return "Hata: Transfer tutarı pozitif olmalıdır."
+            if balance < amount:
+                return f"Yetersiz bakiye! {account_name} hesabınızda {balance:.2f} TL var."
+            self.balances[(username, destination_account_name)] = self.balance(username, destination_account_name) + amount
+            entries = [
+                posting("internal_transfer", account_name, -amount, username, destination_account_name, **value_time),
+                posting("internal_transfer", destination_account_name, amount, username, account_name, **value_time)
+            ]
+            change = {"p": entries}
+        else:
+            recipient_username = row.get("recipient_username")
+            recipient_account_name = row.get("recipient_account")
+            if amount <= 0:
+                return "Hata: Gönderilecek tutar pozitif olmalıdır."
+            if recipient_username == username:
+                return "Hata: Kendi hesabınıza harici havale yapamazsınız. Hesaplarım Arası Havale'yi kullanın."
+            if not recipient_username or recipient_username not in users:
+                return "Hata: Belirtilen kullanıcı bulunamadı."
+            if recipient_account_name not in users[recipient_username]['accounts']:
+                return "Hata: Alıcının belirtilen hesabı bulunamadı."
+            if balance < amount + HAVALE_UCRETI:
+                return f"Yetersiz bakiye! İşlem için {amount + HAVALE_UCRETI} TL gerekmektedir. Mevcut bakiyeniz: {balance} TL."
+            self.balances[(recipient_username, recipient_account_name)] = self.balance(recipient_username, recipient_account_name) + amount
+            entries = [
+                posting("external_transfer", account_name, -amount, recipient_username, recipient_account_name, **value_time),
+                posting("fee", account_name, -HAVALE_UCRETI, FEE_ACCOUNT, **value_time)
+            ]
+            change = {"p": entries}
+            changes.append((recipient_username, {"p": [posting("external_transfer", recipient_account_name, amount, username, account_name, **value_time)]}))
+        self.balances[(username, account_name)] = balance + sum(entry["amt"] for entry in entries if entry["a"] == account_name)
+        changes.append((username, change))
+        return None
+
+# Gün sonu: python "app (1).py" end-of-day [--date YYYY-AA-GG]
+def end_of_day_amounts(balances, interest_accounts, fee_accounts, rate_basis_points, fee):
+    """Computes interest and fees for a chunk of accounts, all amounts in kuruş.
+
+    balances is a sequence of int balances; interest_accounts and fee_accounts
+    are boolean sequences of the same length. Interest is the daily share of
+    the yearly rate, rounded down; the fee is only taken from accounts that
+    can pay it. Returns (interest, fees) as int64 arrays, or lists without NumPy.
+    """
+    daily_divisor = 365 * 10000
+    if numpy is not None:
+        balances = numpy.asarray(balances, dtype=numpy.int64)
+        positive = balances > 0
+        interest = numpy.where(numpy.asarray(interest_accounts) & positive, balances * rate_basis_points // daily_divisor, 0)
+        fees = numpy.where(numpy.asarray(fee_accounts) & (balances >= fee) & (fee > 0), fee, 0)
+        return interest, fees
+    interest = [balance * rate_basis_points // daily_divisor if wanted and balance > 0 else 0 for balance, wanted in zip(balances, interest_accounts)]
+    fees = [fee if wanted and fee > 0 and balance >= fee else 0 for balance, wanted in zip(balances, fee_accounts)]
+    return interest, fees
 
-if __name__ == '__main__':
-    app.run(debug=False, use_reloader=False, port=8000)
+def end_of_day_chunk(usernames, day, totals):
+    """Closes day for a chunk of users with one journal record.
+
+    The users' accounts are locked while their balances are copied into
+    fixed-point (kuruş) arrays, the interest and fees are computed on the
+    whole chunk at once and the resulting postings are committed. Users whose
+    last_end_of_day is already day are skipped, so a rerun after a crash only
+    does the remaining chunks.
+    """
+    chunk = [(username, users[username]) for username in usernames]
+    chunk = [(username, user_data) for username, user_data in chunk if (user_data.get("last_end_of_day") or "") < day]
+    if not chunk:
+        return
+    keys = [(username, None) for username, _ in chunk]
+    keys.extend((username, account_name) for username, user_data in chunk for account_name in user_data['accounts'])
+    with lock_manager.locked(*keys):
+        owners, account_names, balances, interest_accounts, fee_accounts = [], [], [], [], []
+        for index, (username, user_data) in enumerate(chunk):
+            for account_name, account in user_data['accounts'].items():
+                owners.append(index)
+                account_names.append(account_name)
+                balances.append(round(account['bakiye'] * 100))
+                interest_accounts.append(account_name == "Birikim")
+                fee_accounts.append(account_name == "Vadesiz")
+        interest, fees = end_of_day_amounts(
+            balances, interest_accounts, fee_accounts,
+            round(BIRIKIM_YILLIK_FAIZ * 10000), round(HESAP_ISLETIM_UCRETI * 100)
+        )
+
+        changes = [(username, {"f": {"last_end_of_day": day}, "p": []}) for username, _ in chunk]
+        for position in (numpy.flatnonzero(interest) if numpy is not None else [i for i, value in enumerate(interest) if value]):
+            amount = int(interest[position])
+            changes[owners[position]][1]["p"].append(posting("interest", account_names[position], amount / 100, FEE_ACCOUNT))
+            totals["interest"] += amount
+        for position in (numpy.flatnonzero(fees) if numpy is not None else [i for i, value in enumerate(fees) if value]):
+            amount = int(fees[position])
+            changes[owners[position]][1]["p"].append(posting("account_fee", account_names[position], -amount / 100, FEE_ACCOUNT))
+            totals["fees"] += amount
+        commit_changes(*changes)
+    totals["users"] += len(chunk)
+    totals["accounts"] += len(balances)
+    flush_offline_batch()
+
+def run_end_of_day(day, chunk_size=END_OF_DAY_CHUNK_SIZE):
+    """Runs the end-of-day job over every stored user; returns the totals and the elapsed time."""
+    started = time.perf_counter()
+    # Yalnızca günlükte olan kullanıcılar da depoda görünsün diye önce checkpoint alınır
+    checkpoint_user_data()
+    totals = {"users": 0, "accounts": 0, "interest": 0, "fees": 0}
+    usernames = storage.iter_usernames()
+    while True:
+        chunk = list(itertools.islice(usernames, chunk_size))
+        if not chunk:
+            break
+        end_of_day_chunk(chunk, day, totals)
+    flush_journal(fsync=True)
+    checkpoint_user_data()
+    return totals, time.perf_counter() - started
+
+def end_of_day_command(args):
+    try:
+        day = datetime.date.fromisoformat(args.date).isoformat() if args.date else datetime.date.today().isoformat()
+    except ValueError:
+        print("Hata: Tarih YYYY-AA-GG biçiminde olmalıdır.")
+        return 1
+    totals, elapsed = run_end_of_day(day, args.chunk_size)
+    print(f"{day} gün sonu tamamlandı: {totals['users']} kullanıcı, {totals['accounts']} hesap, "
+          f"faiz {totals['interest'] / 100:.2f} TL, ücret {totals['fees'] / 100:.2f} TL. {elapsed:.2f} sn"
+          f"{'' if numpy is not None else ' (NumPy yok, düz Python kullanıldı)'}.")
+    return 0
+
+def import_command(args):
+    file_format = args.format or ('csv' if args.path.lower().endswith('.csv') else 'jsonl')
+    rejects = open(args.rejects, 'w', encoding='utf-8') if args.rejects else None
+    try:
+        importer = LedgerImporter(rejects)
+        elapsed = importer.run(parse_import_rows(read_import_rows(args.path, file_format)), args.batch_size)
+    finally:
+        if rejects is not None:
+            rejects.close()
+    rate = importer.rows / elapsed if elapsed else 0
+    print(f"Aktarım tamamlandı: {importer.rows} satır, {importer.imported} aktarıldı, {importer.rejected} reddedildi. "
+          f"{elapsed:.2f} sn ({rate:.0f} satır/sn).")
+    if importer.rejected and not args.rejects:
+        print("Reddedilen satırları görmek için --rejects <dosya> kullanın.")
+    return 0
+
+def export_users_file(path):
+    """Writes every stored user to path in the users.json format; returns the user count."""
+    checkpoint_user_data()
+    count = 0
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write('{')
+        for username in storage.iter_usernames():
+            user_data = storage.read_user(username)[0]
+            if not storage.keeps_history:
+                pages, before = [], None
+                while True:
+                    entries, before = storage.ledger_page(username, user_data, None, 1000, before)
+                    pages.append(entries)
+                    if before is None:
+                        break
+                user_data["ledger"] = [entry for entries in reversed(pages) for entry in reversed(entries)]
+            # Dosyanın tamamı hafızada kurulmadan json.dump(users, f, indent=4) ile aynı çıktı yazılır
+            f.write((',\n' if count else '\n') + json.dumps({username: user_data}, indent=4, ensure_ascii=False)[2:-2])
+            count += 1
+        f.write('\n}' if count else '}')
+    os.replace(path + '.tmp', path)
+    return count
+
+def snapshot_command(args):
+    if args.to_json:
+        started = time.perf_counter()
+        count = export_users_file(args.to_json)
+        print(f"{count} kullanıcı '{args.to_json}' dosyasına yazıldı. {time.perf_counter() - started:.2f} sn")
+        return 0
+    if STORAGE_BACKEND != 'json':
+        print("Hata: İkili anlık görüntü yalnızca 'json' deposunda kullanılır.")
+        return 1
+    started = time.perf_counter()
+    if args.from_json:
+        if not storage.is_empty():
+            print("Hata: Depo boş değil; users.json yalnızca boş bir depoya dönüştürülebilir.")
+            return 1
+        with open(args.from_json, 'r', encoding='utf-8') as f:
+            old_users = json.load(f)
+        for user_data in old_users.values():
+            upgrade_user_record(user_data)
+        storage.import_users(old_users.items())
+    else:
+        checkpoint_user_data()
+        storage.write_snapshot(journal_seq)
+    print(f"'{SNAPSHOT_FILE}' yazıldı: {storage.snapshot.count} kullanıcı. {time.perf_counter() - started:.2f} sn")
+    return 0
+
+# ASGI ile sunum (serve --asgi): bağlantılar olay döngüsünde bekler, route'lar
+# sınırlı sayıda iş parçacığında çalışır ve diske yazmayı beklemez
+ASGI_WORKERS = int(os.environ.get('ATM_ASGI_WORKERS', 32))
+
+class AsgiBridge:
+    """Serves the Flask app to an ASGI server such as uvicorn.
+
+    Open connections cost the event loop nothing while they wait; a request
+    runs the unchanged Flask routes on one of `workers` threads. Commits made
+    with sync=True there are not flushed in the route: the journal writer
+    task flushes and fsyncs them, together with whatever else is pending, and
+    the response is sent only after that, so a client still sees a money
+    operation succeed only once it is on disk.
+    """
+
+    def __init__(self, wsgi_app, workers):
+        self.wsgi_app = wsgi_app
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='asgi-worker')
+        self.writer_executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='journal-writer')
+        self.waiters = []  # (sıra numarası, sayaç, future) yığını
+        self.waiter_counter = itertools.count()
+        self.wakeup = None
+        self.writer_task = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        if self.writer_task is None:
+            self.wakeup = asyncio.Event()
+            self.writer_task = asyncio.get_running_loop().create_task(self.journal_writer())
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        loop = asyncio.get_running_loop()
+        status, headers, result, chunks, chunk, seq = await loop.run_in_executor(self.executor, self.run_wsgi, self.environ(scope, bytes(body)))
+        try:
+            if seq:
+                await self.durable(seq)
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            # Akış halindeki yanıtların parçaları da iş parçacıklarında üretilir
+            while chunk is not None:
+                next_chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': next_chunk is not None})
+                chunk = next_chunk
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    @staticmethod
+    def environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = 'HTTP_' + name
+                environ[key] = environ[key] + ',' + value if key in environ else value
+        return environ
+
+    def run_wsgi(self, environ):
+        """Runs the Flask app up to its first body chunk; returns what __call__ needs to respond."""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        deferred_sync.active = True
+        deferred_sync.seq = 0
+        try:
+            result = self.wsgi_app(environ, start_response)
+            chunks = iter(result)
+            first_chunk = next(chunks, b'')
+        finally:
+            deferred_sync.active = False
+        return response['status'], response['headers'], result, chunks, first_chunk, deferred_sync.seq
+
+    async def durable(self, seq):
+        """Waits until the journal writer has fsync'ed record seq."""
+        if synced_seq >= seq:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (seq, next(self.waiter_counter), future))
+        self.wakeup.set()
+        await future
+
+    async def journal_writer(self):
+        """Flushes the journal whenever a response waits for it, one fsync for every waiting record."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            await loop.run_in_executor(self.writer_executor, flush_journal, True)
+            while self.waiters and self.waiters[0][0] <= synced_seq:
+                heapq.heappop(self.waiters)[2].set_result(None)
+            if self.waiters:
+                # Yazma başarısız olduysa (ör. disk dolu) kısa bir süre sonra yeniden denenir
+                await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+                self.wakeup.set()
+
+asgi_app = AsgiBridge(app, ASGI_WORKERS)
+
+def create_app():
+    """Application factory for WSGI servers (see wsgi.py).
+
+    The users are loaded when this file is imported; this starts the
+    background threads of the calling worker process and returns app. Run
+    several workers only with ATM_SHARED_STORAGE=1.
+    """
+    start_flusher()
+    start_lockout_sweeper()
+    return app
+
+def parse_command_line(argv):
+    # import, end-of-day ve snapshot aynı veri klasörünü kullanan sunucu kapalıyken çalıştırılmalıdır
+    parser = argparse.ArgumentParser(description="ATM uygulaması")
+    commands = parser.add_subparsers(dest='command')
+    serve = commands.add_parser('serve', help="Web sunucusunu başlatır (varsayılan)")
+    serve.add_argument('--asgi', action='store_true', help="uvicorn ile asyncio üzerinden sunar (uvicorn kurulu olmalıdır)")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    importer = commands.add_parser('import', help="Geçmiş işlemleri CSV veya JSONL dosyasından aktarır (bakiye kuralları uygulanır, limitler uygulanmaz)")
+    importer.add_argument('path', help="Sütunlar: type, username, account, amount, timestamp, destination_account, recipient_username, recipient_account")
+    importer.add_argument('--format', choices=['csv', 'jsonl'], help="Dosya biçimi (varsayılan: uzantıdan)")
+    importer.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Bir günlük kaydına yazılan satır sayısı")
+    importer.add_argument('--rejects', help="Reddedilen satırların numara ve nedenlerinin yazılacağı dosya")
+    end_of_day = commands.add_parser('end-of-day', help="Faiz ve hesap işletim ücretini işler (limitler kayan pencereyle kendiliğinden yenilenir)")
+    end_of_day.add_argument('--date', help="Kapatılan gün, YYYY-AA-GG (varsayılan: bugün)")
+    end_of_day.add_argument('--chunk-size', type=int, default=END_OF_DAY_CHUNK_SIZE, help="Bir günlük kaydında işlenen kullanıcı sayısı")
+    snapshot = commands.add_parser('snapshot', help="json deposunun kullanıcılarını ikili anlık görüntüde (users.snap) toplar")
+    snapshot.add_argument('--from-json', help="Boş depo için anlık görüntüyü bu users.json dosyasından oluşturur")
+    snapshot.add_argument('--to-json', help="Tüm kullanıcıları bu dosyaya users.json biçiminde yazar")
+    return parser.parse_args(argv)
+
+# Parola havuzu süreçleri verileri yüklemez, yazıcıyı başlatmaz
+if not PASSWORD_POOL_PROCESS:
+    # Call load_user_data outside of any request context
+    load_user_data()
+    load_static_assets()
+    compile_templates()
+
+    if __name__ == '__main__':
+        command_line = parse_command_line(sys.argv[1:])
+        if command_line.command == 'import':
+            sys.exit(import_command(command_line))
+        if command_line.command == 'end-of-day':
+            sys.exit(end_of_day_command(command_line))
+        if command_line.command == 'snapshot':
+            sys.exit(snapshot_command(command_line))
+        if getattr(command_line, 'asgi', False) and uvicorn is None:
+            sys.exit("Hata: serve --asgi için uvicorn kurulu olmalıdır (pip install uvicorn).")
+        start_flusher()
+        start_lockout_sweeper()
+        if getattr(command_line, 'asgi', False):
+            uvicorn.run(asgi_app, host=command_line.host, port=command_line.port)
+        else:
+            app.run(debug=False, use_reloader=False, host=getattr(command_line, 'host', '127.0.0.1'), port=getattr(command_line, 'port', 8000))
+    else:
+        start_flusher()
+        start_lockout_sweeper()
@@ -0,0 +1,16 @@
+"""Loads "app (1).py" as a module so the scripts in this folder can use it."""
+import importlib.util
+import os
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app (1).py')
+
+def load_app(workdir, name='atm_app'):
+    """Imports the app with workdir as the current directory, where its data files live."""
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    spec = importlib.util.spec_from_file_location(name, APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
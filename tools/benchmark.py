@@ -0,0 +1,355 @@
+"""Load test for login and the money-moving routes, compared against stored baselines.
+
+    python tools/benchmark.py --users 1000 --mode both --concurrency 8
+    python tools/benchmark.py --users 100000 --storage sqlite --save-baseline
+
+Seeds --users synthetic users (the records register_user_web would create,
+all with the password BENCHMARK_PASSWORD) into a data folder that is kept and
+reused by later runs. Each worker then logs in as a random user and posts a
+deposit, a withdrawal, an internal and an external transfer, through the
+Flask test client, a real HTTP server on localhost, or both. Reports
+throughput, p50/p99 latency per operation, startup time, peak RSS and the size
+of the data folder.
+
+Withdrawal/transfer limits and login throttling are turned off unless they are
+set in the environment, so the numbers measure the routes rather than
+rejections. Results are compared with tools/benchmark_baselines.json: lower
+throughput or higher p99 than the baseline by more than --tolerance is
+reported as a regression and the exit status is 1. Each baseline records the
+machine and settings it was measured with, and is only compared against runs
+on the same kind of machine with the same settings; otherwise save a baseline
+on this host first with --save-baseline.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from apploader import load_app
+
+BENCHMARK_PASSWORD = 'Benchmark1'
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baselines.json')
+SEED_INFO_FILE = 'benchmark-seed.json'
+SEED_BATCH_SIZE = 1000
+OPERATIONS = ('login', 'deposit', 'withdraw', 'internal_transfer', 'external_transfer')
+
+def benchmark_environment(args):
+    os.environ['ATM_STORAGE_BACKEND'] = args.storage
+    if args.hash_iterations:
+        os.environ['ATM_PASSWORD_HASH_ITERATIONS'] = str(args.hash_iterations)
+    os.environ.setdefault('ATM_LIMIT_RULES', '[]')
+    for name in ('ATM_LOGIN_RATE_IP_BURST', 'ATM_LOGIN_RATE_USER_BURST', 'ATM_LOGIN_RATE_IP_PER_MINUTE', 'ATM_LOGIN_RATE_USER_PER_MINUTE'):
+        os.environ.setdefault(name, str(10 ** 9))
+
+def username(index):
+    return f"bench{index}"
+
+def seed(args):
+    """Creates the users in args.data_dir through commit_changes, a batch per journal record."""
+    started = time.perf_counter()
+    app = load_app(args.data_dir)
+    password_hash = app.hash_password(BENCHMARK_PASSWORD)
+    for first in range(0, args.users, SEED_BATCH_SIZE):
+        names = [username(index) for index in range(first, min(first + SEED_BATCH_SIZE, args.users))]
+        app.commit_changes(*((name, app.new_user_change(password_hash, 'soru', 'cevap')) for name in names))
+        app.flush_offline_batch()
+    app.flush_journal(fsync=True)
+    app.checkpoint_user_data()
+    info = {"users": args.users, "storage": args.storage, "hash_iterations": app.PASSWORD_HASH_ITERATIONS, "seconds": time.perf_counter() - started}
+    with open(os.path.join(args.data_dir, SEED_INFO_FILE), 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return 0
+
+def ensure_seeded(args):
+    """Seeds the data folder in a child process, so this process starts the app cold."""
+    info_path = os.path.join(args.data_dir, SEED_INFO_FILE)
+    if not os.path.exists(info_path):
+        if os.path.exists(args.data_dir) and os.listdir(args.data_dir):
+            sys.exit(f"Hata: '{args.data_dir}' boş değil ama benchmark verisi içermiyor.")
+        print(f"{args.users} kullanıcı '{args.data_dir}' klasörüne yazılıyor...")
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--seed-only'] + sys.argv[1:], check=True)
+    with open(info_path, encoding='utf-8') as f:
+        return json.load(f)
+
+class TestClientDriver:
+    """Sends form posts through the Flask test client, which keeps the session cookie."""
+
+    def __init__(self, app):
+        self.client = app.app.test_client()
+
+    def post(self, path, form):
+        return self.client.post(path, data=form).status_code
+
+    def close(self):
+        pass
+
+class HttpDriver:
+    """Sends form posts over one keep-alive HTTP connection and keeps the session cookie."""
+
+    def __init__(self, port):
+        self.port = port
+        self.connection = http.client.HTTPConnection('127.0.0.1', port)
+        self.cookie = None
+
+    def post(self, path, form):
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        body = urllib.parse.urlencode(form)
+        try:
+            self.connection.request('POST', path, body, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # Sunucu bağlantıyı kapattıysa bir kez yeniden bağlanılır
+            self.connection.close()
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port)
+            self.connection.request('POST', path, body, headers)
+            response = self.connection.getresponse()
+        response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status
+
+    def close(self):
+        self.connection.close()
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run_load(app, make_driver, users, concurrency, iterations):
+    """Runs concurrency workers for iterations rounds of OPERATIONS; returns the results dict."""
+    latencies = {operation: [] for operation in OPERATIONS}
+    errors = {operation: 0 for operation in OPERATIONS}
+    results_lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        driver = make_driver()
+        own_latencies = {operation: [] for operation in OPERATIONS}
+        own_errors = {operation: 0 for operation in OPERATIONS}
+        for _ in range(iterations):
+            name = username(rng.randrange(users))
+            other = username(rng.randrange(users))
+            steps = (
+                ('login', '/login', {"username": name, "password": BENCHMARK_PASSWORD}),
+                ('deposit', '/account/Vadesiz/deposit', {"amount": "100"}),
+                ('withdraw', '/account/Vadesiz/withdraw', {"amount": "100"}),
+                ('internal_transfer', '/account/Vadesiz/internal_transfer', {"source_account": "Vadesiz", "destination_account": "Birikim", "amount": "10"}),
+                ('external_transfer', '/account/Vadesiz/external_transfer', {"recipient_username": other, "recipient_account_name": "Vadesiz", "amount": "10"}),
+            )
+            for operation, path, form in steps:
+                started = time.perf_counter()
+                status = driver.post(path, form)
+                own_latencies[operation].append(time.perf_counter() - started)
+                own_errors[operation] += status >= 400
+        driver.close()
+        with results_lock:
+            for operation in OPERATIONS:
+                latencies[operation].extend(own_latencies[operation])
+                errors[operation] += own_errors[operation]
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    requests = sum(len(values) for values in latencies.values())
+    return {
+        "requests": requests,
+        "seconds": elapsed,
+        "throughput": requests / elapsed,
+        "operations": {
+            operation: {
+                "count": len(latencies[operation]),
+                "errors": errors[operation],
+                "p50_ms": percentile(latencies[operation], 0.50) * 1000,
+                "p99_ms": percentile(latencies[operation], 0.99) * 1000
+            }
+            for operation in OPERATIONS
+        }
+    }
+
+def start_http_server(app):
+    from werkzeug.serving import make_server
+    # Her isteğin erişim kaydı ölçümü bozmasın
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="benchmark-http", daemon=True).start()
+    return server
+
+def data_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+def host_info():
+    """Describes the machine a run is made on; baselines only apply to the same one."""
+    return {
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "cpu": cpu_model(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version()
+    }
+
+def run_config(args, seed_info):
+    return {"iterations": args.iterations, "hash_iterations": seed_info["hash_iterations"]}
+
+def baseline_mismatch(baseline, host, config):
+    """Returns the host/config fields that differ from the run that recorded baseline."""
+    recorded = {**baseline.get("host", {}), **baseline.get("config", {})}
+    current = {**host, **config}
+    return [f"{field}: {recorded.get(field)!r} -> {value!r}" for field, value in current.items() if recorded.get(field) != value]
+
+def compare(key, results, baselines, tolerance):
+    """Returns the regressions of results against the stored baseline for key."""
+    baseline = baselines.get(key)
+    if baseline is None:
+        return []
+    regressions = []
+    if results["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"{key}: verim {results['throughput']:.0f} istek/sn, temel değer {baseline['throughput']:.0f}")
+    for operation, p99 in baseline["p99_ms"].items():
+        current = results["operations"][operation]["p99_ms"]
+        if current > p99 * (1 + tolerance):
+            regressions.append(f"{key}: {operation} p99 {current:.2f} ms, temel değer {p99:.2f} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000, help="kullanıcı sayısı (ör. 1000, 100000, 1000000)")
+    parser.add_argument('--storage', default=os.environ.get('ATM_STORAGE_BACKEND', 'json'), choices=('json', 'sqlite'))
+    parser.add_argument('--mode', default='both', choices=('client', 'http', 'both'))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=50, help="iş parçacığı başına tur sayısı (tur başına 5 istek)")
+    parser.add_argument('--hash-iterations', type=int, default=None, help="PBKDF2 tur sayısı (varsayılan: uygulamanınki)")
+    parser.add_argument('--data-dir', default=None, help="varsayılan: geçici klasörde depo ve kullanıcı sayısına göre adlandırılır")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save-baseline', action='store_true', help="sonuçları temel değer olarak kaydet")
+    parser.add_argument('--json', action='store_true', help="sonuçları JSON olarak yazdır")
+    parser.add_argument('--seed-only', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.data_dir = os.path.abspath(args.data_dir or os.path.join(tempfile.gettempdir(), f"atm-benchmark-{args.storage}-{args.users}"))
+    benchmark_environment(args)
+
+    if args.seed_only:
+        return seed(args)
+    seed_info = ensure_seeded(args)
+    if seed_info["users"] != args.users or seed_info["storage"] != args.storage:
+        sys.exit(f"Hata: '{args.data_dir}' klasöründeki veri {seed_info['users']} kullanıcı / {seed_info['storage']} için hazırlanmış.")
+    host = host_info()
+    config = run_config(args, seed_info)
+
+    started = time.perf_counter()
+    app = load_app(args.data_dir)
+    startup_seconds = time.perf_counter() - started
+    app.start_flusher()
+
+    report = {
+        "users": args.users,
+        "storage": args.storage,
+        "concurrency": args.concurrency,
+        "host": host,
+        "config": config,
+        "seed_seconds": seed_info["seconds"],
+        "startup_seconds": startup_seconds,
+        "runs": {}
+    }
+    modes = ('client', 'http') if args.mode == 'both' else (args.mode,)
+    for mode in modes:
+        if mode == 'client':
+            report["runs"][mode] = run_load(app, lambda: TestClientDriver(app), args.users, args.concurrency, args.iterations)
+        else:
+            server = start_http_server(app)
+            port = server.server_port
+            report["runs"][mode] = run_load(app, lambda: HttpDriver(port), args.users, args.concurrency, args.iterations)
+            server.shutdown()
+    app.flush_journal(fsync=True)
+    # Linux'ta ru_maxrss KB cinsindendir
+    report["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    report["data_bytes"] = data_size(args.data_dir)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.users} kullanıcı ({args.storage}), eş zamanlılık {args.concurrency}")
+        print(f"Veri hazırlama {report['seed_seconds']:.1f} sn, açılış {startup_seconds:.2f} sn, en yüksek RSS {report['peak_rss_mb']:.0f} MB, veri {report['data_bytes'] / 1e6:.1f} MB")
+        for mode, results in report["runs"].items():
+            print(f"[{mode}] {results['requests']} istek, {results['seconds']:.2f} sn, {results['throughput']:.0f} istek/sn")
+            for operation, stats in results["operations"].items():
+                print(f"    {operation:<18} p50 {stats['p50_ms']:8.2f} ms   p99 {stats['p99_ms']:8.2f} ms   hata {stats['errors']}")
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, encoding='utf-8') as f:
+            baselines = json.load(f)
+    keys = {mode: f"{args.storage}/{args.users}/{mode}/c{args.concurrency}" for mode in report["runs"]}
+    if args.save_baseline:
+        for mode, results in report["runs"].items():
+            baselines[keys[mode]] = {
+                "host": host,
+                "config": config,
+                "throughput": round(results["throughput"], 1),
+                "p99_ms": {operation: round(stats["p99_ms"], 3) for operation, stats in results["operations"].items()}
+            }
+        with open(BASELINES_PATH, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Temel değerler '{BASELINES_PATH}' dosyasına yazıldı.")
+        return 0
+
+    # Başka bir makinede ya da başka ayarlarla ölçülmüş temel değerle
+    # karşılaştırmak yanlış gerileme/başarı verir; bunlar atlanır.
+    comparable = {}
+    for mode, key in keys.items():
+        if key not in baselines:
+            continue
+        mismatch = baseline_mismatch(baselines[key], host, config)
+        if mismatch:
+            print(f"{key}: temel değer farklı bir makinede/ayarla ölçülmüş, karşılaştırılmadı ({'; '.join(mismatch)}).")
+            print("    Bu makine için --save-baseline ile yeni temel değer kaydedin.")
+        else:
+            comparable[mode] = key
+    regressions = [line for mode, key in comparable.items() for line in compare(key, report["runs"][mode], baselines, args.tolerance)]
+    if regressions:
+        print("GERİLEME:")
+        for line in regressions:
+            print(f"    {line}")
+        return 1
+    if not any(key in baselines for key in keys.values()):
+        print("Bu ayarlar için kayıtlı temel değer yok (--save-baseline ile kaydedilebilir).")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
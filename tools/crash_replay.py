@@ -0,0 +1,77 @@
+"""Checks that journal records written before a crash are replayed on the next start.
+
+    python tools/crash_replay.py
+    python tools/crash_replay.py --storage sqlite
+
+A child process creates a user and checkpoints, then imports one batch that
+posts several deposits to the same account of that user (one journal record
+with a change per row), flushes the journal with fsync and exits without
+running its exit handlers, as if it had been killed before the next
+checkpoint. A second child starts the app on the same data folder; the
+balance it sees must include every imported row. The exit status is 1 if it
+does not.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from apploader import load_app
+
+USERNAME = "ali"
+ACCOUNT = "Vadesiz"
+DEPOSITS = (100.0, 200.0, 300.0)
+EXPECTED_FILE = "crash_expected.txt"
+
+def write_phase(data_dir):
+    app = load_app(data_dir)
+    # Parola özeti önemli değil; hash_password parola havuzunu başlatır, havuz da os._exit'ten sonra geride kalır
+    app.commit_changes((USERNAME, app.new_user_change("-", 'soru', 'cevap')))
+    app.checkpoint_user_data()
+    expected = app.users[USERNAME]['accounts'][ACCOUNT]['bakiye'] + sum(DEPOSITS)
+    rows = [(number, {"username": USERNAME, "account": ACCOUNT, "type": "deposit", "amount": amount}, None)
+            for number, amount in enumerate(DEPOSITS, 1)]
+    importer = app.LedgerImporter()
+    importer.apply_batch(rows)
+    app.flush_journal(fsync=True)
+    with open(EXPECTED_FILE, 'w', encoding='utf-8') as f:
+        f.write(repr(expected))
+    print(f"Kaza öncesi bakiye: {app.users[USERNAME]['accounts'][ACCOUNT]['bakiye']:.2f} TL")
+    # Çıkış işleyicileri (günlük yazma, checkpoint) çalışmadan süreci bitir
+    os._exit(0)
+
+def check_phase(data_dir):
+    app = load_app(data_dir)
+    balance = app.users[USERNAME]['accounts'][ACCOUNT]['bakiye']
+    with open(EXPECTED_FILE, encoding='utf-8') as f:
+        expected = float(f.read())
+    print(f"Yeniden açılıştan sonra bakiye: {balance:.2f} TL (beklenen {expected:.2f} TL)")
+    return 0 if abs(balance - expected) < 0.005 else 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--storage', default=None, help="json veya sqlite (varsayılan: ATM_STORAGE_BACKEND)")
+    parser.add_argument('--phase', choices=('write', 'check'), help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.storage:
+        os.environ['ATM_STORAGE_BACKEND'] = args.storage
+    if args.phase == 'write':
+        return write_phase(args.data_dir)
+    if args.phase == 'check':
+        return check_phase(args.data_dir)
+
+    data_dir = tempfile.mkdtemp(prefix='atm-crash-')
+    for phase in ('write', 'check'):
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--phase', phase, '--data-dir', data_dir])
+        if result.returncode != 0:
+            print(f"HATA: '{data_dir}' klasöründeki günlük yeniden oynatıldığında içe aktarılan satırlar kayboldu." if phase == 'check'
+                  else f"HATA: yazma aşaması {result.returncode} koduyla bitti.")
+            return 1
+    print("Tamam: kazadan önce yazılan bütün satırlar geri geldi.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Compares the memory a cached user takes as a record dict and as a User.
+
+    python tools/memory_benchmark.py --users 100000
+
+Builds --users records the way register_user_web creates them (the opening
+posting applied, a distinct password hash, security question and answer per
+user) and measures with tracemalloc how many bytes each user takes, once as
+the nested dicts the users cache used to hold and once as the __slots__-based
+User/Account objects it holds now. The strings of a record are allocated
+for both layouts, so the difference is the per-object overhead alone.
+"""
+import argparse
+import copy
+import gc
+import secrets
+import sys
+import tempfile
+import tracemalloc
+
+from apploader import load_app
+
+def user_record(app, index):
+    """Returns the user record register_user_web would leave in the cache."""
+    password_hash = f"{app.PASSWORD_HASH_PREFIX}${app.PASSWORD_HASH_ITERATIONS}${secrets.token_hex(16)}${secrets.token_hex(32)}"
+    change = app.new_user_change(password_hash, f"soru {index}", f"cevap {index}")
+    user_data = copy.deepcopy(change["new"])
+    for entry in change["p"]:
+        user_data["accounts"][entry["a"]]["bakiye"] += entry["amt"]
+    return user_data
+
+def bytes_per_user(build, count):
+    """Traced bytes held by count objects from build(index), divided by count."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build(index) for index in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return used / count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    args = parser.parse_args()
+
+    app = load_app(tempfile.mkdtemp(prefix='atm-memory-'))
+    layouts = (
+        ("dict (register_user_web)", lambda index: user_record(app, index)),
+        ("User/Account (__slots__)", lambda index: app.User.from_dict(user_record(app, index)))
+    )
+    results = [(name, bytes_per_user(build, args.users)) for name, build in layouts]
+    for name, per_user in results:
+        print(f"{name:26} {per_user:8.0f} bayt/kullanıcı, {per_user * args.users / 2 ** 20:8.1f} MB / {args.users} kullanıcı")
+    saved = results[0][1] - results[1][1]
+    print(f"Fark: kullanıcı başına {saved:.0f} bayt (%{saved / results[0][1] * 100:.0f}), "
+          f"1.000.000 kullanıcıda {saved * 1000000 / 2 ** 20:.0f} MB")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
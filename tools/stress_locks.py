@@ -0,0 +1,96 @@
+"""Hammers the money-moving operations from many threads and checks that no money is lost.
+
+    python tools/stress_locks.py --threads 64 --users 20 --operations 20000
+
+Runs withdraw_web, deposit_web, internal_transfer_web and external_transfer_web
+concurrently against a fresh data folder. At the end the total balance must
+equal the starting total plus deposits, minus withdrawals and transfer fees.
+"""
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from apploader import load_app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--operations', type=int, default=20000, help="toplam işlem sayısı")
+    parser.add_argument('--storage', default=None, help="json veya sqlite (varsayılan: ATM_STORAGE_BACKEND)")
+    args = parser.parse_args()
+
+    if args.storage:
+        import os
+        os.environ['ATM_STORAGE_BACKEND'] = args.storage
+    app = load_app(tempfile.mkdtemp(prefix='atm-stress-'))
+
+    usernames = [f"stres{i}" for i in range(args.users)]
+    for username in usernames:
+        app.register_user_web(username, 'Parola1', 'soru', 'cevap')
+        # Günlük çekim limiti testi durdurmasın
+        app.commit_changes((username, {"f": {"daily_withdrawal_limit": 1e12}}))
+
+    def total_balance():
+        return sum(account["bakiye"] for username in usernames for account in app.users[username]["accounts"].values())
+
+    starting_total = total_balance()
+    counters = {"deposited": 0.0, "withdrawn": 0.0, "fees": 0.0, "ok": 0, "rejected": 0}
+    counters_lock = threading.Lock()
+    per_thread = args.operations // args.threads
+
+    def worker(seed):
+        rng = random.Random(seed)
+        deposited = withdrawn = fees = 0.0
+        ok = rejected = 0
+        for _ in range(per_thread):
+            username = rng.choice(usernames)
+            account_name = rng.choice(("Vadesiz", "Birikim"))
+            amount = rng.randint(1, 20) * 50.0
+            operation = rng.randrange(4)
+            if operation == 0:
+                success, message = app.deposit_web(username, account_name, amount)
+                deposited += amount if success else 0
+            elif operation == 1:
+                success, message = app.withdraw_web(username, account_name, amount)
+                withdrawn += amount if success else 0
+            elif operation == 2:
+                other = "Birikim" if account_name == "Vadesiz" else "Vadesiz"
+                success, message = app.internal_transfer_web(username, account_name, other, amount)
+            else:
+                recipient = rng.choice([name for name in usernames if name != username])
+                success, message = app.external_transfer_web(username, account_name, recipient, rng.choice(("Vadesiz", "Birikim")), amount)
+                fees += app.HAVALE_UCRETI if success else 0
+            ok += success
+            rejected += not success
+        with counters_lock:
+            counters["deposited"] += deposited
+            counters["withdrawn"] += withdrawn
+            counters["fees"] += fees
+            counters["ok"] += ok
+            counters["rejected"] += rejected
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    expected = starting_total + counters["deposited"] - counters["withdrawn"] - counters["fees"]
+    actual = total_balance()
+    print(f"{args.threads} iş parçacığı, {counters['ok']} başarılı / {counters['rejected']} reddedilen işlem, {elapsed:.2f} sn ({(counters['ok'] + counters['rejected']) / elapsed:.0f} işlem/sn)")
+    print(f"Beklenen toplam bakiye: {expected:.2f} TL, gerçekleşen: {actual:.2f} TL")
+    negative = [(username, name) for username in usernames for name, account in app.users[username]["accounts"].items() if account["bakiye"] < -1e-6]
+    if abs(expected - actual) > 0.005 or negative:
+        print(f"HATA: Bakiyeler korunmadı. Eksi bakiyeli hesaplar: {negative}")
+        return 1
+    print("Bakiyeler korundu.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,21 @@
+"""WSGI entry point for serving the ATM app with several worker processes.
+
+    ATM_STORAGE_BACKEND=sqlite ATM_SHARED_STORAGE=1 gunicorn -w 4 -b 0.0.0.0:8000 wsgi:application
+
+Run it from the folder that holds users.db. Each worker imports the app on
+its own and the workers see each other's changes through the shared SQLite
+database, so do not use --preload: connections and background threads must
+be opened after the fork. Without ATM_SHARED_STORAGE=1 use a single worker.
+"""
+import importlib.util
+import os
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app (1).py')
+
+spec = importlib.util.spec_from_file_location('atm_app', APP_PATH)
+atm_app = importlib.util.module_from_spec(spec)
+sys.modules['atm_app'] = atm_app
+spec.loader.exec_module(atm_app)
+
+application = atm_app.create_app()